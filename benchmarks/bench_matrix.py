@@ -0,0 +1,403 @@
+"""
+Benchmark matrix: workloads x tracer configs, repeated, with regression output.
+
+Every (workload, config) pair runs --repeats times as a separate process (no
+cProfile around it). Repeats are interleaved across configs so drift hits all of
+them alike. The plain run (config "baseline") is the reference for overhead.
+
+Reported per pair:
+  - wall time median / q1 / q3 / IQR (seconds)
+  - overhead_pct vs the baseline median
+  - ns_per_event: extra wall time per profiler event (call/return/c_call...), with
+    the event count taken once per workload from an untimed --measure-overhead run
+    so every config divides by the same number
+  - bytes_per_node: trace bytes on disk per recorded node
+  - peak_rss_kb: median max RSS of the traced process (os.wait4; None where missing)
+
+Usage:
+  python benchmarks/bench_matrix.py --repeats 5 -o bench-output/bench_matrix.json
+  python benchmarks/bench_matrix.py --workloads fanout,threads --configs baseline,default,skip_payloads
+  python benchmarks/bench_matrix.py --compare bench-output/bench_v0.1.23.json
+  python benchmarks/bench_matrix.py compare old.json new.json --threshold 10
+
+Compare exits with status 1 when a pair regressed: ns_per_event grew more than
+--threshold percent and the new q1 is above the old q3 (outside the noise).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PYTRACEFLOW = ROOT / "pytraceflow.py"
+WORKLOADS_SCRIPT = ROOT / "benchmarks" / "bench_workloads.py"
+
+WORKLOADS = ("recursion", "fanout", "large_args", "threads", "asyncio", "multiprocessing")
+# tracer flags a workload needs to be traced at all
+WORKLOAD_FLAGS = {
+    "threads": ["--trace-threads"],
+    "multiprocessing": ["--propagate-tasks"],
+}
+
+# None = plain run without the tracer; {dir} is the run directory
+CONFIGS = {
+    "baseline": None,
+    "default": [],
+    "skip_inputs": ["--skip-inputs"],
+    "skip_payloads": ["--skip-inputs", "--skip-outputs"],
+    "memory": ["--with-memory"],
+    "flush_threshold": ["--flush-interval", "0", "--flush-call-threshold", "500"],
+    "flush_every_call": ["--flush-every-call"],
+    "stream_unix": ["--stream", "unix://{dir}/pft.sock"],
+    "stream_shm": ["--stream", "shm://{dir}/rings"],
+}
+# flush_every_call rewrites the whole trace per event; opt in with --configs
+DEFAULT_CONFIGS = tuple(name for name in CONFIGS if name != "flush_every_call")
+
+
+def _stats(samples):
+    ordered = sorted(samples)
+    if len(ordered) >= 2:
+        q1, _, q3 = statistics.quantiles(ordered, n=4, method="inclusive")
+    else:
+        q1 = q3 = ordered[0]
+    return {
+        "median": round(statistics.median(ordered), 6),
+        "q1": round(q1, 6),
+        "q3": round(q3, 6),
+        "iqr": round(q3 - q1, 6),
+        "min": round(ordered[0], 6),
+        "max": round(ordered[-1], 6),
+        "samples": [round(val, 6) for val in ordered],
+    }
+
+
+def _count_nodes(data):
+    nodes = 0
+    stack = list(data) if isinstance(data, list) else [data]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        nodes += 1
+        for stats in (node.get("aggregates") or {}).values():
+            # calls folded into aggregates still happened
+            nodes += stats.get("count", 0)
+        stack.extend(node.get("calls") or [])
+    return nodes
+
+
+def _trace_stats(run_dir):
+    nodes = 0
+    size = 0
+    for path in run_dir.rglob("*.json"):
+        if path.name.endswith((".manifest.json", ".index.json")):
+            continue
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        size += path.stat().st_size
+        # one node per file is the process root itself
+        nodes += max(_count_nodes(data) - 1, 0)
+    return nodes, size
+
+
+def count_events(workload, scale, run_dir):
+    """Hook events of one workload, summed over its processes (untimed run)."""
+    run_dir.mkdir(parents=True, exist_ok=True)
+    cmd = [
+        sys.executable, str(PYTRACEFLOW), "-s", str(WORKLOADS_SCRIPT),
+        "-o", str(run_dir / "trace.json"), "--skip-inputs", "--skip-outputs",
+        "--measure-overhead", "--overhead-sample", "1000000000",
+        *WORKLOAD_FLAGS.get(workload, []), "--", "--workload", workload, "--scale", str(scale),
+    ]
+    subprocess.run(cmd, cwd=ROOT, env=_clean_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    events = 0
+    for path in run_dir.glob("*.json"):
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        if isinstance(data, list) and data and isinstance(data[0], dict):
+            events += (data[0].get("overhead") or {}).get("events") or 0
+    return events or None
+
+
+def _clean_env():
+    env = {key: val for key, val in os.environ.items() if not key.startswith("PYTRACEFLOW_")}
+    env["PYTHONHASHSEED"] = "0"
+    return env
+
+
+def _wait(proc):
+    """Wait for a child and return its max RSS in KiB when the platform reports it."""
+    if not hasattr(os, "wait4"):
+        proc.wait()
+        return None
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    rss = usage.ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def _start_collector(spec, run_dir, env):
+    cmd = [
+        sys.executable, str(PYTRACEFLOW), "collect", "--listen", spec,
+        "-o", str(run_dir / "collected"), "--write-interval", "0.2", "--exit-after-idle", "0.3",
+    ]
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if spec.startswith("unix://"):
+        sock = Path(spec[len("unix://"):])
+        deadline = time.time() + 10
+        while not sock.exists() and time.time() < deadline:
+            time.sleep(0.02)
+    else:
+        time.sleep(0.3)
+    return proc
+
+
+def run_once(workload, config, scale, run_dir):
+    """One measured run; returns (seconds, peak_rss_kb, returncode)."""
+    run_dir.mkdir(parents=True, exist_ok=True)
+    env = _clean_env()
+    workload_args = ["--workload", workload, "--scale", str(scale)]
+    flags = CONFIGS[config]
+    collector = None
+    if flags is None:
+        cmd = [sys.executable, str(WORKLOADS_SCRIPT), *workload_args]
+    else:
+        flags = [flag.replace("{dir}", str(run_dir)) for flag in flags]
+        if "--stream" in flags:
+            collector = _start_collector(flags[flags.index("--stream") + 1], run_dir, env)
+        cmd = [
+            sys.executable, str(PYTRACEFLOW), "-s", str(WORKLOADS_SCRIPT),
+            "-o", str(run_dir / "trace.json"),
+            *WORKLOAD_FLAGS.get(workload, []), *flags, "--", *workload_args,
+        ]
+    with open(run_dir / "stderr.log", "wb") as err:
+        started = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=err)
+        rss_kb = _wait(proc)
+        elapsed = time.perf_counter() - started
+    if collector is not None:
+        try:
+            collector.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            collector.kill()
+            collector.wait()
+    return elapsed, rss_kb, proc.returncode
+
+
+def _repo_version():
+    match = re.search(r'^version\s*=\s*"([^"]+)"', (ROOT / "pyproject.toml").read_text(), re.M)
+    return match.group(1) if match else None
+
+
+def _git_rev():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_matrix(workloads, configs, repeats, warmup, scale, work_dir, keep_traces=False):
+    results = []
+    for workload in workloads:
+        samples = {config: [] for config in configs}
+        rss = {config: [] for config in configs}
+        nodes = {config: [] for config in configs}
+        sizes = {config: [] for config in configs}
+        failures = {config: 0 for config in configs}
+        events_dir = work_dir / workload / "_events"
+        events = count_events(workload, scale, events_dir)
+        shutil.rmtree(events_dir, ignore_errors=True)
+        for rep in range(warmup + repeats):
+            for config in configs:
+                run_dir = work_dir / workload / config / f"r{rep}"
+                shutil.rmtree(run_dir, ignore_errors=True)
+                elapsed, rss_kb, code = run_once(workload, config, scale, run_dir)
+                measured = rep >= warmup
+                if code != 0:
+                    failures[config] += 1
+                    sys.stderr.write(
+                        f"[bench] {workload}/{config} r{rep} exited with {code} (see {run_dir / 'stderr.log'})\n"
+                    )
+                elif measured:
+                    samples[config].append(elapsed)
+                    if rss_kb is not None:
+                        rss[config].append(rss_kb)
+                    if CONFIGS[config] is not None:
+                        count, size = _trace_stats(run_dir)
+                        nodes[config].append(count)
+                        sizes[config].append(size)
+                if not keep_traces:
+                    shutil.rmtree(run_dir, ignore_errors=True)
+                sys.stderr.write(
+                    f"[bench] {workload}/{config} {'r' if measured else 'warmup '}{rep}: {elapsed:.3f}s\n"
+                )
+        base = samples.get("baseline")
+        base_median = statistics.median(base) if base else None
+        for config in configs:
+            if not samples[config]:
+                results.append({"workload": workload, "config": config, "failures": failures[config]})
+                continue
+            wall = _stats(samples[config])
+            node_count = int(statistics.median(nodes[config])) if nodes[config] else None
+            trace_bytes = int(statistics.median(sizes[config])) if sizes[config] else None
+            entry = {
+                "workload": workload,
+                "config": config,
+                "flags": CONFIGS[config],
+                "wall_s": wall,
+                "overhead_pct": None,
+                "events": events,
+                "nodes": node_count,
+                "trace_bytes": trace_bytes,
+                "ns_per_event": None,
+                "bytes_per_node": round(trace_bytes / node_count, 1) if node_count else None,
+                "peak_rss_kb": int(statistics.median(rss[config])) if rss[config] else None,
+                "failures": failures[config],
+            }
+            if base_median and config != "baseline":
+                extra = wall["median"] - base_median
+                entry["overhead_pct"] = round(extra / base_median * 100, 2)
+                if events:
+                    entry["ns_per_event"] = round(extra * 1e9 / events, 1)
+            results.append(entry)
+    return results
+
+
+def print_table(results, out=sys.stdout):
+    header = f"{'workload':<16}{'config':<18}{'median_s':>10}{'iqr_s':>9}{'ovh%':>9}{'ns/ev':>10}{'B/node':>9}{'rss_MiB':>9}"
+    out.write(header + "\n")
+    for res in results:
+        wall = res.get("wall_s")
+        if wall is None:
+            out.write(f"{res['workload']:<16}{res['config']:<18}{'failed':>10}\n")
+            continue
+
+        def fmt(val, spec):
+            return format(val, spec) if val is not None else "-"
+
+        rss = res["peak_rss_kb"] / 1024 if res.get("peak_rss_kb") else None
+        out.write(
+            f"{res['workload']:<16}{res['config']:<18}{wall['median']:>10.3f}{wall['iqr']:>9.3f}"
+            f"{fmt(res['overhead_pct'], '.1f'):>9}{fmt(res['ns_per_event'], '.0f'):>10}"
+            f"{fmt(res['bytes_per_node'], '.0f'):>9}{fmt(rss, '.1f'):>9}\n"
+        )
+
+
+def compare(old, new, threshold=10.0, out=sys.stdout):
+    """Print per-pair deltas between two result files; return the regressed pairs."""
+    old_by_key = {(res["workload"], res["config"]): res for res in old.get("results", [])}
+    regressions = []
+    out.write(f"{'workload':<16}{'config':<18}{'old ns/ev':>11}{'new ns/ev':>11}{'delta%':>9}  status\n")
+    for res in new.get("results", []):
+        key = (res["workload"], res["config"])
+        prev = old_by_key.get(key)
+        if prev is None or res.get("ns_per_event") is None or not prev.get("ns_per_event"):
+            continue
+        delta = (res["ns_per_event"] - prev["ns_per_event"]) / prev["ns_per_event"] * 100
+        beyond_noise = res["wall_s"]["q1"] > prev["wall_s"]["q3"]
+        status = "ok"
+        if delta > threshold and beyond_noise:
+            status = "REGRESSION"
+            regressions.append({"workload": key[0], "config": key[1], "delta_pct": round(delta, 1)})
+        elif delta < -threshold and res["wall_s"]["q3"] < prev["wall_s"]["q1"]:
+            status = "improved"
+        out.write(
+            f"{key[0]:<16}{key[1]:<18}{prev['ns_per_event']:>11.0f}{res['ns_per_event']:>11.0f}"
+            f"{delta:>9.1f}  {status}\n"
+        )
+    return regressions
+
+
+def _parse_list(value, allowed, default):
+    if not value:
+        return list(default)
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise SystemExit(f"unknown names: {', '.join(unknown)} (choose from {', '.join(allowed)})")
+    return names
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="PyTraceFlow overhead benchmark matrix")
+    parser.add_argument("--workloads", default="", help=f"Comma list (default: all of {','.join(WORKLOADS)})")
+    parser.add_argument("--configs", default="", help=f"Comma list (default: {','.join(DEFAULT_CONFIGS)})")
+    parser.add_argument("--repeats", type=int, default=5, help="Measured runs per pair (default: 5)")
+    parser.add_argument("--warmup", type=int, default=1, help="Discarded runs per pair (default: 1)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Workload size multiplier")
+    parser.add_argument("-o", "--output", default="bench-output/bench_matrix.json", help="Results JSON path")
+    parser.add_argument("--work-dir", default="bench-output/matrix", help="Scratch directory for run outputs")
+    parser.add_argument("--keep-traces", action="store_true", help="Keep each run's trace files")
+    parser.add_argument("--compare", default=None, help="Previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in %% of ns/event")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "compare":
+        parser = argparse.ArgumentParser(prog="bench_matrix.py compare")
+        parser.add_argument("old")
+        parser.add_argument("new")
+        parser.add_argument("--threshold", type=float, default=10.0)
+        args = parser.parse_args(argv[1:])
+        old = json.loads(Path(args.old).read_text(encoding="utf-8"))
+        new = json.loads(Path(args.new).read_text(encoding="utf-8"))
+        sys.exit(1 if compare(old, new, args.threshold) else 0)
+
+    args = _parse_args(argv)
+    workloads = _parse_list(args.workloads, WORKLOADS, WORKLOADS)
+    configs = _parse_list(args.configs, tuple(CONFIGS), DEFAULT_CONFIGS)
+    if "baseline" not in configs:
+        # overhead and ns/event are relative to the plain run
+        configs.insert(0, "baseline")
+    work_dir = Path(args.work_dir).resolve()
+    results = run_matrix(
+        workloads, configs, max(args.repeats, 1), max(args.warmup, 0), args.scale, work_dir, args.keep_traces
+    )
+    report = {
+        "meta": {
+            "version": _repo_version(),
+            "git": _git_rev(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "repeats": args.repeats,
+            "warmup": args.warmup,
+            "scale": args.scale,
+        },
+        "results": results,
+    }
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print_table(results)
+    print(f"\nresults: {output}")
+    if args.compare:
+        print()
+        old = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if compare(old, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
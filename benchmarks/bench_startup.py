@@ -0,0 +1,159 @@
+"""
+Startup cost of PyTraceFlow: module import time and autotrace overhead per process.
+
+Measures, --repeats times each (medians reported):
+  - `python -X importtime -c "import pytraceflow"`: total import time of the
+    module and the slowest modules it pulls in (self time)
+  - wall time of `python -c pass` plain, under autotrace with a cold prefix cache
+    (fresh PYTRACEFLOW_OUT_DIR) and under autotrace with a warm cache
+  - the modules an autotraced `python -c pass` imports beyond a plain one
+
+Usage:
+  python benchmarks/bench_startup.py -o bench-output/bench_startup.json
+  python benchmarks/bench_startup.py --repeats 30 --top 15
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _env(**extra):
+    env = {key: val for key, val in os.environ.items() if not key.startswith("PYTRACEFLOW_")}
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")]))
+    env.update(extra)
+    return env
+
+
+def _importtime(code, env):
+    """{module: (self_us, cumulative_us)} from one -X importtime run."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], env=env, capture_output=True, text=True
+    )
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            modules[name.strip()] = (int(self_us), int(cumulative_us))
+        except ValueError:
+            # header line
+            continue
+    return modules
+
+
+def _wall(env, repeats):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], env=env, stderr=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def _summary(samples):
+    return {"median_ms": round(statistics.median(samples), 3), "min_ms": round(min(samples), 3)}
+
+
+def measure(repeats, top):
+    env = _env()
+    runs = [_importtime("import pytraceflow", env) for _ in range(repeats)]
+    totals = [run.get("pytraceflow", (0, 0))[1] / 1000 for run in runs]
+    self_times = {}
+    for run in runs:
+        for name, (self_us, _) in run.items():
+            self_times.setdefault(name, []).append(self_us)
+    slowest = sorted(
+        ((name, statistics.median(vals) / 1000) for name, vals in self_times.items()),
+        key=lambda item: item[1],
+        reverse=True,
+    )[:top]
+
+    scratch = Path(tempfile.mkdtemp(prefix="pft-startup-"))
+    try:
+        plain = _wall(env, repeats)
+        cold = []
+        for idx in range(repeats):
+            # a fresh output directory has no prefix cache yet
+            out_dir = scratch / f"cold{idx}"
+            cold.extend(_wall(_env(PYTRACEFLOW_AUTOTRACE="1", PYTRACEFLOW_OUT_DIR=str(out_dir)), 1))
+        warm_env = _env(PYTRACEFLOW_AUTOTRACE="1", PYTRACEFLOW_OUT_DIR=str(scratch / "warm"))
+        _wall(warm_env, 1)
+        warm = _wall(warm_env, repeats)
+        plain_modules = set(_importtime("pass", env))
+        traced_modules = _importtime("pass", warm_env)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    extra = sorted(
+        ((name, cumulative / 1000) for name, (_, cumulative) in traced_modules.items() if name not in plain_modules),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    plain_ms = statistics.median(plain)
+    return {
+        "import": {
+            "pytraceflow_ms": round(statistics.median(totals), 3),
+            "slowest_self_ms": [[name, round(ms, 3)] for name, ms in slowest],
+        },
+        "process": {
+            "plain": _summary(plain),
+            "autotrace_cold": _summary(cold),
+            "autotrace_warm": _summary(warm),
+            "autotrace_cold_overhead_ms": round(statistics.median(cold) - plain_ms, 3),
+            "autotrace_warm_overhead_ms": round(statistics.median(warm) - plain_ms, 3),
+        },
+        "autotrace_extra_imports": [[name, round(ms, 3)] for name, ms in extra[:top]],
+    }
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="PyTraceFlow import/autotrace startup cost")
+    parser.add_argument("--repeats", type=int, default=15)
+    parser.add_argument("--top", type=int, default=10, help="Modules listed in the import breakdowns")
+    parser.add_argument("-o", "--output", default="bench-output/bench_startup.json")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    results = measure(max(args.repeats, 1), args.top)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "repeats": args.repeats,
+        },
+        "results": results,
+    }
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    process = results["process"]
+    print(f"import pytraceflow: {results['import']['pytraceflow_ms']:.1f}ms")
+    print(
+        f"python -c pass: plain {process['plain']['median_ms']:.1f}ms, "
+        f"autotrace cold +{process['autotrace_cold_overhead_ms']:.1f}ms, "
+        f"warm +{process['autotrace_warm_overhead_ms']:.1f}ms"
+    )
+    print("autotrace extra imports (cumulative ms): " + ", ".join(
+        f"{name}={ms:.1f}" for name, ms in results["autotrace_extra_imports"]
+    ))
+    print(f"\nresults: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Viewer and OTLP exporter scalability on synthetic traces (benchmarks/gen_trace.py).
+
+For every --sizes entry a trace is generated, then each stage runs --repeats times
+in its own process so peak RSS belongs to that stage alone:
+  - viewer: load time (JSON parse), render time (_render_html), write time,
+    HTML size and peak RSS of pytraceflow_visual.py
+  - export: spans/sec of export_otlp.emit_tree into an in-memory span exporter
+    (needs opentelemetry-sdk; recorded as skipped otherwise), plus load time and
+    peak RSS
+A stage that fails (RecursionError, MemoryError, --timeout) is recorded with its
+error instead of stopping the run, so the limits show up in the results.
+
+Usage:
+  python benchmarks/bench_viewer.py --sizes 10k,100k,1m -o bench-output/bench_viewer.json
+  python benchmarks/bench_viewer.py --sizes 100k --depth 40 --fanout 2 --payload-bytes 1024 --error-rate 0.05
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from gen_trace import TraceGenerator, parse_count  # noqa: E402
+
+STAGES = ("viewer", "export")
+
+
+def stage_viewer(trace, scratch):
+    import pytraceflow_visual
+
+    started = time.perf_counter()
+    data = pytraceflow_visual._load_trace(Path(trace))
+    loaded = time.perf_counter()
+    html_doc = pytraceflow_visual._render_html(data)
+    rendered = time.perf_counter()
+    out = Path(scratch) / "viewer.html"
+    out.write_text(html_doc, encoding="utf-8")
+    written = time.perf_counter()
+    return {
+        "load_s": loaded - started,
+        "render_s": rendered - loaded,
+        "write_s": written - rendered,
+        "html_bytes": out.stat().st_size,
+    }
+
+
+def stage_export(trace, scratch):
+    try:
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+        from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    except Exception as exc:
+        return {"skipped": f"opentelemetry-sdk not available ({exc})"}
+    import export_otlp
+
+    started = time.perf_counter()
+    root = export_otlp.load_root(Path(trace))
+    loaded = time.perf_counter()
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    tracer = provider.get_tracer("flowtrace.bench")
+    export_otlp.emit_tree(tracer, root)
+    provider.shutdown()
+    exported = time.perf_counter()
+    spans = len(exporter.get_finished_spans())
+    seconds = exported - loaded
+    return {
+        "load_s": loaded - started,
+        "export_s": seconds,
+        "spans": spans,
+        "spans_per_sec": round(spans / seconds, 1) if seconds else None,
+    }
+
+
+def _run_stage_child(stage, trace, scratch):
+    """Entry point of the per-stage child: run it and print one JSON line."""
+    try:
+        result = {"viewer": stage_viewer, "export": stage_export}[stage](trace, scratch)
+    except BaseException as exc:  # RecursionError/MemoryError are results here
+        result = {"error": f"{type(exc).__name__}: {exc}"[:300]}
+    sys.stdout.write(json.dumps(result) + "\n")
+
+
+def _wait(proc, timeout):
+    """Wait with a deadline; returns max RSS in KiB where os.wait4 exists."""
+    deadline = time.time() + timeout
+    if not hasattr(os, "wait4"):
+        proc.wait(timeout=timeout)
+        return None
+    while True:
+        pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            rss = usage.ru_maxrss
+            return rss // 1024 if sys.platform == "darwin" else rss
+        if time.time() > deadline:
+            proc.kill()
+            raise subprocess.TimeoutExpired(proc.args, timeout)
+        time.sleep(0.01)
+
+
+def run_stage(stage, trace, scratch, timeout):
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--stage", stage, "--trace", str(trace), "--scratch", str(scratch)]
+    # output goes to files: a pipe fills at ~64KB (a deep traceback on stderr) and
+    # the child would block before _wait() reaps it
+    with tempfile.TemporaryFile() as out_file, tempfile.TemporaryFile() as err_file:
+        proc = subprocess.Popen(cmd, stdout=out_file, stderr=err_file)
+        try:
+            rss_kb = _wait(proc, timeout)
+        except subprocess.TimeoutExpired:
+            proc.wait()
+            return {"error": f"timeout after {timeout}s"}
+        out_file.seek(0)
+        err_file.seek(0)
+        out = out_file.read().decode("utf-8", "replace").strip().splitlines()
+        err = err_file.read().decode("utf-8", "replace").strip()
+    try:
+        result = json.loads(out[-1])
+    except (IndexError, ValueError):
+        result = {"error": f"exit {proc.returncode}: {err[-300:]}"}
+    result["peak_rss_kb"] = rss_kb
+    return result
+
+
+def _summarize(runs):
+    """Median of every numeric field across repeats; first error/skip wins."""
+    for run in runs:
+        if "error" in run or "skipped" in run:
+            return run
+    summary = {}
+    for key in runs[0]:
+        values = [run[key] for run in runs if isinstance(run.get(key), (int, float))]
+        if values:
+            median = statistics.median(values)
+            summary[key] = round(median, 4) if isinstance(median, float) else median
+    summary["repeats"] = len(runs)
+    return summary
+
+
+def run_bench(sizes, depth, fanout, payload_bytes, error_rate, repeats, stages, work_dir, timeout, keep):
+    results = []
+    work_dir.mkdir(parents=True, exist_ok=True)
+    for size in sizes:
+        trace = work_dir / f"synth_{size}.json"
+        gen = TraceGenerator(size, depth, fanout, payload_bytes, error_rate)
+        started = time.perf_counter()
+        nodes = gen.write(trace)
+        entry = {
+            "nodes": nodes,
+            "depth": depth,
+            "fanout": fanout,
+            "payload_bytes": payload_bytes,
+            "error_rate": error_rate,
+            "errors": gen.errors,
+            "trace_bytes": trace.stat().st_size,
+            "generate_s": round(time.perf_counter() - started, 3),
+        }
+        for stage in stages:
+            runs = []
+            for rep in range(repeats):
+                result = run_stage(stage, trace, work_dir, timeout)
+                runs.append(result)
+                sys.stderr.write(f"[bench-viewer] {nodes} nodes {stage} r{rep}: {json.dumps(result)}\n")
+                if "error" in result or "skipped" in result:
+                    break
+            summary = _summarize(runs)
+            if stage == "viewer" and summary.get("render_s"):
+                summary["nodes_per_sec"] = round(nodes / (summary["load_s"] + summary["render_s"]), 1)
+            entry[stage] = summary
+        results.append(entry)
+        if not keep:
+            trace.unlink()
+            (work_dir / "viewer.html").unlink(missing_ok=True)
+    return results
+
+
+def print_table(results, out=sys.stdout):
+    out.write(
+        f"{'nodes':>10}{'trace_MB':>10}{'load_s':>9}{'render_s':>10}{'html_MB':>9}"
+        f"{'view_MiB':>10}{'spans/s':>10}{'exp_MiB':>9}\n"
+    )
+    for res in results:
+        viewer = res.get("viewer", {})
+        export = res.get("export", {})
+
+        def num(val, spec, scale=1.0):
+            return format(val / scale, spec) if isinstance(val, (int, float)) else "-"
+
+        out.write(
+            f"{res['nodes']:>10}{num(res['trace_bytes'], '.1f', 1e6):>10}"
+            f"{num(viewer.get('load_s'), '.2f'):>9}{num(viewer.get('render_s'), '.2f'):>10}"
+            f"{num(viewer.get('html_bytes'), '.1f', 1e6):>9}{num(viewer.get('peak_rss_kb'), '.0f', 1024):>10}"
+            f"{num(export.get('spans_per_sec'), '.0f'):>10}{num(export.get('peak_rss_kb'), '.0f', 1024):>9}\n"
+        )
+        for stage in STAGES:
+            info = res.get(stage, {})
+            if "error" in info or "skipped" in info:
+                out.write(f"{'':>10}  {stage}: {info.get('error') or info.get('skipped')}\n")
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Viewer/exporter scalability on synthetic traces")
+    parser.add_argument("--sizes", default="10k,100k,1m", help="Comma list of node counts (k/m suffixes)")
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--payload-bytes", type=int, default=64)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--stages", default=",".join(STAGES), help="Comma list of stages (viewer,export)")
+    parser.add_argument("--timeout", type=float, default=900, help="Seconds before a stage run is killed")
+    parser.add_argument("-o", "--output", default="bench-output/bench_viewer.json")
+    parser.add_argument("--work-dir", default="bench-output/viewer-bench", help="Scratch directory")
+    parser.add_argument("--keep", action="store_true", help="Keep generated traces and HTML")
+    # internal: per-stage child
+    parser.add_argument("--stage", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--trace", help=argparse.SUPPRESS)
+    parser.add_argument("--scratch", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    if args.stage:
+        _run_stage_child(args.stage, args.trace, args.scratch)
+        return
+    sizes = [parse_count(size) for size in args.sizes.split(",") if size.strip()]
+    stages = [stage for stage in args.stages.split(",") if stage in STAGES]
+    results = run_bench(
+        sizes, args.depth, args.fanout, args.payload_bytes, args.error_rate,
+        max(args.repeats, 1), stages, Path(args.work_dir).resolve(), args.timeout, args.keep,
+    )
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "repeats": args.repeats,
+        },
+        "results": results,
+    }
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print_table(results)
+    print(f"\nresults: {output}")
+
+
+if __name__ == "__main__":
+    main()
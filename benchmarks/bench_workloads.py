@@ -0,0 +1,152 @@
+"""
+Workloads for the benchmark matrix (benchmarks/bench_matrix.py).
+
+Each workload is deterministic for a given --scale and stays inside this file, so
+every call is traced the same way under every tracer config. asyncio and
+multiprocessing are imported by their own workloads only, so the other
+workloads don't pay for tracing those imports.
+
+Usage:
+  python benchmarks/bench_workloads.py --workload fanout --scale 1
+  python pytraceflow.py -s benchmarks/bench_workloads.py -o bench-output/w.json -- --workload threads
+"""
+
+from __future__ import annotations
+
+import argparse
+import math
+import sys
+import threading
+
+
+def leaf(n: int) -> float:
+    acc = 0.0
+    for i in range(n):
+        acc += math.sqrt(i + 1.0)
+    return acc
+
+
+def recurse(depth: int, work: int) -> float:
+    """Deep recursion: one long spine of nested calls."""
+    if depth <= 0:
+        return leaf(work)
+    return recurse(depth - 1, work) + 1.0
+
+
+def deep_recursion(scale: float) -> float:
+    total = 0.0
+    for _ in range(max(int(40 * scale), 1)):
+        total += recurse(400, 5)
+    return total
+
+
+def fan(depth: int, breadth: int, work: int) -> float:
+    """Wide fanout, same shape as trace_stress.fanout."""
+    if depth <= 0:
+        return leaf(work)
+    total = 0.0
+    for _ in range(breadth):
+        total += fan(depth - 1, breadth, work)
+    return total
+
+
+def wide_fanout(scale: float) -> float:
+    total = 0.0
+    for _ in range(max(int(60 * scale), 1)):
+        total += fan(4, 4, 10)
+    return total
+
+
+def consume(rows: list, table: dict, blob: str) -> int:
+    return len(rows) + len(table) + len(blob)
+
+
+def large_args(scale: float) -> int:
+    """Calls whose arguments and results are big enough to make capture expensive."""
+    rows = [{"id": i, "name": f"row-{i}", "tags": ["a", "b", "c"]} for i in range(200)]
+    table = {f"key{i}": list(range(20)) for i in range(100)}
+    blob = "x" * 20_000
+    total = 0
+    for _ in range(max(int(300 * scale), 1)):
+        total += consume(rows, table, blob)
+    return total
+
+
+def thread_worker(index: int, calls: int) -> float:
+    total = 0.0
+    for i in range(calls):
+        total += leaf(20 + index % 3)
+    return total
+
+
+def many_threads(scale: float) -> int:
+    threads = [
+        threading.Thread(target=thread_worker, args=(i, max(int(200 * scale), 1)))
+        for i in range(16)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(threads)
+
+
+async def handle(request_id: int, work: int) -> float:
+    import asyncio
+
+    await asyncio.sleep(0)
+    return leaf(work) + request_id
+
+
+async def serve(requests: int) -> float:
+    import asyncio
+
+    results = await asyncio.gather(*(handle(i, 15) for i in range(requests)))
+    return sum(results)
+
+
+def asyncio_tasks(scale: float) -> float:
+    import asyncio
+
+    total = 0.0
+    for _ in range(max(int(10 * scale), 1)):
+        total += asyncio.run(serve(200))
+    return total
+
+
+def pool_task(chunk: int) -> float:
+    total = 0.0
+    for i in range(chunk):
+        total += leaf(30)
+    return total
+
+
+def multiprocessing_pool(scale: float) -> float:
+    from multiprocessing import Pool
+
+    with Pool(processes=4) as pool:
+        return sum(pool.map(pool_task, [max(int(500 * scale), 1)] * 8))
+
+
+WORKLOADS = {
+    "recursion": deep_recursion,
+    "fanout": wide_fanout,
+    "large_args": large_args,
+    "threads": many_threads,
+    "asyncio": asyncio_tasks,
+    "multiprocessing": multiprocessing_pool,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Workloads for the PyTraceFlow benchmark matrix")
+    parser.add_argument("--workload", choices=sorted(WORKLOADS), required=True)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for the amount of work")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 2000))
+    result = WORKLOADS[args.workload](args.scale)
+    print(f"{args.workload} result={result}")
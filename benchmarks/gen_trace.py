@@ -0,0 +1,139 @@
+"""
+Synthetic PyTraceFlow traces of any size, for viewer/exporter scalability tests.
+
+The trace is streamed to disk node by node, so a 10M-node file never has to fit
+in memory. Shape: top-level calls under one process root, each a complete
+--fanout tree of --depth levels, repeated until --nodes is reached. Node layout
+matches what pytraceflow.py writes (ids, caller, inputs/output, error,
+duration_ms with children summing below their parent).
+
+Usage:
+  python benchmarks/gen_trace.py --nodes 1m --depth 6 --fanout 8 -o bench-output/synth_1m.json
+  python benchmarks/gen_trace.py --nodes 100k --payload-bytes 512 --error-rate 0.01 -o bench-output/synth.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import string
+import sys
+from pathlib import Path
+
+_MODULES = ("app.api", "app.db", "app.cache", "app.models", "app.jobs", "app.utils")
+_NAMES = ("handle", "load", "save", "render", "validate", "fetch", "compute", "parse", "emit", "lookup")
+
+
+def parse_count(value):
+    """'250k' / '1m' / '1500' -> int."""
+    value = str(value).strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000, "g": 1_000_000_000}.get(value[-1:], 1)
+    if scale != 1:
+        value = value[:-1]
+    return int(float(value) * scale)
+
+
+class TraceGenerator:
+    def __init__(self, nodes, depth=6, fanout=8, payload_bytes=64, error_rate=0.0, seed=42):
+        self.nodes = max(int(nodes), 1)
+        self.depth = max(int(depth), 1)
+        self.fanout = max(int(fanout), 1)
+        self.payload_bytes = max(int(payload_bytes), 0)
+        self.error_rate = float(error_rate)
+        self.rng = random.Random(seed)
+        self._next_id = 1
+        self.errors = 0
+        # payload strings are drawn from a fixed pool to keep generation cheap
+        alphabet = string.ascii_letters + string.digits
+        self._payloads = [
+            "".join(self.rng.choice(alphabet) for _ in range(self.payload_bytes)) for _ in range(64)
+        ]
+        self._names = [(mod, name) for mod in _MODULES for name in _NAMES]
+
+    @property
+    def generated(self):
+        return self._next_id - 1
+
+    def _node(self, out, caller, depth):
+        """Write one node and its subtree; return its duration in ms."""
+        node_id = self._next_id
+        self._next_id += 1
+        module, name = self._names[self.rng.randrange(len(self._names))]
+        head = {
+            "id": node_id,
+            "callable": name,
+            "module": module,
+            "called": name,
+            "caller": caller,
+            "instance_id": None,
+            "inputs": {"n": node_id, "data": self._payloads[node_id % 64]} if self.payload_bytes else {},
+        }
+        out.write(json.dumps(head, separators=(",", ":"))[:-1] + ',"calls":[')
+        total = 0.0
+        if depth > 1:
+            label = f"{name}::{name}"
+            for idx in range(self.fanout):
+                if self.generated >= self.nodes:
+                    break
+                if idx:
+                    out.write(",")
+                total += self._node(out, label, depth - 1)
+        duration = round(total + self.rng.expovariate(10.0), 3)
+        failed = self.error_rate > 0 and self.rng.random() < self.error_rate
+        if failed:
+            self.errors += 1
+        tail = {
+            "inputs_after": head["inputs"],
+            "output": None if failed else (self._payloads[(node_id + 7) % 64] if self.payload_bytes else node_id),
+            "error": "ValueError('synthetic failure')" if failed else None,
+            "duration_ms": duration,
+        }
+        out.write("]," + json.dumps(tail, separators=(",", ":"))[1:])
+        return duration
+
+    def write(self, path):
+        path = Path(path)
+        # one Python frame per level (plus json.dumps below it)
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), self.depth * 2 + 200))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as out:
+            out.write(
+                '[{"id":0,"callable":"synthetic.py","module":"__main__","called":"synthetic.py",'
+                '"inputs":{},"pid":1,"ppid":0,"calls":['
+            )
+            total = 0.0
+            first = True
+            while self.generated < self.nodes:
+                if not first:
+                    out.write(",")
+                first = False
+                total += self._node(out, None, self.depth)
+            out.write(f'],"output":null,"error":null,"duration_ms":{round(total, 3)}}}]')
+        return self.generated
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic PyTraceFlow trace")
+    parser.add_argument("--nodes", default="100k", help="Call nodes to generate (accepts k/m suffixes)")
+    parser.add_argument("--depth", type=int, default=6, help="Levels per top-level call tree")
+    parser.add_argument("--fanout", type=int, default=8, help="Children per non-leaf node")
+    parser.add_argument("--payload-bytes", type=int, default=64, help="Size of each input/output string")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of nodes that carry an error")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-o", "--output", default="bench-output/synth.json")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    gen = TraceGenerator(
+        parse_count(args.nodes), args.depth, args.fanout, args.payload_bytes, args.error_rate, args.seed
+    )
+    count = gen.write(args.output)
+    size = Path(args.output).stat().st_size
+    print(f"[gen-trace] {count} nodes ({gen.errors} errors) -> {args.output} ({size} bytes)")
+
+
+if __name__ == "__main__":
+    main()
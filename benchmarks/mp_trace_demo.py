@@ -4,6 +4,9 @@ Multiprocessing demo showing how to trace child processes with PyTraceFlow.
 Modes:
 - Default: run workers directly via multiprocessing.Pool (no child traces).
 - --trace-children: launch each worker under pytraceflow.py, writing one JSON per child.
+- --plain-children: launch each worker as a plain `python mp_worker.py`; run the demo
+  under `pytraceflow.py --trace-subprocesses` (or autotrace) and the children are
+  traced and linked to the launching call without building pytraceflow command lines.
 """
 
 from __future__ import annotations
@@ -66,6 +69,13 @@ def run_traced_children(jobs: int, iterations: int, output_dir: Path) -> None:
     print(f"[demo] traced workers done. JSONs in {output_dir}")
 
 
+def run_plain_children(jobs: int, iterations: int) -> None:
+    for idx in range(jobs):
+        cmd = [sys.executable, str(WORKER), "--iterations", str(iterations)]
+        completed = subprocess.run(cmd, capture_output=True, text=True)
+        print(f"[demo] plain worker {idx} rc={completed.returncode} {completed.stdout.strip()}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Multiprocessing + PyTraceFlow demo")
     parser.add_argument("--jobs", type=int, default=4, help="Number of workers")
@@ -86,6 +96,11 @@ def main():
         action="store_true",
         help="Run each worker under pytraceflow, one JSON per child",
     )
+    parser.add_argument(
+        "--plain-children",
+        action="store_true",
+        help="Run each worker as a plain subprocess (traced via --trace-subprocesses/autotrace)",
+    )
     parser.add_argument(
         "--output-dir",
         default="bench-output/mp",
@@ -136,6 +151,8 @@ def main():
             from mp_nested_worker import main as nested_main  # type: ignore
 
             nested_main(args.jobs, args.inner_jobs, args.iterations)
+    elif args.plain_children:
+        run_plain_children(args.jobs, args.iterations)
     else:
         if args.trace_children:
             run_traced_children(args.jobs, args.iterations, Path(args.output_dir))
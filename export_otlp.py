@@ -4,6 +4,8 @@ import sys
 from pathlib import Path
 from typing import Any
 
+from pytraceflow_shapes import expand_node
+
 
 def parse_headers(values: list[str]) -> dict[str, str]:
     headers: dict[str, str] = {}
@@ -24,10 +26,15 @@ def load_root(path: Path) -> dict[str, Any]:
     return data[0]
 
 
-def emit_tree(tracer, node: dict[str, Any], parent_ctx=None) -> None:
+def emit_tree(tracer, node: dict[str, Any], parent_ctx=None, shapes=None) -> None:
     from opentelemetry import trace
     from opentelemetry.trace import Status, StatusCode
 
+    shapes = node.get("shapes", shapes)
+    if shapes and node.get("shape") in shapes:
+        # folded subtree (pytraceflow dedup): expanded only when it is exported
+        node = expand_node(node, shapes)
+
     callable_name = node.get("callable")
     called_name = node.get("called")
 
@@ -48,6 +55,10 @@ def emit_tree(tracer, node: dict[str, Any], parent_ctx=None) -> None:
             span.set_attribute("flowtrace.duration_ms", node.get("duration_ms"))
         if node.get("instance_id") is not None:
             span.set_attribute("flowtrace.instance_id", node.get("instance_id"))
+        if node.get("run"):
+            # --fold-runs: one span stands for `count` identical calls
+            span.set_attribute("flowtrace.run_count", node["run"].get("count", 1))
+            span.set_attribute("flowtrace.run_mean_ms", node["run"].get("mean_ms"))
         if node.get("inputs"):
             span.set_attribute("flowtrace.inputs_present", True)
         if node.get("error"):
@@ -55,7 +66,7 @@ def emit_tree(tracer, node: dict[str, Any], parent_ctx=None) -> None:
             span.set_status(Status(StatusCode.ERROR))
         child_ctx = trace.set_span_in_context(span)
         for child in node.get("calls", []):
-            emit_tree(tracer, child, child_ctx)
+            emit_tree(tracer, child, child_ctx, shapes)
 
 
 def export_otlp(json_path: Path, endpoint: str, service_name: str | None, headers: dict[str, str]) -> None:
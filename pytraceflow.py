@@ -1,15 +1,735 @@
-import argparse
-import inspect
+import itertools
 import json
+import re
 import threading
-import runpy
 import sys
 import time
-import sysconfig
-import tracemalloc
 import os
 from pathlib import Path
 
+from pytraceflow_shapes import _PLAIN_KEYS
+
+# argparse, runpy, sysconfig and tracemalloc are imported where they are used:
+# every autotraced process imports this module, so its import cost is paid per process.
+
+
+# Degradation levels applied when a --max-nodes/--max-bytes budget is configured
+DEGRADE_MODES = ("full", "no_payloads", "aggregate", "spine")
+# Fraction of the budget at which each next level kicks in
+_DEGRADE_FRACTIONS = (0.6, 0.8, 1.0)
+# Bytes per node assumed before the first snapshot gives a real measurement
+_DEFAULT_NODE_BYTES = 400
+
+# Hook stages timed by --measure-overhead (report order); the rest of the hook is "other"
+OVERHEAD_STAGES = ("filter", "inputs", "outputs", "memory", "flush_check")
+_OVERHEAD_STAGE_METHODS = (
+    ("filter", "_should_trace"),
+    ("inputs", "_capture_inputs"),
+    ("outputs", "_serialize"),
+    ("memory", "_memory_snapshot"),
+    ("flush_check", "_maybe_flush"),
+)
+# Detail shed in this order by the --max-overhead-pct governor (reverse order on recovery)
+GOVERNOR_MODES = ("full", "no_memory", "no_payloads", "aggregate")
+# Step back up once the window overhead stays below this fraction of the cap...
+_GOVERNOR_RECOVER_FRACTION = 0.5
+# ...for this many consecutive windows
+_GOVERNOR_RECOVER_WINDOWS = 3
+# weight of the newest window in the smoothed per-event cost; the first sampled
+# window (imports, cold caches) is discarded and never acted on
+_GOVERNOR_SMOOTHING = 0.5
+# readings are clamped here: past 10x the application's time the exact figure
+# says nothing more, and the 1% floor on app time would report up to 9900%
+_GOVERNOR_MAX_PCT = 1000.0
+
+# Stacks rooted at these nodes are units of work themselves for tail sampling;
+# under the process/thread roots every top-level call is one
+_TAIL_SELF_UNITS = ("__task__", "__scope__", "__request__")
+
+# --fold-runs: only plain finished calls (no task/thread/scope/trigger/deadline tags) join
+# a run; the same rule --dedup-shapes uses to pick foldable subtrees
+_RUN_KEYS = _PLAIN_KEYS
+
+# code flags read by _capture_inputs (same values as inspect.CO_VARARGS/CO_VARKEYWORDS)
+_CO_VARARGS = 0x04
+_CO_VARKEYWORDS = 0x08
+
+# Profiler currently capturing in this process (used by the fork handlers)
+_active_profiler = None
+_fork_hooks_installed = False
+
+
+def _before_fork():
+    if _active_profiler is not None:
+        _active_profiler._prepare_fork()
+
+
+def _after_fork_in_child():
+    if _active_profiler is not None:
+        _active_profiler._reset_after_fork()
+
+
+def _install_fork_hooks():
+    global _fork_hooks_installed
+    if _fork_hooks_installed or not hasattr(os, "register_at_fork"):
+        return
+    os.register_at_fork(before=_before_fork, after_in_child=_after_fork_in_child)
+    _fork_hooks_installed = True
+
+
+class _TracedTask:
+    """Picklable wrapper that carries the submitting call into a worker process."""
+
+    # pickle by the importable module name even when pytraceflow.py runs as __main__
+    __module__ = "pytraceflow"
+    __slots__ = ("func", "parent_pid", "parent_call_id", "submitted")
+
+    def __init__(self, func, parent_pid, parent_call_id, submitted):
+        self.func = func
+        self.parent_pid = parent_pid
+        self.parent_call_id = parent_call_id
+        self.submitted = submitted
+
+    def __call__(self, *args, **kwargs):
+        profiler = _active_profiler
+        if profiler is None:
+            return self.func(*args, **kwargs)
+        return profiler._run_task(self, args, kwargs)
+
+
+# patches for modules that are not imported yet: name -> [patch(module)], applied on import
+_import_patches = {}
+_import_hook = None
+
+
+class _PatchingLoader:
+    """Loader proxy that applies the pending patches once the module has executed."""
+
+    def __init__(self, loader, name):
+        self._loader = loader
+        self._name = name
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._loader.exec_module(module)
+        for patch in _import_patches.pop(self._name, ()):
+            patch(module)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _PostImportHook:
+    """sys.meta_path finder that defers patching pool/subprocess modules until their import."""
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname not in _import_patches:
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _PatchingLoader(spec.loader, fullname)
+                return spec
+        return None
+
+
+def _when_imported(name, patch):
+    """Run patch(module) now if the module is loaded, otherwise right after it is imported."""
+    global _import_hook
+    module = sys.modules.get(name)
+    if module is not None:
+        patch(module)
+        return
+    _import_patches.setdefault(name, []).append(patch)
+    if _import_hook is None:
+        _import_hook = _PostImportHook()
+        sys.meta_path.insert(0, _import_hook)
+
+
+_task_propagation_installed = False
+
+
+def _wrap_task(func):
+    profiler = _active_profiler
+    if profiler is None or isinstance(func, _TracedTask):
+        return func
+    parent = profiler._current_entry()
+    return _TracedTask(
+        func, os.getpid(), parent.get("id") if parent else None, time.time()
+    )
+
+
+def _install_task_propagation():
+    """Wrap functions submitted to process pools so workers can link their tasks."""
+    global _task_propagation_installed
+    if _task_propagation_installed:
+        return
+    _task_propagation_installed = True
+    _when_imported("multiprocessing.pool", _patch_mp_pool)
+    _when_imported("concurrent.futures.process", _patch_process_executor)
+
+
+def _patch_mp_pool(mp_pool):
+    pool_cls = mp_pool.Pool
+    orig_apply_async = pool_cls.apply_async
+    orig_map_async = pool_cls._map_async
+    orig_imap = pool_cls.imap
+    orig_imap_unordered = pool_cls.imap_unordered
+
+    def apply_async(self, func, *args, **kwargs):
+        return orig_apply_async(self, _wrap_task(func), *args, **kwargs)
+
+    def _map_async(self, func, *args, **kwargs):
+        return orig_map_async(self, _wrap_task(func), *args, **kwargs)
+
+    def imap(self, func, *args, **kwargs):
+        return orig_imap(self, _wrap_task(func), *args, **kwargs)
+
+    def imap_unordered(self, func, *args, **kwargs):
+        return orig_imap_unordered(self, _wrap_task(func), *args, **kwargs)
+
+    pool_cls.apply_async = apply_async
+    pool_cls._map_async = _map_async
+    pool_cls.imap = imap
+    pool_cls.imap_unordered = imap_unordered
+
+
+def _patch_process_executor(cf_process):
+    orig_submit = cf_process.ProcessPoolExecutor.submit
+    orig_map = cf_process.ProcessPoolExecutor.map
+
+    def submit(self, fn, /, *args, **kwargs):
+        # map() submits partial(_process_chunk, fn); the inner fn is already wrapped
+        if getattr(fn, "func", None) is not cf_process._process_chunk:
+            fn = _wrap_task(fn)
+        return orig_submit(self, fn, *args, **kwargs)
+
+    def executor_map(self, fn, *iterables, **kwargs):
+        return orig_map(self, _wrap_task(fn), *iterables, **kwargs)
+
+    cf_process.ProcessPoolExecutor.submit = submit
+    cf_process.ProcessPoolExecutor.map = executor_map
+
+
+class _ThreadTask:
+    """Executor work item remembering the call that submitted it."""
+
+    __slots__ = ("func", "parent", "submitted")
+
+    def __init__(self, func, parent, submitted):
+        self.func = func
+        self.parent = parent
+        self.submitted = submitted
+
+    def __call__(self, *args, **kwargs):
+        profiler = _active_profiler
+        if profiler is None or not profiler._threads_active:
+            return self.func(*args, **kwargs)
+        return profiler._run_thread_task(self, args, kwargs)
+
+
+_thread_linkage_installed = False
+
+
+def _install_thread_linkage():
+    """Record the submitting call for ThreadPoolExecutor work and Thread.start()."""
+    global _thread_linkage_installed
+    if _thread_linkage_installed:
+        return
+    _thread_linkage_installed = True
+    _when_imported("concurrent.futures.thread", _patch_thread_executor)
+    orig_start = threading.Thread.start
+
+    def start(self):
+        profiler = _active_profiler
+        if profiler is not None and profiler._threads_active:
+            self._pft_link = (profiler._current_entry(), time.time())
+            run = self.run
+
+            def _run():
+                self._pft_run_started = time.time()
+                try:
+                    run()
+                finally:
+                    # the thread's root node closes with its target
+                    profiler._finish_thread_stack()
+
+            self.run = _run
+        return orig_start(self)
+
+    threading.Thread.start = start
+
+
+def _patch_thread_executor(cf_thread):
+    orig_submit = cf_thread.ThreadPoolExecutor.submit
+
+    def submit(self, fn, /, *args, **kwargs):
+        profiler = _active_profiler
+        if profiler is not None and profiler._threads_active:
+            fn = _ThreadTask(fn, profiler._current_entry(), time.time())
+        return orig_submit(self, fn, *args, **kwargs)
+
+    cf_thread.ThreadPoolExecutor.submit = submit
+
+
+# Environment entries a tracing parent leaves for its Python children
+_LINK_KEYS = (
+    "PYTRACEFLOW_PARENT_PID",
+    "PYTRACEFLOW_PARENT_CALL_ID",
+    "PYTRACEFLOW_PARENT_EXEC_DEPTH",
+    "PYTRACEFLOW_EXEC_DEPTH",
+)
+
+
+def _take_parent_link():
+    """Pop the parent linkage from the environment so descendants do not inherit it."""
+    values = [os.environ.pop(key, None) for key in _LINK_KEYS]
+
+    def _int(val):
+        try:
+            return int(val)
+        except (TypeError, ValueError):
+            return None
+
+    return tuple(_int(val) for val in values)
+
+
+def _child_environ(env, child_env):
+    """Copy env (os.environ when None) adding autotrace config and the parent link.
+
+    Config keys already present in env win; link keys always point at this process.
+    """
+    env = dict(os.environ if env is None else env)
+    if any(isinstance(key, bytes) for key in env):
+        return env
+    for key in _LINK_KEYS:
+        env.pop(key, None)
+    for key, val in child_env.items():
+        if key == "PYTHONPATH":
+            paths = env.get(key, "").split(os.pathsep) if env.get(key) else []
+            if val not in paths:
+                env[key] = os.pathsep.join([val] + paths)
+        elif key in _LINK_KEYS:
+            env[key] = val
+        else:
+            env.setdefault(key, val)
+    return env
+
+
+_subprocess_propagation_installed = False
+# link used by os.exec*(); kept after the first attempt because execvp() retries along PATH
+_exec_env = None
+
+
+def _prepare_exec(env=None):
+    global _exec_env
+    profiler = _active_profiler
+    if profiler is not None and profiler._trace_subprocesses:
+        _exec_env = profiler._child_env(exec_image=True)
+        profiler._finish_for_exec()
+    if _exec_env is None:
+        return env
+    if env is None:
+        # execv() hands the current environ to the new image
+        os.environ.update(_child_environ(None, _exec_env))
+        return None
+    return _child_environ(env, _exec_env)
+
+
+def _install_subprocess_propagation():
+    """Pass autotrace config and the spawning call to subprocess, os.exec* and Process children."""
+    global _subprocess_propagation_installed
+    if _subprocess_propagation_installed:
+        return
+    _subprocess_propagation_installed = True
+    orig_execv = os.execv
+    orig_execve = os.execve
+
+    def execv(path, args):
+        _prepare_exec()
+        return orig_execv(path, args)
+
+    def execve(path, args, env):
+        return orig_execve(path, args, _prepare_exec(env))
+
+    # execl/execlp/execvp/execvpe all end up in os.execv/os.execve
+    os.execv = execv
+    os.execve = execve
+    _when_imported("subprocess", _patch_popen)
+    _when_imported("multiprocessing.process", _patch_process_start)
+
+
+def _patch_popen(subprocess):
+    orig_popen_init = subprocess.Popen.__init__
+
+    def popen_init(self, args, *rest, **kwargs):
+        profiler = _active_profiler
+        if profiler is not None and profiler._trace_subprocesses:
+            child_env = profiler._child_env()
+            if len(rest) > 9:
+                # env passed positionally (bufsize, executable, ..., cwd, env)
+                rest = list(rest)
+                rest[9] = _child_environ(rest[9], child_env)
+            else:
+                kwargs["env"] = _child_environ(kwargs.get("env"), child_env)
+        orig_popen_init(self, args, *rest, **kwargs)
+
+    subprocess.Popen.__init__ = popen_init
+
+
+def _patch_process_start(mp_process):
+    orig_start = mp_process.BaseProcess.start
+
+    def start(self):
+        profiler = _active_profiler
+        if profiler is None or not profiler._trace_subprocesses:
+            return orig_start(self)
+        # spawn/forkserver children inherit os.environ; fork children drop it in _reset_after_fork
+        link = {
+            key: val for key, val in profiler._child_env().items() if key in _LINK_KEYS
+        }
+        saved = {key: os.environ.get(key) for key in _LINK_KEYS}
+        for key in _LINK_KEYS:
+            os.environ.pop(key, None)
+        os.environ.update(link)
+        try:
+            return orig_start(self)
+        finally:
+            for key, val in saved.items():
+                if val is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = val
+
+    mp_process.BaseProcess.start = start
+
+
+def _resolve_ignore_prefixes(cache_path=None):
+    """stdlib/site-packages/prefix directories (with a trailing separator).
+
+    Reused from cache_path when it was written by this same interpreter, so
+    autotraced children skip sysconfig and the path resolution.
+    """
+    key = [sys.executable, sys.prefix, sys.base_prefix, sys.exec_prefix, sys.version]
+    if cache_path:
+        try:
+            with open(cache_path, encoding="utf-8") as fh:
+                cached = json.load(fh)
+            if cached.get("key") == key:
+                return cached["ignore_prefixes"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+    import sysconfig
+
+    prefixes = []
+    paths = sysconfig.get_paths()
+    for name in ("stdlib", "platstdlib", "purelib", "platlib"):
+        if paths.get(name):
+            prefixes.append(os.path.join(os.path.realpath(paths[name]), ""))
+    for path in (sys.prefix, sys.base_prefix, sys.exec_prefix):
+        if path:
+            prefixes.append(os.path.join(os.path.realpath(path), ""))
+    prefixes = list(dict.fromkeys(prefixes))
+    if cache_path:
+        try:
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump({"key": key, "ignore_prefixes": prefixes}, fh)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+    return prefixes
+
+
+_NO_CAPS = (None, None, None)
+
+# capture levels a policy rule can name instead of (or under) explicit switches
+_POLICY_LEVELS = {
+    "none": (False, False, False),
+    "args": (True, False, None),
+    "full": (True, True, None),
+}
+
+
+class CapturePolicy:
+    """Per-function capture switches: ordered rules matching module:qualname (fnmatch).
+
+    Each rule has "match" plus any of "inputs", "outputs", "memory" (bool) or
+    "level" (none/args/full). For each switch the first rule that sets it wins;
+    switches no rule sets follow the global flags. A pattern without "module:"
+    matches the qualname in any module.
+    """
+
+    def __init__(self, rules=(), source=None):
+        self.source = source
+        self.rules = []
+        for rule in rules:
+            pattern = str(rule.get("match", "")).strip()
+            if not pattern:
+                raise ValueError(f"capture policy rule without 'match': {rule!r}")
+            level = rule.get("level")
+            if level is not None and level not in _POLICY_LEVELS:
+                raise ValueError(f"capture policy level must be one of {sorted(_POLICY_LEVELS)}: {level!r}")
+            base = _POLICY_LEVELS.get(level, _NO_CAPS)
+            switches = tuple(
+                bool(rule[key]) if rule.get(key) is not None else default
+                for key, default in zip(("inputs", "outputs", "memory"), base)
+            )
+            self.rules.append((pattern, switches))
+
+    @classmethod
+    def load(cls, path):
+        """Read {"rules": [...]} from a .json or .toml file (TOML needs Python 3.11+)."""
+        path = Path(path)
+        if path.suffix.lower() == ".toml":
+            try:
+                import tomllib
+            except ImportError:
+                raise ValueError(f"{path}: TOML policies need Python 3.11+ (use JSON)") from None
+            with path.open("rb") as f:
+                data = tomllib.load(f)
+        else:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        return cls(data.get("rules", []), source=str(path))
+
+    def resolve(self, module, qualname):
+        """(inputs, outputs, memory) with None for unset switches, or False when no rule matches."""
+        from fnmatch import fnmatchcase
+
+        name = f"{module}:{qualname}"
+        merged = [None, None, None]
+        matched = False
+        for pattern, switches in self.rules:
+            if not fnmatchcase(name if ":" in pattern else qualname, pattern):
+                continue
+            matched = True
+            for idx, value in enumerate(switches):
+                if merged[idx] is None:
+                    merged[idx] = value
+        return tuple(merged) if matched else False
+
+    @property
+    def wants_memory(self):
+        return any(switches[2] for _, switches in self.rules)
+
+    def report(self):
+        return {"source": self.source, "rules": len(self.rules)}
+
+
+def _parse_deadlines(spec):
+    """[(module:callable pattern, ms), ...] from a dict, "pat=ms" strings or one comma-separated string."""
+    if not spec:
+        return []
+    if isinstance(spec, dict):
+        items = spec.items()
+    else:
+        if isinstance(spec, str):
+            spec = spec.split(",")
+        items = []
+        for rule in spec:
+            pattern, sep, ms = rule.strip().rpartition("=")
+            if not sep or not pattern:
+                raise ValueError(f"deadline rule {rule!r} is not pattern=ms")
+            items.append((pattern, ms))
+    return [(pattern.strip(), float(ms)) for pattern, ms in items]
+
+
+class TailSampler:
+    """Keep/drop decision for a finished unit of work (top-level call, task, scope, request).
+
+    A unit is kept when any configured rule matches: duration >= slow_ms,
+    duration >= the `percentile` of the last `window` units with the same
+    module:callable (after `warmup` of them), an error anywhere in its
+    subtree, or a node whose "module:callable" matches one of `match` (fnmatch).
+    """
+
+    def __init__(self, slow_ms=0, percentile=0, errors=False, match=(), window=256, warmup=20):
+        self.slow_ms = float(slow_ms or 0)
+        self.percentile = float(percentile or 0)
+        self.errors = bool(errors)
+        if isinstance(match, str):
+            match = [pat for pat in match.split(",") if pat.strip()]
+        self.match = [pat.strip() for pat in match or ()]
+        self.window = max(int(window or 1), 1)
+        self.warmup = min(max(int(warmup), 1), self.window)
+        self.units = 0
+        self.kept = 0
+        self.dropped = 0
+        self.dropped_nodes = 0
+        self.kept_by = {}
+        # module:callable -> (recent durations in arrival order, same values sorted)
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def fresh(self):
+        """Same rules, no history (forked children count their own units)."""
+        return TailSampler(
+            self.slow_ms, self.percentile, self.errors, self.match, self.window, self.warmup
+        )
+
+    @property
+    def enabled(self):
+        return bool(self.slow_ms > 0 or self.percentile > 0 or self.errors or self.match)
+
+    def _over_percentile(self, key, duration):
+        """Check duration against the window of key, then add it to the window."""
+        import bisect
+        import collections
+
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = (collections.deque(), [])
+        recent, ordered = window
+        over = False
+        if len(ordered) >= self.warmup:
+            rank = min(int(len(ordered) * self.percentile / 100), len(ordered) - 1)
+            over = duration >= ordered[rank]
+        if len(recent) == self.window:
+            # the oldest slot is reused for the new duration
+            del ordered[bisect.bisect_left(ordered, recent.popleft())]
+        recent.append(duration)
+        bisect.insort(ordered, duration)
+        return over
+
+    def _scan(self, node):
+        """(nodes in subtree, rule matched by the subtree or None)."""
+        from fnmatch import fnmatchcase
+
+        count = 0
+        found = None
+        pending = [node]
+        while pending:
+            current = pending.pop()
+            count += 1
+            if found is None:
+                if self.errors and current.get("error"):
+                    found = "error"
+                elif self.match:
+                    name = f"{current.get('module', '')}:{current.get('callable', '')}"
+                    if any(fnmatchcase(name, pat) for pat in self.match):
+                        found = "match"
+            pending.extend(current.get("calls") or ())
+        return count, found
+
+    def decide(self, node, failed=False):
+        """Return (keep, nodes in the unit) and update the counters."""
+        duration = node.get("duration_ms") or 0
+        count, reason = self._scan(node)
+        if failed and self.errors:
+            reason = "error"
+        with self._lock:
+            self.units += 1
+            if self.percentile > 0:
+                key = f"{node.get('module', '')}:{node.get('callable', '')}"
+                if self._over_percentile(key, duration) and reason is None:
+                    reason = f"p{self.percentile:g}"
+            if reason is None and self.slow_ms > 0 and duration >= self.slow_ms:
+                reason = "slow"
+            if reason is None:
+                self.dropped += 1
+                self.dropped_nodes += count
+                return False, count
+            self.kept += 1
+            self.kept_by[reason] = self.kept_by.get(reason, 0) + 1
+        return True, count
+
+    def report(self):
+        rules = {}
+        if self.slow_ms > 0:
+            rules["slow_ms"] = self.slow_ms
+        if self.percentile > 0:
+            rules["percentile"] = self.percentile
+            rules["window"] = self.window
+        if self.errors:
+            rules["errors"] = True
+        if self.match:
+            rules["match"] = list(self.match)
+        return {
+            "rules": rules,
+            "units": self.units,
+            "kept": self.kept,
+            "dropped": self.dropped,
+            "dropped_nodes": self.dropped_nodes,
+            "kept_by": dict(self.kept_by),
+        }
+
+
+def _run_shape_size(first, node):
+    """Node count of `node` when it may join the run started by `first`, else 0.
+
+    Both subtrees must match call by call (module, class, function), with no
+    errors; nested runs must also have the same count.
+    """
+    size = 0
+    pending = [(first, node, True)]
+    while pending:
+        a, b, top = pending.pop()
+        if (
+            a.get("callable") != b.get("callable")
+            or a.get("called") != b.get("called")
+            or a.get("module") != b.get("module")
+            or a.get("error") is not None
+            or b.get("error") is not None
+            or not a.keys() <= _RUN_KEYS
+            or not b.keys() <= _RUN_KEYS
+        ):
+            return 0
+        if not top and (a.get("run") or {}).get("count") != (b.get("run") or {}).get("count"):
+            return 0
+        a_calls = a.get("calls", ())
+        b_calls = b.get("calls", ())
+        if len(a_calls) != len(b_calls):
+            return 0
+        size += 1
+        pending.extend((x, y, False) for x, y in zip(a_calls, b_calls))
+    return size
+
+
+def _is_class_definition_node(node):
+    return (
+        node.get("module") == "__main__"
+        and node.get("callable") == node.get("called")
+        and not node.get("inputs")
+        and node.get("output") is None
+        and node.get("error") is None
+        and node.get("callable") not in ("__main__", "__instance__")
+    )
+
+
+def prune_calls(node):
+    """Drop synthetic and empty bookkeeping nodes of a finished tree (in place)."""
+    pruned = []
+    for child in node.get("calls", []):
+        prune_calls(child)
+        if child.get("called") == "__scope__":
+            pruned.append(child)
+            continue
+        # descarta nodos sintéticos de python y reancla sus hijos al padre
+        if str(child.get("callable", "")).startswith("<") and "task" not in child:
+            pruned.extend(child.get("calls", []))
+            continue
+        if _is_class_definition_node(child):
+            pruned.extend(child.get("calls", []))
+            continue
+        if child.get("callable") == "__instance__" and not child.get("calls"):
+            continue
+        if child.get("called") == "__thread__" and not child.get("calls"):
+            continue
+        if (
+            child.get("callable") == "__init__"
+            and not child.get("calls")
+            and child.get("output") is None
+            and child.get("error") is None
+        ):
+            continue
+        pruned.append(child)
+    node["calls"] = pruned
+
 
 class PyFlowTraceProfiler:
     def __init__(
@@ -27,6 +747,32 @@ class PyFlowTraceProfiler:
         enable_tracemalloc=False,
         verbose=False,
         allow_any=False,
+        max_nodes=0,
+        max_bytes=0,
+        rotate_bytes=0,
+        rotate_seconds=0,
+        rotate_roots=0,
+        retain_segments=0,
+        propagate_tasks=False,
+        trace_threads=False,
+        trace_subprocesses=False,
+        stream=None,
+        stream_queue=100_000,
+        measure_overhead=False,
+        overhead_sample=64,
+        max_overhead_pct=0,
+        overhead_window=1.0,
+        prefix_cache=None,
+        tail=None,
+        dump_signal=None,
+        deadline_ms=0,
+        deadlines=None,
+        triggers=None,
+        policy=None,
+        dedup_shapes=0,
+        fold_runs=False,
+        run_durations=False,
+        intern_values=0,
     ):
         self.script_path = Path(script_path).resolve()
         self.output_path = Path(output_path)
@@ -39,6 +785,7 @@ class PyFlowTraceProfiler:
         self._stack = []
         self._instance_roots = {}
         self._next_id = 1
+        self._ids = itertools.count(1)
         self._root_entry = None
         # Root directory used to decide which files to trace
         if self.script_path.exists():
@@ -46,19 +793,18 @@ class PyFlowTraceProfiler:
         else:
             # In autotrace (sitecustomize) sys.argv[0] may not point to a real file; default to cwd
             self._root_dir = Path.cwd()
-        # rutas a ignorar: stdlib y site-packages
-        self._ignore_prefixes = []
-        for key in ("stdlib", "platstdlib", "purelib", "platlib"):
-            p = sysconfig.get_paths().get(key)
-            if p:
-                self._ignore_prefixes.append(Path(p).resolve())
-        for p in (sys.prefix, sys.base_prefix, sys.exec_prefix):
-            try:
-                self._ignore_prefixes.append(Path(p).resolve())
-            except Exception:
-                pass
+        # rutas a ignorar (stdlib y site-packages): se resuelven con el primer archivo nuevo
+        self._ignore_prefixes = None
+        self._prefix_cache = prefix_cache
+        # co_filename -> traceable?, so each file is resolved once instead of per event
+        self._file_verdicts = {}
         self._tracemalloc_enabled = False
         self._write_lock = threading.Lock()
+        # snapshots are numbered under _write_lock and written in order: a flush
+        # thread that serialized earlier never overwrites a newer (e.g. final) file
+        self._output_lock = threading.Lock()
+        self._snapshot_seq = 0
+        self._written_seq = 0
         self._flush_interval = 0.2
         self._last_flush = -1e9  # fuerza un primer flush inmediato
         self._stop_flush = threading.Event()
@@ -72,8 +818,11 @@ class PyFlowTraceProfiler:
         self._dirty = False
         self._run_started = None
         self._capture_memory = capture_memory
+        self._capture_memory_config = capture_memory
         self._capture_inputs_enabled = capture_inputs
         self._capture_outputs_enabled = capture_outputs
+        self._capture_inputs_config = capture_inputs
+        self._capture_outputs_config = capture_outputs
         self._enable_tracemalloc = enable_tracemalloc
         self._verbose = verbose
         self._heartbeat_thread = None
@@ -82,9 +831,220 @@ class PyFlowTraceProfiler:
         self._live_mode_started = False
         self._live_mode_stopped = False
         self._allow_any = allow_any
+        # trace size budget (0 disables each limit)
+        self._max_nodes = int(max_nodes or 0)
+        self._max_bytes = int(max_bytes or 0)
+        self._node_count = 0
+        self._flush_node_count = 0
+        self._degrade_level = 0
+        self._degrade_at = None
+        self._aggregate_mode = False
+        self._aggregates = {}
+        self._agg_inflight = {}
+        # calls folded into aggregates still count toward the budget (the spine level needs them)
+        self._agg_calls = 0
+        self._code_keys = {}
+        # output rotation into self-contained segments linked by a manifest
+        self._base_output_path = self.output_path
+        self._rotate_bytes = int(rotate_bytes or 0)
+        self._rotate_seconds = float(rotate_seconds or 0)
+        self._rotate_roots = int(rotate_roots or 0)
+        self._retain_segments = int(retain_segments or 0)
+        self._rotating = bool(self._rotate_bytes or self._rotate_seconds > 0 or self._rotate_roots)
+        self._rotate_pending = False
+        self._segment_index = 0
+        self._segment_started = None
+        self._segments = []
+        self._hook_thread = None
+        self._fork_parent = None
+        self._propagate_tasks = propagate_tasks
+        self._task_worker = False
+        self._sigterm_handler = None
+        self._trace_threads = trace_threads
+        self._threads_active = False
+        self._tls = threading.local()
+        self._trace_subprocesses = trace_subprocesses
+        self._child_config = {}
+        # os.environ values replaced while profiling, restored by _end_profile
+        self._saved_environ = None
+        self._exec_depth = 0
+        self._profile_ended = False
+        # live event streaming to a collector replaces the local JSON snapshots
+        self._stream_spec = stream
+        self._stream_queue = int(stream_queue or 100_000)
+        self._stream = None
+        if stream:
+            self._rotating = False
+        # overhead governor: sheds detail while the tracer costs more than the cap
+        self._max_overhead_pct = float(max_overhead_pct or 0)
+        self._overhead_window = max(float(overhead_window or 1.0), 0.05)
+        self._governor_level = 0
+        self._governor_thread = None
+        # sampled self-timing of the hook stages and of flushes (the governor's input)
+        measure_overhead = measure_overhead or self._max_overhead_pct > 0
+        self._measure_overhead = measure_overhead
+        self._overhead_sample = max(int(overhead_sample or 1), 1)
+        self._reset_overhead()
+        if measure_overhead:
+            self._install_overhead_timers()
+        # tail sampling: finished units of work are kept only when a TailSampler rule matches
+        self._tail = tail if tail is not None and tail.enabled else None
+        if self._tail is not None and stream:
+            # streamed events are already gone when a unit finishes
+            sys.stderr.write("[FlowTrace] tail sampling is ignored with --stream\n")
+            self._tail = None
+        # in-flight dump on a signal: every traced thread's open calls, nothing else
+        self._dump_signal = _resolve_signal(dump_signal, "SIGUSR2") if dump_signal else None
+        self._dump_previous = None
+        self._thread_stacks = {}
+        # watchdog: open calls past their deadline are reported while still running
+        self._deadline_ms = float(deadline_ms or 0)
+        self._deadlines = _parse_deadlines(deadlines)
+        self._deadline_cache = {}
+        self._deadline_alerted = set()
+        self._deadline_alerts = 0
+        self._watchdog_thread = None
+        # trigger-scoped capture: dormant until a module:qualname in triggers is entered
+        if isinstance(triggers, str):
+            triggers = triggers.split(",")
+        self._triggers = [pat.strip() for pat in triggers or () if pat.strip()]
+        self._trigger_codes = {}
+        # per-function capture switches (CapturePolicy or a JSON/TOML file), cached per code object
+        if policy is not None and not isinstance(policy, CapturePolicy):
+            policy = CapturePolicy.load(policy)
+        self._policy = policy if policy is not None and policy.rules else None
+        self._code_policy = {}
+        self._payloads_allowed = True
+        self._memory_allowed = True
+        # fold repeated subtrees at the final write (0 = off, else the smallest subtree folded)
+        self._dedup_shapes = int(dedup_shapes or 0)
+        # consecutive identical sibling calls fold into one run node as they finish
+        self._fold_runs = bool(fold_runs or run_durations)
+        self._run_durations = bool(run_durations)
+        self._runs = 0
+        self._run_folded = 0
+        if self._fold_runs and stream:
+            # the collector already has every call when the next sibling finishes
+            sys.stderr.write("[FlowTrace] --fold-runs is ignored with --stream\n")
+            self._fold_runs = False
+        # payloads of at least intern_values JSON bytes are stored once in root["values"]
+        self._intern_values = int(intern_values or 0)
+        self._values = None
+        if self._intern_values and stream:
+            sys.stderr.write("[FlowTrace] --intern-values is ignored with --stream\n")
+            self._intern_values = 0
+
+    def _reset_overhead(self):
+        self._ov_events = 0
+        self._ov_sampled = 0
+        self._ov_hook_ns = 0
+        self._ov_stage_ns = dict.fromkeys(OVERHEAD_STAGES, 0)
+        self._ov_flush_serialize_ns = 0
+        self._ov_flush_write_ns = 0
+        self._gov_mark = None
+        self._gov_ns_per_event = None
+        self._gov_warm = False
+        self._gov_calm_windows = 0
+
+    def _install_overhead_timers(self):
+        """Shadow the hook and its stage methods with sampling timers (instance attributes)."""
+        for stage, name in _OVERHEAD_STAGE_METHODS:
+            setattr(self, name, self._timed_stage(stage, getattr(self, name)))
+        self._profile = self._timed_hook(self._profile)
+
+    def _timed_hook(self, hook):
+        every = self._overhead_sample
+        perf = time.perf_counter_ns
 
-    def _memory_snapshot(self):
-        if not self._capture_memory:
+        def _profile(frame, event, arg, stack=None):
+            self._ov_events += 1
+            if self._ov_events % every:
+                return hook(frame, event, arg, stack)
+            # per thread: flushes and other threads' events are not this sample's stages
+            tls = self._tls
+            tls.ov_sampling = True
+            flushed = self._ov_flush_serialize_ns + self._ov_flush_write_ns
+            started = perf()
+            try:
+                return hook(frame, event, arg, stack)
+            finally:
+                # a flush inside the sample is already counted in the flush totals
+                flushed = self._ov_flush_serialize_ns + self._ov_flush_write_ns - flushed
+                self._ov_hook_ns += max(perf() - started - flushed, 0)
+                self._ov_sampled += 1
+                tls.ov_sampling = False
+
+        return _profile
+
+    def _timed_stage(self, stage, func):
+        perf = time.perf_counter_ns
+
+        def timed(*args, **kwargs):
+            tls = self._tls
+            # nested stages (e.g. _serialize inside _capture_inputs) count for the outer one
+            if not getattr(tls, "ov_sampling", False) or getattr(tls, "ov_in_stage", False):
+                return func(*args, **kwargs)
+            tls.ov_in_stage = True
+            flushed = self._ov_flush_serialize_ns + self._ov_flush_write_ns
+            started = perf()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                flushed = self._ov_flush_serialize_ns + self._ov_flush_write_ns - flushed
+                self._ov_stage_ns[stage] += max(perf() - started - flushed, 0)
+                tls.ov_in_stage = False
+
+        return timed
+
+    def _overhead_report(self):
+        """Estimated tracer cost from the sampled events plus measured flush time."""
+        elapsed_ms = self._elapsed_ms() or 0.0
+        sampled = self._ov_sampled
+        per_event = {}
+        hook_ns = 0.0
+        if sampled:
+            hook_ns = self._ov_hook_ns / sampled
+            staged = 0.0
+            for stage in OVERHEAD_STAGES:
+                per_event[stage] = round(self._ov_stage_ns[stage] / sampled, 1)
+                staged += self._ov_stage_ns[stage] / sampled
+            per_event["other"] = round(max(hook_ns - staged, 0.0), 1)
+            per_event["total"] = round(hook_ns, 1)
+        hook_ms = hook_ns * self._ov_events / 1e6
+        serialize_ms = self._ov_flush_serialize_ns / 1e6
+        write_ms = self._ov_flush_write_ns / 1e6
+        flush_ms = serialize_ms + write_ms
+        return {
+            "events": self._ov_events,
+            "sampled": sampled,
+            "sample_every": self._overhead_sample,
+            "events_per_sec": round(self._ov_events / (elapsed_ms / 1000), 1) if elapsed_ms else None,
+            "ns_per_event": per_event,
+            "hook_ms_est": round(hook_ms, 3),
+            "flush": {
+                "count": self._flush_count,
+                "serialize_ms": round(serialize_ms, 3),
+                "write_ms": round(write_ms, 3),
+                "total_ms": round(flush_ms, 3),
+            },
+            # the tracer cannot have cost more than the wall time measured
+            "overhead_pct_est": round(min(hook_ms + flush_ms, elapsed_ms) / elapsed_ms * 100, 2) if elapsed_ms else None,
+        }
+
+    def _overhead_summary(self, report=None):
+        report = report or self._overhead_report()
+        stages = " ".join(
+            f"{stage}={ns:.0f}" for stage, ns in report["ns_per_event"].items() if stage != "total"
+        )
+        return (
+            f"ev/s={report['events_per_sec']} "
+            f"ns/ev={report['ns_per_event'].get('total', 0):.0f} ({stages}) "
+            f"flush_ms={report['flush']['total_ms']} "
+            f"overhead~={report['overhead_pct_est']}%"
+        )
+
+    def _memory_snapshot(self, enabled=None):
+        if not (self._capture_memory if enabled is None else enabled):
             return {}
         snapshot = {}
         try:
@@ -98,6 +1058,8 @@ class PyFlowTraceProfiler:
         except Exception:
             # psutil no disponible o falló; continuamos con tracemalloc si está activo
             pass
+        import tracemalloc
+
         if tracemalloc.is_tracing():
             current, peak = tracemalloc.get_traced_memory()
             snapshot["py_tracemalloc_current"] = current
@@ -122,65 +1084,94 @@ class PyFlowTraceProfiler:
         except TypeError:
             return repr(value)
 
-    def _capture_inputs(self, frame):
+    def _capture_inputs(self, frame, enabled=None):
         # Fast path: when inputs capture is disabled, avoid inspect/serialization entirely
-        if not self._capture_inputs_enabled:
-            return {}
-        try:
-            args = inspect.getargvalues(frame)
-        except Exception:
+        if not (self._capture_inputs_enabled if enabled is None else enabled):
             return {}
-
-        values = {name: frame.f_locals.get(name) for name in args.args}
-        if args.varargs:
-            values[args.varargs] = frame.f_locals.get(args.varargs)
-        if args.keywords:
-            values[args.keywords] = frame.f_locals.get(args.keywords)
+        # same names as inspect.getargvalues(frame), without importing inspect
+        code = frame.f_code
+        f_locals = frame.f_locals
+        count = code.co_argcount + code.co_kwonlyargcount
+        names = list(code.co_varnames[:count])
+        if code.co_flags & _CO_VARARGS:
+            names.append(code.co_varnames[count])
+            count += 1
+        if code.co_flags & _CO_VARKEYWORDS:
+            names.append(code.co_varnames[count])
+        values = {name: f_locals.get(name) for name in names}
         values.pop("self", None)
         values.pop("cls", None)
+        table = self._values
+        if table is not None:
+            return {key: table.intern(self._serialize(val)) for key, val in values.items()}
         return {key: self._serialize(val) for key, val in values.items()}
 
+    def _policy_caps(self, frame):
+        """(inputs, outputs, memory) switches for this call under the capture policy.
+
+        Rules are resolved once per code object; None keeps the global switch.
+        """
+        rule = self._code_policy.get(frame.f_code)
+        if rule is None:
+            code = frame.f_code
+            rule = self._code_policy[code] = self._policy.resolve(
+                frame.f_globals.get("__name__", ""), getattr(code, "co_qualname", code.co_name)
+            )
+        if not rule:
+            return _NO_CAPS
+        inputs, outputs, memory = rule
+        # the budget and the governor still win over the policy
+        return (
+            None if inputs is None else inputs and self._payloads_allowed,
+            None if outputs is None else outputs and self._payloads_allowed,
+            None if memory is None else memory and self._memory_allowed,
+        )
+
     def _get_class_name(self, frame):
         if "self" in frame.f_locals:
             return type(frame.f_locals["self"]).__name__
-        if "cls" in frame.f_locals and inspect.isclass(frame.f_locals["cls"]):
+        if "cls" in frame.f_locals and isinstance(frame.f_locals["cls"], type):
             return frame.f_locals["cls"].__name__
         return None
 
     def _should_trace(self, frame):
         filename_str = frame.f_code.co_filename
+        verdict = self._file_verdicts.get(filename_str)
+        if verdict is None:
+            verdict = self._file_verdicts[filename_str] = self._classify_file(filename_str)
+        if not verdict:
+            return False
         module_name = frame.f_globals.get("__name__", "")
+        return not module_name.startswith(("importlib", "encodings", "zipimport"))
+
+    def _classify_file(self, filename_str):
         # descartar frames internos/builtins/frozen
         if filename_str.startswith("<"):
             return False
-        if module_name.startswith(("importlib", "encodings", "zipimport")):
-            return False
         try:
-            filename = Path(filename_str).resolve()
+            filename = os.path.realpath(filename_str)
         except Exception:
             return False
-        if filename == Path(__file__).resolve():
+        if filename == os.path.realpath(__file__):
             return False
+        if self._ignore_prefixes is None:
+            self._ignore_prefixes = _resolve_ignore_prefixes(self._prefix_cache)
         # ignorar stdlib / site-packages
         for prefix in self._ignore_prefixes:
-            try:
-                filename.relative_to(prefix)
+            if filename.startswith(prefix) or filename == prefix.rstrip(os.sep):
                 return False
-            except ValueError:
-                continue
         # trazar cualquier archivo dentro del directorio raíz del script
-        try:
-            filename.relative_to(self._root_dir)
+        root = os.path.join(os.path.realpath(self._root_dir), "")
+        if filename.startswith(root):
             return True
-        except ValueError:
-            return self._allow_any
+        return self._allow_any
 
     def _is_class_constructor_call(self, frame):
         if frame.f_globals.get("__name__") != "__main__":
             return False
         name = frame.f_code.co_name
         obj = frame.f_globals.get(name)
-        return inspect.isclass(obj)
+        return isinstance(obj, type)
 
     def _is_class_definition(self, frame):
         if frame.f_globals.get("__name__") != "__main__":
@@ -189,7 +1180,7 @@ class PyFlowTraceProfiler:
             return False
         return frame.f_code.co_name == frame.f_locals.get("__qualname__")
 
-    def _profile(self, frame, event, arg):
+    def _profile(self, frame, event, arg, stack=None):
         if not self._should_trace(frame):
             return
 
@@ -203,8 +1194,14 @@ class PyFlowTraceProfiler:
         if self._is_class_constructor_call(frame):
             return
 
+        if stack is None:
+            stack = self._stack
         frame_id = id(frame)
         if event == "call":
+            if self._aggregate_mode:
+                self._aggregate_enter(frame, frame_id)
+                return
+            caps = self._policy_caps(frame) if self._policy is not None else _NO_CAPS
             class_name = self._get_class_name(frame)
             instance_id = None
             if "self" in frame.f_locals:
@@ -212,180 +1209,1122 @@ class PyFlowTraceProfiler:
             if frame.f_code.co_name == "__init__" and instance_id is not None:
                 if instance_id not in self._instance_roots:
                     instance_entry = {
-                        "id": self._next_id,
+                        "id": self._alloc_id(),
                         "callable": "__instance__",
                         "module": frame.f_globals.get("__name__", ""),
                         "called": class_name if class_name else frame.f_code.co_name,
                         "instance_id": instance_id,
-                        "inputs": self._capture_inputs(frame),
+                        "inputs": self._capture_inputs(frame, caps[0]),
                         "output": None,
                         "error": None,
                         "duration_ms": None,
                         "calls": [],
                     }
-                    self._next_id += 1
-                    root_calls = (
-                        self._root_entry["calls"]
-                        if self._root_entry is not None
-                        else self.records
-                    )
+                    if stack and stack[0].get("called") == "__request__":
+                        # per-request traces (pytraceflow_web) keep their instances
+                        root_calls = stack[0]["calls"]
+                    else:
+                        root_calls = (
+                            self._root_entry["calls"]
+                            if self._root_entry is not None
+                            else self.records
+                        )
                     root_calls.append(instance_entry)
                     self._instance_roots[instance_id] = instance_entry
+                    if self._stream is not None:
+                        self._emit_node(self._root_entry, instance_entry)
                     self._pending_new_records += 1
+                    self._node_count += 1
 
             entry = {
-                "id": self._next_id,
+                "id": self._alloc_id(),
                 "callable": frame.f_code.co_name,
                 "module": frame.f_globals.get("__name__", ""),
                 "called": class_name if class_name else frame.f_code.co_name,
                 "caller": None,
                 "instance_id": instance_id,
-                "inputs": self._capture_inputs(frame),
+                "inputs": self._capture_inputs(frame, caps[0]),
                 "calls": [],
             }
-            self._next_id += 1
-            self._inflight[frame_id] = (entry, time.time())
+            started = time.time()
+            self._inflight[frame_id] = (entry, started)
             self._last_seen_callable = entry["callable"]
-            if self._stack:
-                parent = self._stack[-1]
+            if stack:
+                parent = stack[-1]
                 entry["caller"] = f"{parent.get('called')}::{parent.get('callable')}"
             if instance_id is not None and instance_id in self._instance_roots:
-                parent = self._stack[-1] if self._stack and self._stack[-1].get(
+                parent = stack[-1] if stack and stack[-1].get(
                     "instance_id"
                 ) == instance_id else self._instance_roots[instance_id]
                 parent["calls"].append(entry)
-            elif self._stack:
-                self._stack[-1]["calls"].append(entry)
+            elif stack:
+                parent = stack[-1]
+                parent["calls"].append(entry)
             else:
+                parent = None
                 self.records.append(entry)
-            self._stack.append(entry)
-            entry["memory_before"] = self._memory_snapshot()
+            stack.append(entry)
+            entry["memory_before"] = self._memory_snapshot(caps[2])
+            if self._stream is not None:
+                self._stream.put(
+                    (
+                        "c",
+                        parent["id"] if parent is not None else None,
+                        entry["id"],
+                        entry["callable"],
+                        entry["module"],
+                        entry["called"],
+                        entry["caller"],
+                        instance_id,
+                        entry["inputs"],
+                        started,
+                        entry["memory_before"],
+                    )
+                )
             self._dirty = True
             self._pending_new_records += 1
+            self._node_count += 1
+            if self._degrade_at is not None and self._node_count >= self._degrade_at:
+                self._update_degradation()
             self._maybe_flush(
                 force=self._flush_every_call, current=entry["callable"], log=False
             )
             return
 
         if frame_id not in self._inflight:
+            if self._agg_inflight and event in ("return", "exception"):
+                self._aggregate_exit(frame_id, event)
             return
 
         entry, started = self._inflight[frame_id]
+        caps = self._policy_caps(frame) if self._policy is not None else _NO_CAPS
         if event == "return":
-            entry["inputs_after"] = self._capture_inputs(frame)
+            entry["inputs_after"] = self._capture_inputs(frame, caps[0])
             if entry.get("error") is None:
-                if self._capture_outputs_enabled:
+                if self._capture_outputs_enabled if caps[1] is None else caps[1]:
                     entry["output"] = self._serialize(arg)
+                    if self._values is not None:
+                        entry["output"] = self._values.intern(entry["output"])
                 else:
                     entry["output"] = None
                 entry["error"] = None
             entry["duration_ms"] = round((time.time() - started) * 1000, 3)
-            entry["memory_after"] = self._memory_snapshot()
+            entry["memory_after"] = self._memory_snapshot(caps[2])
             self._inflight.pop(frame_id, None)
-            if self._stack and self._stack[-1] is entry:
-                self._stack.pop()
+            if stack and stack[-1] is entry:
+                stack.pop()
+            if self._stream is not None:
+                self._stream_return(entry, stack)
+            elif self._tail is not None and len(stack) == 1 and stack[0].get("called") not in _TAIL_SELF_UNITS:
+                self._tail_unit(entry, stack[0]["calls"])
+            elif self._fold_runs:
+                self._fold_run(entry, stack)
             self._dirty = True
             self._maybe_flush(
                 force=self._flush_every_call, current=entry["callable"], log=False
             )
         elif event == "exception":
             exc_type, exc_value, _ = arg
-            entry["inputs_after"] = self._capture_inputs(frame)
+            entry["inputs_after"] = self._capture_inputs(frame, caps[0])
             entry["output"] = None
             entry["error"] = repr(exc_value if exc_value else exc_type)
             entry["duration_ms"] = round((time.time() - started) * 1000, 3)
-            entry["memory_after"] = self._memory_snapshot()
+            entry["memory_after"] = self._memory_snapshot(caps[2])
             self._inflight.pop(frame_id, None)
-            if self._stack and self._stack[-1] is entry:
-                self._stack.pop()
+            if stack and stack[-1] is entry:
+                stack.pop()
+            if self._stream is not None:
+                self._stream_return(entry, stack)
+            elif self._tail is not None and len(stack) == 1 and stack[0].get("called") not in _TAIL_SELF_UNITS:
+                self._tail_unit(entry, stack[0]["calls"])
             self._dirty = True
             self._maybe_flush(
                 force=self._flush_every_call, current=entry["callable"], log=False
             )
 
-    def run(self):
-        script_name = self.script_path.name
-        self._begin_profile(script_name)
-        old_argv = sys.argv
-        # emula la ejecucion normal del script, permitiendo argumentos personalizados
-        sys.argv = [str(self.script_path)] + self.script_args
-        exc_raised: BaseException | None = None
-        try:
-            runpy.run_path(str(self.script_path), run_name="__main__")
-        except BaseException as exc:  # capturamos para reflejar error en la raiz
-            exc_raised = exc
-            self._root_entry["error"] = repr(exc)
-            self._root_entry["output"] = None
-            # marca como error cualquier frame inflight (p.ej. validate_config)
-            now = time.time()
-            for entry, started in list(self._inflight.values()):
-                entry["output"] = None
-                entry["error"] = repr(exc)
-                entry["duration_ms"] = round((now - started) * 1000, 3)
-                entry["memory_after"] = self._memory_snapshot()
-            self._propagate_error(self._root_entry, repr(exc))
-        finally:
-            sys.argv = old_argv
-            self._end_profile(self.script_path.name, exc_raised)
-            print()
+    def _thread_profile(self, frame, event, arg):
+        if not self._threads_active:
+            sys.setprofile(None)
+            return
+        stack = getattr(self._tls, "stack", None)
+        if stack is None:
+            # threads only get a root once they run traced code
+            if event != "call" or not self._should_trace(frame):
+                return
+            stack = self._start_thread_stack()
+        self._profile(frame, event, arg, stack)
 
-    def _prune_calls(self, node):
-        pruned = []
-        for child in node.get("calls", []):
-            self._prune_calls(child)
-            # descarta nodos sintéticos de python y reancla sus hijos al padre
-            if str(child.get("callable", "")).startswith("<"):
-                pruned.extend(child.get("calls", []))
-                continue
-            if self._is_class_definition_node(child):
-                pruned.extend(child.get("calls", []))
-                continue
-            if child.get("callable") == "__instance__" and not child.get("calls"):
-                continue
-            if (
-                child.get("callable") == "__init__"
-                and not child.get("calls")
-                and child.get("output") is None
-                and child.get("error") is None
-            ):
-                continue
-            pruned.append(child)
-        node["calls"] = pruned
+    def _trigger_hook(self, frame, event, arg):
+        """Dormant hook of --trigger: one dict lookup per call until a trigger function starts."""
+        if event != "call":
+            return
+        pattern = self._trigger_codes.get(frame.f_code)
+        if pattern is None:
+            pattern = self._trigger_codes[frame.f_code] = self._match_trigger(frame)
+        if pattern:
+            self._fire_trigger(frame, arg, pattern)
 
-    def _propagate_error(self, node, exc_repr):
-        if node.get("output") is None and node.get("error") is None:
-            node["error"] = exc_repr
-        for child in node.get("calls", []):
-            self._propagate_error(child, exc_repr)
+    def _match_trigger(self, frame):
+        from fnmatch import fnmatchcase
 
-    def start_live(self):
-        """Start profiling the current process (for multiprocessing autotrace)."""
-        if self._live_mode_started:
-            return
-        script_name = Path(sys.argv[0]).name or "__process__"
-        self._live_mode_started = True
-        self._begin_profile(script_name)
+        code = frame.f_code
+        qualname = getattr(code, "co_qualname", code.co_name)
+        name = f"{frame.f_globals.get('__name__', '')}:{qualname}"
+        for pattern in self._triggers:
+            # a pattern without "module:" matches the qualname in any module
+            if fnmatchcase(name if ":" in pattern else qualname, pattern):
+                return pattern
+        return False
 
-    def stop_live(self):
-        """Stop profiling the current process (safe to call multiple times)."""
-        if not self._live_mode_started or self._live_mode_stopped:
+    def _fire_trigger(self, frame, arg, pattern):
+        """Trace this invocation in full as its own top-level call, then go dormant again."""
+        if self._profile_ended:
+            sys.setprofile(None)
             return
-        self._live_mode_stopped = True
-        try:
-            self._end_profile(Path(sys.argv[0]).name or "__process__", None)
-        except Exception:
-            # Avoid raising during atexit
-            pass
+        if threading.get_ident() == self._hook_thread:
+            stack = self._stack
+        else:
+            stack = getattr(self._tls, "stack", None)
+            if stack is None:
+                stack = self._tls.stack = [self._root_entry]
+                self._thread_stacks[threading.get_ident()] = stack
+        base = len(stack)
+        profile = self._profile
+        dormant = self._trigger_hook
 
-    def _write_output(self, payload):
-        with open(self.output_path, "w", encoding="utf-8", newline="") as f:
-            f.write(payload)
-            f.flush()
+        def _active(frame, event, arg):
+            profile(frame, event, arg, stack)
+            if len(stack) <= base:
+                sys.setprofile(dormant)
 
-    def _maybe_flush(self, force=False, current=None, log=None):
-        if log is None:
-            log = self._log_flushes
-        now = time.time()
+        profile(frame, "call", arg, stack)
+        if len(stack) <= base:
+            # not traceable (ignored file, synthetic frame): stay dormant
+            return
+        stack[-1]["trigger"] = {"pattern": pattern, "thread": threading.current_thread().name}
+        self._root_entry["triggers"]["fired"] += 1
+        sys.setprofile(_active)
+
+    def _start_thread_stack(self):
+        """Create the stack of a newly traced thread, rooted under the call that started it."""
+        thread = threading.current_thread()
+        link = getattr(thread, "_pft_link", None)
+        parent = link[0] if link else self._root_entry
+        started = getattr(thread, "_pft_run_started", None) or time.time()
+        info = {"name": thread.name, "ident": threading.get_ident(), "started": started}
+        if link:
+            info["started_by"] = parent.get("id")
+            info["start_wait_ms"] = round((time.time() - link[1]) * 1000, 3)
+        root = {
+            "id": self._alloc_id(),
+            "callable": thread.name,
+            "module": "threading",
+            "called": "__thread__",
+            "inputs": {},
+            "output": None,
+            "error": None,
+            "duration_ms": None,
+            "thread": info,
+            "calls": [],
+        }
+        (parent["calls"] if parent is not None else self.records).append(root)
+        # in flight until the target returns: dumps show its age, rotation keeps it
+        self._inflight[id(root)] = (root, started)
+        self._node_count += 1
+        if self._stream is not None:
+            self._emit_node(parent, root)
+        stack = [root]
+        self._tls.stack = stack
+        self._thread_stacks[info["ident"]] = stack
+        return stack
+
+    def _finish_thread_stack(self):
+        """Close this thread's root node (called when a linked thread's run() returns)."""
+        stack = getattr(self._tls, "stack", None)
+        self._tls.stack = None
+        self._thread_stacks.pop(threading.get_ident(), None)
+        if not stack or stack[0].get("called") != "__thread__":
+            return
+        root = stack[0]
+        item = self._inflight.pop(id(root), None)
+        if item is None:
+            return
+        root["duration_ms"] = round((time.time() - item[1]) * 1000, 3)
+        if self._stream is not None:
+            self._stream.put(self._return_event(root))
+        self._dirty = True
+
+    def _current_stack(self):
+        if threading.get_ident() == self._hook_thread:
+            return self._stack
+        return getattr(self._tls, "stack", None) or []
+
+    def _current_entry(self):
+        stack = self._current_stack()
+        return stack[-1] if stack else self._root_entry
+
+    def _run_thread_task(self, task, args, kwargs):
+        """Run an executor work item under a node attached to the submitting call."""
+        func = task.func
+        started = time.time()
+        info = {
+            "kind": "thread",
+            "thread": threading.current_thread().name,
+            "submitted_by": task.parent.get("id") if task.parent else None,
+            "queue_ms": round((started - task.submitted) * 1000, 3),
+            "run_ms": None,
+        }
+        node = {
+            "id": self._alloc_id(),
+            "callable": getattr(func, "__name__", type(func).__name__),
+            "module": getattr(func, "__module__", "") or "",
+            "called": "__task__",
+            "inputs": {},
+            "output": None,
+            "error": None,
+            "duration_ms": None,
+            "task": info,
+            "calls": [],
+        }
+        owner = task.parent or self._root_entry
+        owner["calls"].append(node)
+        self._node_count += 1
+        self._pending_new_records += 1
+        if self._stream is not None:
+            self._emit_node(owner, node)
+        stack = getattr(self._tls, "stack", None)
+        fresh = stack is None
+        if fresh:
+            stack = self._tls.stack = []
+            self._thread_stacks[threading.get_ident()] = stack
+        stack.append(node)
+        self._dirty = True
+        try:
+            return func(*args, **kwargs)
+        except BaseException as exc:
+            node["error"] = repr(exc)
+            raise
+        finally:
+            run_ms = round((time.time() - started) * 1000, 3)
+            info["run_ms"] = run_ms
+            node["duration_ms"] = run_ms
+            if stack and stack[-1] is node:
+                stack.pop()
+            if fresh and not stack:
+                # a reused pool thread starts over: later calls get a thread root, not self.records
+                self._tls.stack = None
+                self._thread_stacks.pop(threading.get_ident(), None)
+            if self._stream is not None:
+                self._emit_finished(node, owner["calls"])
+            elif self._tail is not None:
+                self._tail_unit(node, owner["calls"])
+            self._dirty = True
+
+    def _open_stream(self):
+        from pytraceflow_stream import open_sender
+
+        self._stream = open_sender(self._stream_spec, queue_size=self._stream_queue)
+        self._stream.start(self._stream_fields(self._root_entry))
+
+    def _close_stream(self):
+        stream, self._stream = self._stream, None
+        # frames still running (or marked failed by run()) end with the process
+        for entry, _started in list(self._inflight.values()):
+            stream.put(self._return_event(entry))
+        stream.close(self._stream_fields(self._root_entry))
+        if stream.dropped and self._verbose:
+            sys.stderr.write(
+                f"[FlowTrace pid={os.getpid()}] stream dropped {stream.dropped} events\n"
+            )
+            sys.stderr.flush()
+
+    @staticmethod
+    def _stream_fields(node):
+        return {key: val for key, val in node.items() if key != "calls"}
+
+    @staticmethod
+    def _return_event(entry):
+        return (
+            "r",
+            entry["id"],
+            entry.get("duration_ms"),
+            entry.get("output"),
+            entry.get("error"),
+            entry.get("inputs_after"),
+            entry.get("memory_after"),
+        )
+
+    def _emit_node(self, parent, node):
+        self._stream.put(
+            ("n", parent.get("id") if parent is not None else None, self._stream_fields(node))
+        )
+
+    def _emit_finished(self, node, owner_calls):
+        self._stream.put(("u", node["id"], self._stream_fields(node)))
+        self._detach(owner_calls, node)
+
+    def _stream_return(self, entry, stack):
+        self._stream.put(self._return_event(entry))
+        # the collector owns finished subtrees; only the live spine stays in memory
+        owner = stack[-1] if stack else None
+        if owner is not None and self._detach(owner["calls"], entry):
+            return
+        instance_root = self._instance_roots.get(entry.get("instance_id"))
+        if instance_root is not None and self._detach(instance_root["calls"], entry):
+            return
+        self._detach(self.records, entry)
+
+    @staticmethod
+    def _detach(calls, node):
+        if calls and calls[-1] is node:
+            calls.pop()
+            return True
+        for index in range(len(calls) - 1, -1, -1):
+            if calls[index] is node:
+                del calls[index]
+                return True
+        return False
+
+    def _tail_unit(self, node, calls):
+        """Run a finished unit of work through the tail sampler; a dropped unit leaves the tree."""
+        keep, count = self._tail.decide(node)
+        if keep:
+            return
+        if not self._detach(calls, node):
+            instance_root = self._instance_roots.get(node.get("instance_id"))
+            if instance_root is not None:
+                self._detach(instance_root["calls"], node)
+        self._node_count -= count
+
+    def _fold_run(self, entry, stack):
+        """Fold a finished call into the previous sibling when both have the same shape.
+
+        The first call of a run keeps its payloads and subtree; later ones only
+        add to its count and duration stats (plus "durations" with --run-durations).
+        """
+        if entry.get("error") is not None:
+            return
+        calls = stack[-1]["calls"] if stack else self.records
+        if not calls or calls[-1] is not entry:
+            instance_root = self._instance_roots.get(entry.get("instance_id"))
+            if instance_root is None:
+                return
+            calls = instance_root["calls"]
+            if not calls or calls[-1] is not entry:
+                return
+        if len(calls) < 2:
+            return
+        first = calls[-2]
+        # a sibling still running on another thread has no duration yet
+        if first.get("duration_ms") is None:
+            return
+        size = _run_shape_size(first, entry)
+        if not size:
+            return
+        calls.pop()
+        duration = entry["duration_ms"]
+        run = first.get("run")
+        if run is None:
+            took = first["duration_ms"]
+            run = {"count": 1, "sum_ms": took, "min_ms": took, "max_ms": took, "mean_ms": took}
+            if self._run_durations:
+                run["durations"] = [took]
+            first["run"] = run
+            self._runs += 1
+        run["count"] += 1
+        run["sum_ms"] = round(run["sum_ms"] + duration, 3)
+        run["min_ms"] = min(run["min_ms"], duration)
+        run["max_ms"] = max(run["max_ms"], duration)
+        run["mean_ms"] = round(run["sum_ms"] / run["count"], 3)
+        if "durations" in run:
+            run["durations"].append(duration)
+        # the run node stands for the time of every call it holds
+        first["duration_ms"] = run["sum_ms"]
+        self._run_folded += 1
+        self._node_count -= size
+
+    def _open_values(self, root):
+        """Fresh value table for a new trace, serialized as root["values"]."""
+        if not self._intern_values:
+            return
+        from pytraceflow_values import ValueTable
+
+        self._values = ValueTable(self._intern_values)
+        root["values"] = self._values.values
+
+    def _run_report(self):
+        return {"runs": self._runs, "folded_calls": self._run_folded}
+
+    def _alloc_id(self):
+        # itertools.count is atomic under the GIL, unlike "self._next_id += 1"
+        node_id = next(self._ids)
+        self._next_id = node_id + 1
+        return node_id
+
+    def _code_key(self, frame):
+        code = frame.f_code
+        key = self._code_keys.get(code)
+        if key is None:
+            qualname = getattr(code, "co_qualname", code.co_name)
+            key = f"{frame.f_globals.get('__name__', '')}:{qualname}"
+            self._code_keys[code] = key
+        return key
+
+    def _aggregate_enter(self, frame, frame_id):
+        self._agg_inflight[frame_id] = (self._code_key(frame), time.time())
+        self._agg_calls += 1
+        if self._degrade_at is not None and self._node_count + self._agg_calls >= self._degrade_at:
+            self._update_degradation()
+
+    def _aggregate_exit(self, frame_id, event):
+        item = self._agg_inflight.pop(frame_id, None)
+        if item is None:
+            return
+        key, started = item
+        self._add_aggregate(key, (time.time() - started) * 1000, event == "exception")
+
+    def _add_aggregate(self, key, elapsed_ms, error=False, count=1):
+        stats = self._aggregates.get(key)
+        if stats is None:
+            stats = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0}
+            self._aggregates[key] = stats
+        stats["count"] += count
+        stats["total_ms"] = round(stats["total_ms"] + elapsed_ms, 3)
+        if elapsed_ms > stats["max_ms"]:
+            stats["max_ms"] = round(elapsed_ms, 3)
+        if error:
+            stats["errors"] += 1
+        self._dirty = True
+
+    def _init_budget(self, root):
+        if self._max_nodes <= 0 and self._max_bytes <= 0:
+            return
+        root["degradation"] = {
+            "level": 0,
+            "mode": DEGRADE_MODES[0],
+            "max_nodes": self._max_nodes or None,
+            "max_bytes": self._max_bytes or None,
+            "transitions": [],
+        }
+        self._degrade_at = self._next_degrade_at()
+
+    def _budget_node_limit(self):
+        limits = []
+        if self._max_nodes > 0:
+            limits.append(self._max_nodes)
+        if self._max_bytes > 0:
+            # estimate node capacity from the last snapshot size
+            if self._flush_node_count:
+                per_node = self._last_snapshot_bytes / self._flush_node_count
+            else:
+                per_node = _DEFAULT_NODE_BYTES
+            limits.append(max(int(self._max_bytes / max(per_node, 1.0)), 1))
+        return min(limits) if limits else None
+
+    def _next_degrade_at(self):
+        limit = self._budget_node_limit()
+        if limit is None or self._degrade_level >= len(_DEGRADE_FRACTIONS):
+            return None
+        return int(limit * _DEGRADE_FRACTIONS[self._degrade_level])
+
+    def _update_degradation(self):
+        limit = self._budget_node_limit()
+        if limit is None:
+            self._degrade_at = None
+            return
+        while (
+            self._degrade_level < len(_DEGRADE_FRACTIONS)
+            and self._node_count + self._agg_calls >= int(limit * _DEGRADE_FRACTIONS[self._degrade_level])
+        ):
+            self._set_degrade_level(self._degrade_level + 1)
+        self._degrade_at = self._next_degrade_at()
+
+    def _set_degrade_level(self, level):
+        self._degrade_level = level
+        mode = DEGRADE_MODES[level]
+        self._apply_detail()
+        if level >= 3:
+            self._compact_to_spine()
+        if self._root_entry is not None:
+            info = self._root_entry.setdefault("degradation", {"transitions": []})
+            info["level"] = level
+            info["mode"] = mode
+            info["transitions"].append(
+                {
+                    "level": level,
+                    "mode": mode,
+                    "from_id": self._next_id,
+                    "elapsed_ms": self._elapsed_ms(),
+                    "nodes": self._node_count,
+                    "aggregated_calls": self._agg_calls,
+                }
+            )
+        self._dirty = True
+        if self._verbose or self._log_flushes:
+            sys.stderr.write(
+                f"[FlowTrace pid={os.getpid()}] trace budget reached: degrading to {mode} "
+                f"(from id={self._next_id} nodes={self._node_count})\n"
+            )
+            sys.stderr.flush()
+
+    def _apply_detail(self):
+        """Capture switches implied by the budget level and the governor level together."""
+        payloads = self._degrade_level < 1 and self._governor_level < 2
+        self._payloads_allowed = payloads
+        self._memory_allowed = self._governor_level < 1
+        self._capture_inputs_enabled = self._capture_inputs_config and payloads
+        self._capture_outputs_enabled = self._capture_outputs_config and payloads
+        self._capture_memory = self._capture_memory_config and self._memory_allowed
+        aggregate = self._degrade_level >= 2 or self._governor_level >= 3
+        if aggregate and not self._aggregate_mode and self._root_entry is not None:
+            self._root_entry["aggregates"] = self._aggregates
+        # calls already in flight keep their full entries; new ones follow the mode
+        self._aggregate_mode = aggregate
+
+    def _init_governor(self, root):
+        if self._max_overhead_pct <= 0:
+            return
+        root["overhead_governor"] = {
+            "max_overhead_pct": self._max_overhead_pct,
+            "window_s": self._overhead_window,
+            "level": 0,
+            "mode": GOVERNOR_MODES[0],
+            "transitions": [],
+        }
+
+    def _governor_window(self):
+        """Tracer cost over the last window as a percentage of the application's own time."""
+        now = time.perf_counter_ns()
+        flush_ns = self._ov_flush_serialize_ns + self._ov_flush_write_ns
+        mark = (now, self._ov_events, self._ov_sampled, self._ov_hook_ns, flush_ns)
+        prev, self._gov_mark = self._gov_mark, mark
+        if prev is None:
+            return None
+        wall_ns = now - prev[0]
+        events = mark[1] - prev[1]
+        sampled = mark[2] - prev[2]
+        if sampled:
+            ns_per_event = (mark[3] - prev[3]) / sampled
+            if not self._gov_warm:
+                # warm-up window: cold-path samples would force a shed at startup
+                self._gov_warm = True
+                return None
+            if self._gov_ns_per_event is None:
+                self._gov_ns_per_event = ns_per_event
+            else:
+                self._gov_ns_per_event += _GOVERNOR_SMOOTHING * (ns_per_event - self._gov_ns_per_event)
+        if self._gov_ns_per_event is None:
+            return None
+        # the estimate cannot exceed the window itself
+        tracer_ns = min(self._gov_ns_per_event * events + (flush_ns - prev[4]), wall_ns)
+        app_ns = max(wall_ns - tracer_ns, wall_ns * 0.01, 1)
+        return min(tracer_ns / app_ns * 100, _GOVERNOR_MAX_PCT)
+
+    def _govern(self, pct):
+        level = self._governor_level
+        if pct > self._max_overhead_pct:
+            self._gov_calm_windows = 0
+            if level + 1 < len(GOVERNOR_MODES):
+                self._set_governor_level(level + 1, pct)
+            return
+        if level and pct < self._max_overhead_pct * _GOVERNOR_RECOVER_FRACTION:
+            self._gov_calm_windows += 1
+            if self._gov_calm_windows >= _GOVERNOR_RECOVER_WINDOWS:
+                self._gov_calm_windows = 0
+                self._set_governor_level(level - 1, pct)
+        else:
+            self._gov_calm_windows = 0
+
+    def _set_governor_level(self, level, pct):
+        shed = level > self._governor_level
+        self._governor_level = level
+        mode = GOVERNOR_MODES[level]
+        self._apply_detail()
+        transition = {
+            "level": level,
+            "mode": mode,
+            "action": "shed" if shed else "recover",
+            "from_id": self._next_id,
+            "elapsed_ms": self._elapsed_ms(),
+            "overhead_pct": round(pct, 2),
+        }
+        with self._write_lock:
+            info = self._root_entry.setdefault("overhead_governor", {"transitions": []})
+            info["level"] = level
+            info["mode"] = mode
+            info["transitions"].append(transition)
+            self._dirty = True
+        stream = self._stream
+        if stream is not None:
+            stream.put(("u", self._root_entry["id"], {"overhead_governor": json.loads(json.dumps(info))}))
+        if self._verbose or self._log_flushes:
+            sys.stderr.write(
+                f"[FlowTrace pid={os.getpid()}] overhead {pct:.1f}% "
+                f"{'over' if shed else 'under'} cap {self._max_overhead_pct}%: "
+                f"{'shedding' if shed else 'recovering'} to {mode} (from id={self._next_id})\n"
+            )
+            sys.stderr.flush()
+
+    def _governor_loop(self):
+        sys.setprofile(None)
+        stop = self._stop_flush
+        self._gov_mark = None
+        self._governor_window()
+        while not stop.wait(self._overhead_window):
+            try:
+                pct = self._governor_window()
+                if pct is not None:
+                    self._govern(pct)
+            except Exception:
+                pass
+
+    def _compact_to_spine(self):
+        """Drop completed, error-free subtrees, keeping the in-flight spine and errors."""
+        keep = {id(entry) for entry, _ in self._inflight.values()}
+        with self._write_lock:
+            for root in self.records:
+                self._compact_node(root, keep)
+        self._instance_roots.clear()
+
+    def _compact_node(self, node, keep):
+        kept = []
+        for child in node.get("calls", []):
+            if self._compact_node(child, keep) or id(child) in keep or child.get("error"):
+                kept.append(child)
+            else:
+                self._fold_node(child)
+        node["calls"] = kept
+        return bool(kept)
+
+    def _fold_node(self, node):
+        called = node.get("called")
+        name = node.get("callable")
+        if called and called != name and name != "__instance__":
+            name = f"{called}.{name}"
+        self._add_aggregate(
+            f"{node.get('module', '')}:{name}", node.get("duration_ms") or 0.0
+        )
+        self._node_count -= 1
+        for child in node.get("calls", []):
+            self._fold_node(child)
+
+    def _elapsed_ms(self):
+        if self._run_started is None:
+            return None
+        return round((time.perf_counter() - self._run_started) * 1000, 3)
+
+    def _run_task(self, task, args, kwargs):
+        """Run a pool task under its own root linked to the submitting call."""
+        func = task.func
+        started = time.time()
+        info = {
+            "parent_pid": task.parent_pid,
+            "parent_call_id": task.parent_call_id,
+            "worker_pid": os.getpid(),
+            "queue_ms": round((started - task.submitted) * 1000, 3),
+            "run_ms": None,
+        }
+        root = {
+            "id": self._alloc_id(),
+            "callable": getattr(func, "__name__", type(func).__name__),
+            "module": getattr(func, "__module__", "") or "",
+            "called": "__task__",
+            "inputs": {},
+            "output": None,
+            "error": None,
+            "duration_ms": None,
+            "task": info,
+            "calls": [],
+        }
+        self._node_count += 1
+        self._pending_new_records += 1
+        self.records.append(root)
+        if self._stream is not None:
+            self._emit_node(None, root)
+        if not self._task_worker:
+            self._task_worker = True
+            self._install_sigterm_flush()
+        saved_stack = self._stack
+        self._stack = [root]
+        self._dirty = True
+        try:
+            return func(*args, **kwargs)
+        except BaseException as exc:
+            root["error"] = repr(exc)
+            raise
+        finally:
+            run_ms = round((time.time() - started) * 1000, 3)
+            info["run_ms"] = run_ms
+            root["duration_ms"] = run_ms
+            self._stack = saved_stack
+            if self._stream is not None:
+                self._emit_finished(root, self.records)
+            elif self._tail is not None:
+                self._tail_unit(root, self.records)
+            self._dirty = True
+            self._maybe_flush(current=root["callable"], log=False)
+
+    def _install_sigterm_flush(self):
+        """Flush before dying when a pool terminates its workers with SIGTERM."""
+        import signal
+
+        if not hasattr(signal, "SIGTERM"):
+            return
+        if threading.current_thread() is not threading.main_thread():
+            return
+        if signal.getsignal(signal.SIGTERM) is not signal.SIG_DFL:
+            return
+
+        def _on_sigterm(signum, frame):
+            self.stop_live()
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+
+        self._sigterm_handler = _on_sigterm
+        signal.signal(signal.SIGTERM, _on_sigterm)
+
+    def _restore_sigterm(self):
+        handler, self._sigterm_handler = self._sigterm_handler, None
+        if handler is None or threading.current_thread() is not threading.main_thread():
+            return
+        import signal
+
+        # only undo our own handler; one installed by the program since stays
+        if signal.getsignal(signal.SIGTERM) is handler:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    def run(self):
+        script_name = self.script_path.name
+        self._begin_profile(script_name)
+        old_argv = sys.argv
+        # emula la ejecucion normal del script, permitiendo argumentos personalizados
+        sys.argv = [str(self.script_path)] + self.script_args
+        exc_raised: BaseException | None = None
+        try:
+            import runpy
+
+            runpy.run_path(str(self.script_path), run_name="__main__")
+        except BaseException as exc:  # capturamos para reflejar error en la raiz
+            exc_raised = exc
+            self._root_entry["error"] = repr(exc)
+            self._root_entry["output"] = None
+            # marca como error cualquier frame inflight (p.ej. validate_config)
+            now = time.time()
+            for entry, started in list(self._inflight.values()):
+                entry["output"] = None
+                entry["error"] = repr(exc)
+                entry["duration_ms"] = round((now - started) * 1000, 3)
+                entry["memory_after"] = self._memory_snapshot()
+            self._propagate_error(self._root_entry, repr(exc))
+        finally:
+            sys.argv = old_argv
+            self._end_profile(self.script_path.name, exc_raised)
+            print()
+
+    def _prune_calls(self, node):
+        prune_calls(node)
+
+    def _propagate_error(self, node, exc_repr):
+        if node.get("output") is None and node.get("error") is None:
+            node["error"] = exc_repr
+        for child in node.get("calls", []):
+            self._propagate_error(child, exc_repr)
+
+    def start_live(self):
+        """Start profiling the current process (for multiprocessing autotrace)."""
+        if self._live_mode_started:
+            return
+        script_name = Path(sys.argv[0]).name or "__process__"
+        self._live_mode_started = True
+        self._begin_profile(script_name)
+
+    def stop_live(self):
+        """Stop profiling the current process (safe to call multiple times)."""
+        if not self._live_mode_started or self._live_mode_stopped:
+            return
+        self._live_mode_stopped = True
+        try:
+            self._end_profile(Path(sys.argv[0]).name or "__process__", None)
+        except Exception:
+            # Avoid raising during atexit
+            pass
+
+    def _begin_scopes(self):
+        """Open the output of trace()/@traced scopes; the hook is only set inside a scope."""
+        self._open_trace(Path(sys.argv[0]).name if sys.argv and sys.argv[0] else "__process__", link=False)
+        self._root_entry["scopes"] = 0
+        # open scopes per context, not per thread: concurrent @traced coroutines on
+        # one event loop each see their own stack (like pytraceflow_web's requests)
+        import contextvars
+
+        self._scope_stack = contextvars.ContextVar(f"pytraceflow_scope_{id(self)}", default=None)
+        profile = self._profile
+        current = self._scope_stack.get
+
+        def _scope_hook(frame, event, arg):
+            state = current()
+            if state is not None and id(frame) not in state[1]:
+                profile(frame, event, arg, state[0])
+
+        self._scope_hook = _scope_hook
+        self._install_dump_signal()
+        self._stop_flush.clear()
+        self._start_threads()
+
+    def _enter_scope(self, name, module, frame):
+        """Open a `__scope__` node under the current call of this context and set the hook.
+
+        `frame` runs the scope body. Returns the node and the token that restores
+        the enclosing scope on exit.
+        """
+        tls = self._tls
+        outer = (self._scope_stack.get() or (None,))[0]
+        parent = outer[-1] if outer else self._root_entry
+        started = time.time()
+        node = {
+            "id": self._alloc_id(),
+            "callable": name,
+            "module": module,
+            "called": "__scope__",
+            "caller": f"{parent.get('called')}::{parent.get('callable')}" if outer else None,
+            "inputs": {},
+            "output": None,
+            "error": None,
+            "duration_ms": None,
+            "scope": {"thread": threading.current_thread().name},
+            "calls": [],
+        }
+        parent["calls"].append(node)
+        # in-flight like a call, so a rotation keeps the open scope in the next segment
+        self._inflight[id(node)] = (node, started)
+        self._root_entry["scopes"] += 1
+        self._node_count += 1
+        self._pending_new_records += 1
+        self._dirty = True
+        if self._stream is not None:
+            self._emit_node(parent, node)
+        # a resumed task re-enters the coroutines that awaited this scope; they are not in it
+        outside = set()
+        while frame is not None:
+            outside.add(id(frame))
+            frame = frame.f_back
+        stack = [node]
+        token = self._scope_stack.set((stack, outside))
+        self._thread_stacks[threading.get_ident()] = stack
+        # one hook per thread while any scope is open on it
+        open_scopes = getattr(tls, "open_scopes", 0)
+        if not open_scopes:
+            tls.scope_previous = sys.getprofile()
+            if tls.scope_previous is not self._scope_hook:
+                sys.setprofile(self._scope_hook)
+        tls.open_scopes = open_scopes + 1
+        return node, token
+
+    def _exit_scope(self, node, token, exc=None):
+        tls = self._tls
+        tls.open_scopes -= 1
+        if not tls.open_scopes:
+            # restore first, so the bookkeeping below runs without the hook
+            previous, tls.scope_previous = tls.scope_previous, None
+            if sys.getprofile() is not previous:
+                sys.setprofile(previous)
+        started = self._inflight.pop(id(node), (None, time.time()))[1]
+        node["duration_ms"] = round((time.time() - started) * 1000, 3)
+        if exc is not None:
+            node["error"] = repr(exc)
+            self._propagate_error(node, node["error"])
+        try:
+            self._scope_stack.reset(token)
+        except ValueError:
+            # an async generator resumed from another task: drop back to no scope
+            self._scope_stack.set(None)
+        stack = (self._scope_stack.get() or (None,))[0]
+        if stack:
+            self._thread_stacks[threading.get_ident()] = stack
+        elif not tls.open_scopes:
+            self._thread_stacks.pop(threading.get_ident(), None)
+        parent = stack[-1] if stack else self._root_entry
+        if self._stream is not None:
+            self._emit_finished(node, parent["calls"])
+        elif self._tail is not None and not stack:
+            self._tail_unit(node, parent["calls"])
+        self._dirty = True
+        self._maybe_flush(force=self._flush_every_call, current=node["callable"], log=False)
+
+    def _close_scopes(self):
+        if self._profile_ended:
+            return
+        # _end_profile clears the hook; keep whatever else is profiling this thread
+        current = sys.getprofile()
+        try:
+            self._end_profile(self._root_entry.get("callable", "__process__"), None)
+        except Exception:
+            pass
+        if current is not getattr(self, "_scope_hook", None):
+            sys.setprofile(current)
+
+    def _write_output(self, payload, seq=None):
+        with self._output_lock:
+            if seq is not None:
+                if seq < self._written_seq:
+                    # stale: a newer snapshot is already on disk
+                    return
+                self._written_seq = seq
+            with open(self.output_path, "w", encoding="utf-8", newline="") as f:
+                f.write(payload)
+                f.flush()
+
+    def _segment_path(self, index):
+        base = self._base_output_path
+        return base.with_name(f"{base.stem}.seg{index:04d}{base.suffix or '.json'}")
+
+    def _manifest_path(self):
+        base = self._base_output_path
+        return base.with_name(f"{base.stem}.manifest.json")
+
+    def _open_segment(self):
+        self._segment_index += 1
+        self._segment_started = time.time()
+        self.output_path = self._segment_path(self._segment_index)
+        self._segments.append(
+            {
+                "index": self._segment_index,
+                "path": self.output_path.name,
+                "started": self._segment_started,
+                "ended": None,
+                "bytes": None,
+                "roots": None,
+            }
+        )
+        self._write_manifest()
+
+    def _close_segment(self):
+        info = self._segments[-1]
+        info["ended"] = time.time()
+        info["bytes"] = self._last_snapshot_bytes
+        info["roots"] = len(self._root_entry.get("calls", [])) if self._root_entry else 0
+
+    def _write_manifest(self):
+        manifest = {
+            "pid": os.getpid(),
+            "script": str(self._root_entry.get("callable")) if self._root_entry else None,
+            "retain_segments": self._retain_segments or None,
+            "segments": self._segments,
+        }
+        path = self._manifest_path()
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def _segment_due(self, now, snapshot_bytes):
+        if self._segment_started is None:
+            return False
+        if self._rotate_bytes and snapshot_bytes >= self._rotate_bytes:
+            return True
+        if self._rotate_seconds > 0 and now - self._segment_started >= self._rotate_seconds:
+            return True
+        if self._rotate_roots and len(self._root_entry.get("calls", [])) >= self._rotate_roots:
+            return True
+        return False
+
+    def _rotate_segment(self):
+        """Close the current segment and continue in a new one with the in-flight spine."""
+        self._rotate_pending = False
+        with self._write_lock:
+            self._root_entry["duration_ms"] = round(
+                (time.time() - self._segment_started) * 1000, 3
+            )
+            snapshot = json.dumps(self.records, ensure_ascii=True, separators=(",", ":"))
+            self._last_snapshot_bytes = len(snapshot.encode("utf-8"))
+            self._snapshot_seq += 1
+            self._write_output(snapshot, self._snapshot_seq)
+            self._close_segment()
+            # the snapshot is written, so the root can be reset in place; anything
+            # holding a reference to it (stacks, task wrappers) stays valid
+            keep = {id(entry) for entry, _ in self._inflight.values()}
+            root = self._root_entry
+            root["duration_ms"] = None
+            root["segment"] = self._segment_index + 1
+            root["continues"] = self.output_path.name
+            self._node_count = self._keep_spine(root, keep) - 1
+            if "aggregates" in root:
+                self._aggregates = {}
+                root["aggregates"] = self._aggregates
+            self._agg_calls = 0
+            running_tasks = [
+                task for task in self.records[1:] if task.get("duration_ms") is None
+            ]
+            for task in running_tasks:
+                task["continued"] = True
+                self._node_count += self._keep_spine(task, keep)
+            self.records = [root] + running_tasks
+            # instances with a call still running keep grouping their calls
+            for instance_id in [
+                key for key, entry in self._instance_roots.items() if not entry["calls"]
+            ]:
+                del self._instance_roots[instance_id]
+            if self._values is not None:
+                # each segment only carries the values its own nodes refer to: the
+                # whole kept spine (instances, running tasks), not just in-flight calls
+                self._values.retain(self._spine_nodes())
+            self._flush_node_count = self._node_count
+            self._open_segment()
+            self._apply_retention()
+            self._dirty = True
+        if self._log_flushes:
+            sys.stderr.write(
+                f"[FlowTrace pid={os.getpid()}] Rotated trace to {self.output_path} "
+                f"(segment#{self._segment_index})\n"
+            )
+            sys.stderr.flush()
+
+    def _spine_nodes(self):
+        pending = list(self.records)
+        pending.extend(entry for entry, _ in self._inflight.values())
+        while pending:
+            node = pending.pop()
+            yield node
+            pending.extend(node.get("calls", ()))
+
+    def _keep_spine(self, node, keep):
+        """Trim `node` to the in-flight calls and their ancestors (e.g. __instance__).
+
+        Kept children are marked "continued": the previous segment already has
+        them under the same id. Returns the kept node count.
+        """
+        count = 1
+        kept = []
+        for child in node.get("calls", []):
+            size = self._keep_spine(child, keep)
+            if id(child) in keep or child["calls"]:
+                child["continued"] = True
+                kept.append(child)
+                count += size
+        node["calls"] = kept
+        return count
+
+    def _apply_retention(self):
+        if self._retain_segments <= 0:
+            return
+        while len(self._segments) > self._retain_segments:
+            old = self._segments.pop(0)
+            try:
+                (self._base_output_path.parent / old["path"]).unlink()
+            except OSError:
+                pass
+        self._write_manifest()
+
+    def _maybe_flush(self, force=False, current=None, log=None):
+        if self._stream is not None:
+            return
+        if self._rotate_pending and threading.get_ident() == self._hook_thread:
+            self._rotate_segment()
+        if log is None:
+            log = self._log_flushes
+        if self._profile_ended and not force:
+            # the final snapshot is written (or being written) by _end_profile
+            return
+        now = time.time()
         time_ready = self._flush_interval > 0 and now - self._last_flush >= self._flush_interval
         threshold_ready = (
             self._flush_call_threshold > 0
@@ -407,9 +2346,24 @@ class PyFlowTraceProfiler:
                 )
                 if not self._dirty or not (time_ready or threshold_ready):
                     return
+            if self._tail is not None:
+                self._root_entry["tail_sampling"] = self._tail.report()
+            if self._watchdog_thread is not None:
+                self._root_entry["deadlines"] = self._deadline_report()
+            if self._fold_runs:
+                self._root_entry["run_folding"] = self._run_report()
+            if self._values is not None:
+                self._root_entry["value_interning"] = self._values.report()
+            if self._measure_overhead:
+                self._root_entry["overhead"] = self._overhead_report()
+                serialize_started = time.perf_counter_ns()
             snapshot = json.dumps(
                 self.records, ensure_ascii=True, separators=(",", ":")
             )
+            if self._measure_overhead:
+                self._ov_flush_serialize_ns += time.perf_counter_ns() - serialize_started
+            self._snapshot_seq += 1
+            seq = self._snapshot_seq
             snapshot_bytes = len(snapshot.encode("utf-8"))
             current_call = (
                 current
@@ -422,6 +2376,10 @@ class PyFlowTraceProfiler:
             self._pending_new_records = 0
             self._flush_count += 1
             self._last_snapshot_bytes = snapshot_bytes
+            self._flush_node_count = self._node_count
+            if self._degrade_at is not None:
+                # re-estimate capacity; the hook applies the level on its next event
+                self._degrade_at = self._next_degrade_at()
         total_nodes = max(self._next_id - 1, 0)
         if log:
             sys.stderr.write(
@@ -429,9 +2387,21 @@ class PyFlowTraceProfiler:
                 f"(flush#{self._flush_count} size={self._last_snapshot_bytes}B roots={len(self.records)} nodes={total_nodes})\n"
             )
             sys.stderr.flush()
-        self._write_output(snapshot)
+        if self._measure_overhead:
+            write_started = time.perf_counter_ns()
+            self._write_output(snapshot, seq)
+            self._ov_flush_write_ns += time.perf_counter_ns() - write_started
+        else:
+            self._write_output(snapshot, seq)
+        if self._rotating and self._segment_due(now, snapshot_bytes):
+            # the tree is only reshaped from the hook thread to avoid racing its appends
+            if threading.get_ident() == self._hook_thread:
+                self._rotate_segment()
+            else:
+                self._rotate_pending = True
 
     def _flush_loop(self):
+        sys.setprofile(None)
         while not self._stop_flush.is_set():
             try:
                 self._maybe_flush(log=False)
@@ -440,6 +2410,7 @@ class PyFlowTraceProfiler:
             self._stop_flush.wait(self._flush_interval)
 
     def _heartbeat_loop(self):
+        sys.setprofile(None)
         interval = self._flush_interval if self._flush_interval > 0 else 5.0
         interval = max(interval, 5.0)
         while not self._stop_flush.is_set():
@@ -448,19 +2419,248 @@ class PyFlowTraceProfiler:
                 msg = (
                     f"[FlowTrace pid={os.getpid()}] heartbeat roots={len(self.records)} nodes={total_nodes} "
                     f"inflight={len(self._inflight)} "
-                    f"pending_flush={self._pending_new_records} "
-                    f"flushes={self._flush_count} "
-                    f"last_snapshot_bytes={self._last_snapshot_bytes} "
-                    f"since_last_flush={time.time() - self._last_flush:.1f}s"
                 )
+                stream = self._stream
+                if stream is not None:
+                    msg += (
+                        f"streamed={stream.sent} queued={stream.queued} "
+                        f"dropped={stream.dropped}"
+                    )
+                else:
+                    msg += (
+                        f"pending_flush={self._pending_new_records} "
+                        f"flushes={self._flush_count} "
+                        f"last_snapshot_bytes={self._last_snapshot_bytes} "
+                        f"since_last_flush={time.time() - self._last_flush:.1f}s"
+                    )
+                if self._measure_overhead:
+                    msg += " " + self._overhead_summary()
+                if self._governor_level:
+                    msg += f" governor={GOVERNOR_MODES[self._governor_level]}"
+                if self._tail is not None:
+                    msg += f" tail_kept={self._tail.kept}/{self._tail.units}"
+                if self._deadline_alerts:
+                    msg += f" deadline_alerts={self._deadline_alerts}"
+                if self._run_folded:
+                    msg += f" runs_folded={self._run_folded}"
+                if self._degrade_level:
+                    info = self._root_entry.get("degradation", {})
+                    first = (info.get("transitions") or [{}])[0]
+                    msg += (
+                        f" degraded={DEGRADE_MODES[self._degrade_level]}"
+                        f" since_id={first.get('from_id')}"
+                    )
                 sys.stderr.write(msg + "\n")
                 sys.stderr.flush()
             except Exception:
                 pass
             self._stop_flush.wait(interval)
 
-    def _begin_profile(self, script_name: str):
-        self._root_entry = {
+    def _install_dump_signal(self):
+        if self._dump_signal is None:
+            return
+        import signal
+
+        if threading.current_thread() is not threading.main_thread():
+            sys.stderr.write("[FlowTrace] in-flight dumps need the main thread; dump signal not installed\n")
+            return
+        self._dump_previous = signal.signal(self._dump_signal, self._on_dump_signal)
+
+    def _restore_dump_signal(self):
+        previous, self._dump_previous = self._dump_previous, None
+        if previous is None or threading.current_thread() is not threading.main_thread():
+            return
+        import signal
+
+        signal.signal(self._dump_signal, previous)
+
+    def _on_dump_signal(self, signum, frame):
+        try:
+            path = self.dump_inflight()
+        except Exception as exc:
+            sys.stderr.write(f"[FlowTrace pid={os.getpid()}] in-flight dump failed: {exc}\n")
+            return
+        sys.stderr.write(f"[FlowTrace pid={os.getpid()}] in-flight dump -> {path}\n")
+        sys.stderr.flush()
+
+    def _open_stacks(self, frames):
+        """{thread ident: stack of open nodes} for the threads alive in `frames`."""
+        stacks = {self._hook_thread: self._stack} if self._hook_thread is not None else {}
+        for ident in list(self._thread_stacks):
+            if ident not in frames:
+                # thread is gone; its ident may be reused
+                self._thread_stacks.pop(ident, None)
+        stacks.update(self._thread_stacks)
+        return stacks
+
+    def _deadline_for(self, entry):
+        key = (entry.get("module"), entry.get("callable"))
+        limit = self._deadline_cache.get(key)
+        if limit is None:
+            from fnmatch import fnmatchcase
+
+            name = f"{key[0]}:{key[1]}"
+            limit = next(
+                (ms for pattern, ms in self._deadlines if fnmatchcase(name, pattern)), self._deadline_ms
+            )
+            self._deadline_cache[key] = limit
+        return limit
+
+    def _deadline_report(self):
+        return {
+            "default_ms": self._deadline_ms,
+            "rules": [[pattern, ms] for pattern, ms in self._deadlines],
+            "alerts": self._deadline_alerts,
+        }
+
+    def _watchdog_loop(self):
+        sys.setprofile(None)
+        limits = [ms for _, ms in self._deadlines if ms > 0]
+        if self._deadline_ms > 0:
+            limits.append(self._deadline_ms)
+        # a few scans per shortest deadline, within 50ms..1s
+        interval = min(max(min(limits) / 4000.0, 0.05), 1.0)
+        while not self._stop_flush.wait(interval):
+            try:
+                self._watchdog_scan()
+            except Exception:
+                pass
+
+    def _watchdog_scan(self):
+        """Check the open calls (never the tree) against their deadlines; each is reported once."""
+        now = time.time()
+        inflight = list(self._inflight.items())
+        alerted = self._deadline_alerted
+        if alerted:
+            # finished calls leave; their ids can be reused by new entries
+            alerted.intersection_update(id(entry) for _, (entry, _started) in inflight)
+        late = []
+        for frame_id, (entry, started) in inflight:
+            if id(entry) in alerted or entry.get("called") == "__thread__":
+                continue
+            limit = self._deadline_for(entry)
+            elapsed_ms = (now - started) * 1000
+            if limit > 0 and elapsed_ms > limit:
+                alerted.add(id(entry))
+                late.append((frame_id, entry, limit, elapsed_ms))
+        if not late:
+            return
+        frames = sys._current_frames()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        positions = {}
+        for ident, stack in self._open_stacks(frames).items():
+            stack = list(stack)
+            for index, node in enumerate(stack):
+                positions[id(node)] = (ident, stack, index)
+        for frame_id, entry, limit, elapsed_ms in late:
+            self._deadline_alert(frame_id, entry, limit, elapsed_ms, positions.get(id(entry)), frames, names)
+
+    def _deadline_alert(self, frame_id, entry, limit, elapsed_ms, position, frames, names):
+        ident, stack, index = position or (None, [entry], 0)
+        chain = [f"{node.get('module')}:{node.get('callable')}" for node in stack[: index + 1]]
+        inputs = entry.get("inputs")
+        frame = frames.get(ident)
+        while frame is not None and id(frame) != frame_id:
+            frame = frame.f_back
+        if frame is not None:
+            caps = self._policy_caps(frame) if self._policy is not None else _NO_CAPS
+            enabled = self._capture_inputs_enabled if caps[0] is None else caps[0]
+            if enabled:
+                # one look at the arguments as they are now, while the call is stuck
+                try:
+                    inputs = self._capture_inputs(frame, enabled)
+                except Exception:
+                    pass
+        alert = {
+            "deadline_ms": limit,
+            "elapsed_ms": round(elapsed_ms, 3),
+            "thread": names.get(ident),
+            "chain": chain,
+            "inputs": inputs,
+            "at": time.time(),
+        }
+        entry["deadline"] = alert
+        self._deadline_alerts += 1
+        self._dirty = True
+        if self._stream is not None:
+            self._stream.put(("u", entry["id"], {"deadline": alert}))
+        sys.stderr.write(
+            f"[FlowTrace pid={os.getpid()}] deadline: {chain[-1]} running {elapsed_ms:.0f}ms > {limit:g}ms "
+            f"(thread {alert['thread']}) via {' > '.join(chain)}\n"
+        )
+        sys.stderr.flush()
+
+    def _inflight_path(self):
+        base = self._base_output_path
+        return base.with_name(f"{base.stem}.inflight.json")
+
+    def dump_inflight(self, path=None):
+        """Write the open calls of every thread, with elapsed times; returns the path.
+
+        Only the in-flight chains are copied (ids, names, start times), never the
+        record tree, so it is cheap enough to run from a signal handler.
+        """
+        now = time.time()
+        started_at = {id(entry): started for entry, started in list(self._inflight.values())}
+        root = self._root_entry
+        uptime_ms = (
+            round((time.perf_counter() - self._run_started) * 1000, 3) if self._run_started is not None else None
+        )
+        frames = sys._current_frames()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = self._open_stacks(frames)
+        me = threading.get_ident()
+        threads = []
+        for ident, frame in frames.items():
+            if ident == me:
+                # where this thread was when it was interrupted, not the dump itself
+                while frame is not None and frame.f_code.co_filename == __file__:
+                    frame = frame.f_back
+            calls = []
+            for depth, entry in enumerate(list(stacks.get(ident, ()))):
+                started = started_at.get(id(entry))
+                if started is not None:
+                    elapsed_ms = round((now - started) * 1000, 3)
+                else:
+                    elapsed_ms = uptime_ms if entry is root else None
+                calls.append(
+                    {
+                        "depth": depth,
+                        "id": entry.get("id"),
+                        "module": entry.get("module"),
+                        "callable": entry.get("callable"),
+                        "called": entry.get("called"),
+                        "elapsed_ms": elapsed_ms,
+                    }
+                )
+            threads.append(
+                {
+                    "thread": names.get(ident, str(ident)),
+                    "ident": ident,
+                    "at": (
+                        f"{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+                        if frame is not None
+                        else None
+                    ),
+                    "calls": calls,
+                }
+            )
+        dump = {
+            "pid": os.getpid(),
+            "script": root.get("callable") if root is not None else None,
+            "dumped_at": now,
+            "uptime_ms": uptime_ms,
+            "inflight": len(started_at),
+            "threads": threads,
+        }
+        path = Path(path) if path else self._inflight_path()
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(dump, ensure_ascii=True, indent=2), encoding="utf-8")
+        os.replace(tmp, path)
+        return path
+
+    def _new_root_entry(self, script_name):
+        return {
             "id": 0,
             "callable": script_name,
             "module": "__main__",
@@ -471,10 +2671,35 @@ class PyFlowTraceProfiler:
             "duration_ms": None,
             "calls": [],
         }
+
+    def _open_trace(self, script_name, link=True):
+        """Create the root entry and output side (snapshot/segments/stream); no hook yet."""
+        self._root_entry = self._new_root_entry(script_name)
+        parent_pid, parent_call_id, parent_exec_depth, exec_depth = (
+            _take_parent_link() if link else (None, None, None, None)
+        )
+        self._root_entry["pid"] = os.getpid()
+        self._root_entry["ppid"] = parent_pid if parent_pid is not None else os.getppid()
+        if parent_call_id is not None:
+            self._root_entry["parent_call_id"] = parent_call_id
+        if parent_exec_depth:
+            self._root_entry["parent_exec_depth"] = parent_exec_depth
+        if exec_depth:
+            # same pid as the image that called os.exec*()
+            self._exec_depth = exec_depth
+            self._root_entry["exec_depth"] = exec_depth
         self.records = [self._root_entry]
         self._stack = [self._root_entry]
         self._dirty = True
-        if self._enable_tracemalloc and self._capture_memory:
+        self._init_budget(self._root_entry)
+        self._init_governor(self._root_entry)
+        if self._policy is not None:
+            self._root_entry["capture_policy"] = self._policy.report()
+        self._open_values(self._root_entry)
+        policy_memory = self._policy is not None and self._policy.wants_memory
+        if self._enable_tracemalloc and (self._capture_memory or policy_memory):
+            import tracemalloc
+
             tracemalloc.start(10)
             self._tracemalloc_enabled = True
         else:
@@ -483,14 +2708,54 @@ class PyFlowTraceProfiler:
             sys.stderr.write("[FlowTrace] verbose mode enabled\n")
             sys.stderr.flush()
         self._run_started = time.perf_counter()
+        self._hook_thread = threading.get_ident()
+        if self._rotating:
+            self._root_entry["segment"] = 1
+            self._open_segment()
         self._root_entry["memory_before"] = self._memory_snapshot()
+        if self._stream_spec:
+            self._open_stream()
         self._maybe_flush(
             force=True,
             current=self._root_entry.get("callable"),
             log=self._log_flushes,
         )  # snapshot inicial
-        sys.setprofile(self._profile)
+
+    def _begin_profile(self, script_name: str):
+        global _active_profiler
+        self._open_trace(script_name)
+        _active_profiler = self
+        _install_fork_hooks()
+        if self._propagate_tasks:
+            _install_task_propagation()
+        if self._trace_subprocesses:
+            self._child_config = self._autotrace_config()
+            # resolve the ignore prefixes into the cache file the children read
+            self._prefix_cache = self._child_config["PYTRACEFLOW_PREFIX_CACHE"]
+            # children started through os.system/os.spawn* only see os.environ
+            injected = {
+                key: val
+                for key, val in _child_environ(None, self._child_config).items()
+                if key.startswith("PYTRACEFLOW_") or key == "PYTHONPATH"
+            }
+            self._saved_environ = (
+                {key: os.environ.get(key) for key in injected},
+                injected,
+            )
+            os.environ.update(injected)
+            _install_subprocess_propagation()
+        if self._triggers:
+            self._root_entry["triggers"] = {"patterns": list(self._triggers), "fired": 0}
+        sys.setprofile(self._trigger_hook if self._triggers else self._profile)
+        if self._trace_threads:
+            self._threads_active = True
+            _install_thread_linkage()
+            threading.setprofile(self._trigger_hook if self._triggers else self._thread_profile)
+        self._install_dump_signal()
         self._stop_flush.clear()
+        self._start_threads()
+
+    def _start_threads(self):
         if self._flush_interval > 0:
             self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
             self._flush_thread.start()
@@ -499,48 +2764,597 @@ class PyFlowTraceProfiler:
                 target=self._heartbeat_loop, daemon=True
             )
             self._heartbeat_thread.start()
+        if self._max_overhead_pct > 0:
+            self._governor_thread = threading.Thread(target=self._governor_loop, daemon=True)
+            self._governor_thread.start()
+        if self._deadline_ms > 0 or self._deadlines:
+            self._watchdog_thread = threading.Thread(target=self._watchdog_loop, daemon=True)
+            self._watchdog_thread.start()
+
+    def _prepare_fork(self):
+        parent = self._stack[-1] if self._stack else None
+        self._fork_parent = (os.getpid(), parent.get("id") if parent else None)
+
+    def _child_output_path(self, parent_pid):
+        base = self._base_output_path
+        # only a whole _<pid> token is the parent's pid, not any run of its digits
+        name, found = re.subn(
+            rf"_{parent_pid}(?=\.|_|$)", f"_{os.getpid()}", base.name
+        )
+        if found:
+            return base.with_name(name)
+        return base.with_name(f"{base.stem}_{os.getpid()}{base.suffix}")
+
+    def _reset_after_fork(self):
+        """Start a fresh per-process trace in a forked child.
+
+        Inherited buffers are dropped by rebinding rather than cleared in place,
+        so the child never walks or copies the parent's tree.
+        """
+        parent_pid, parent_call_id = self._fork_parent or (None, None)
+        self._fork_parent = None
+        self._write_lock = threading.Lock()
+        self._output_lock = threading.Lock()
+        self._snapshot_seq = 0
+        self._written_seq = 0
+        self._stop_flush = threading.Event()
+        self._flush_thread = None
+        self._heartbeat_thread = None
+        self._governor_thread = None
+        self._watchdog_thread = None
+        self._deadline_alerted = set()
+        self._deadline_alerts = 0
+        self._runs = 0
+        self._run_folded = 0
+        self._inflight = {}
+        self._agg_inflight = {}
+        self._agg_calls = 0
+        self._instance_roots = {}
+        self._aggregates = {}
+        self._tls = threading.local()
+        self._thread_stacks = {}
+        self._node_count = 0
+        self._flush_node_count = 0
+        self._pending_new_records = 0
+        self._flush_count = 0
+        self._last_snapshot_bytes = 0
+        self._last_flush = -1e9
+        self._degrade_level = 0
+        self._governor_level = 0
+        self._aggregate_mode = False
+        self._apply_detail()
+        self._rotate_pending = False
+        self._reset_overhead()
+        if self._tail is not None:
+            self._tail = self._tail.fresh()
+        # the child leaves through stop_live() (atexit/finalizer), even under run()
+        self._live_mode_started = True
+        self._live_mode_stopped = False
+        root = self._new_root_entry(self._root_entry.get("callable", "__process__"))
+        root["pid"] = os.getpid()
+        root["ppid"] = parent_pid
+        root["parent_call_id"] = parent_call_id
+        root["forked"] = True
+        if self._exec_depth:
+            root["parent_exec_depth"] = self._exec_depth
+            self._exec_depth = 0
+        # link left by a patched Process.start() in the parent; our own root is set above
+        for key in _LINK_KEYS:
+            os.environ.pop(key, None)
+        self._root_entry = root
+        self.records = [root]
+        self._stack = [root]
+        self._base_output_path = self._child_output_path(parent_pid)
+        self.output_path = self._base_output_path
+        self._run_started = time.perf_counter()
+        self._hook_thread = threading.get_ident()
+        self._init_budget(root)
+        self._init_governor(root)
+        if self._triggers:
+            root["triggers"] = {"patterns": list(self._triggers), "fired": 0}
+            # forked inside a triggered call: the inherited hook points at the parent's nodes
+            sys.setprofile(self._trigger_hook)
+        if self._policy is not None:
+            root["capture_policy"] = self._policy.report()
+        self._open_values(root)
+        if self._rotating:
+            self._segments = []
+            self._segment_index = 0
+            root["segment"] = 1
+            self._open_segment()
+        self._dirty = True
+        if self._stream_spec:
+            # never share the parent's socket or queue
+            self._open_stream()
+        if "multiprocessing" in sys.modules:
+            # multiprocessing children leave through os._exit(), which skips atexit;
+            # its bootstrap clears finalizers first, so register from an after-fork hook
+            from multiprocessing import util
+
+            util.register_after_fork(self, PyFlowTraceProfiler._register_mp_finalizer)
+        # initial snapshot from this thread, as _open_trace does, before the flush
+        # thread exists
+        self._maybe_flush(force=True, current=root.get("callable"), log=self._log_flushes)
+        self._start_threads()
+
+    @staticmethod
+    def _register_mp_finalizer(profiler):
+        from multiprocessing import util
+
+        util.Finalize(None, profiler.stop_live, exitpriority=0)
+
+    def _autotrace_config(self):
+        """Autotrace environment that reproduces this profiler's settings in children."""
+
+        def flag(value):
+            return "1" if value else "0"
+
+        config = {
+            "PYTRACEFLOW_AUTOTRACE": "1",
+            "PYTRACEFLOW_OUT_DIR": str(self._base_output_path.resolve().parent),
+            "PYTRACEFLOW_FLUSH_INTERVAL": str(self._flush_interval),
+            "PYTRACEFLOW_FLUSH_CALL_THRESHOLD": str(self._flush_call_threshold),
+            "PYTRACEFLOW_SKIP_INPUTS": flag(not self._capture_inputs_config),
+            "PYTRACEFLOW_SKIP_OUTPUTS": flag(not self._capture_outputs_config),
+            "PYTRACEFLOW_VERBOSE": flag(self._verbose),
+            "PYTRACEFLOW_WITH_MEMORY": flag(self._capture_memory_config),
+            "PYTRACEFLOW_NO_TRACEMALLOC": flag(not self._enable_tracemalloc),
+            "PYTRACEFLOW_ALLOW_ANY": flag(self._allow_any),
+            "PYTRACEFLOW_MAX_NODES": str(self._max_nodes),
+            "PYTRACEFLOW_MAX_BYTES": str(self._max_bytes),
+            "PYTRACEFLOW_ROTATE_MB": str(self._rotate_bytes / (1024 * 1024)),
+            "PYTRACEFLOW_ROTATE_SECONDS": str(self._rotate_seconds),
+            "PYTRACEFLOW_ROTATE_ROOTS": str(self._rotate_roots),
+            "PYTRACEFLOW_RETAIN_SEGMENTS": str(self._retain_segments),
+            "PYTRACEFLOW_PROPAGATE_TASKS": flag(self._propagate_tasks),
+            "PYTRACEFLOW_TRACE_THREADS": flag(self._trace_threads),
+            "PYTRACEFLOW_TRACE_SUBPROCESSES": "1",
+            "PYTRACEFLOW_MEASURE_OVERHEAD": flag(self._measure_overhead),
+            "PYTRACEFLOW_OVERHEAD_SAMPLE": str(self._overhead_sample),
+            "PYTRACEFLOW_MAX_OVERHEAD_PCT": str(self._max_overhead_pct),
+            "PYTRACEFLOW_OVERHEAD_WINDOW": str(self._overhead_window),
+            "PYTRACEFLOW_PREFIX_CACHE": self._prefix_cache
+            or str(self._base_output_path.resolve().parent / ".pytraceflow-cache"),
+        }
+        if self._tail is not None:
+            config["PYTRACEFLOW_TAIL_SLOW_MS"] = str(self._tail.slow_ms)
+            config["PYTRACEFLOW_TAIL_PERCENTILE"] = str(self._tail.percentile)
+            config["PYTRACEFLOW_TAIL_ERRORS"] = flag(self._tail.errors)
+            config["PYTRACEFLOW_TAIL_MATCH"] = ",".join(self._tail.match)
+            config["PYTRACEFLOW_TAIL_WINDOW"] = str(self._tail.window)
+        if self._dump_signal is not None:
+            config["PYTRACEFLOW_DUMP_SIGNAL"] = self._dump_signal.name
+        if self._triggers:
+            config["PYTRACEFLOW_TRIGGERS"] = ",".join(self._triggers)
+        if self._policy is not None and self._policy.source:
+            config["PYTRACEFLOW_POLICY"] = str(Path(self._policy.source).resolve())
+        if self._dedup_shapes:
+            config["PYTRACEFLOW_DEDUP_SHAPES"] = str(self._dedup_shapes)
+        if self._fold_runs:
+            config["PYTRACEFLOW_FOLD_RUNS"] = "1"
+            config["PYTRACEFLOW_RUN_DURATIONS"] = flag(self._run_durations)
+        if self._intern_values:
+            config["PYTRACEFLOW_INTERN_VALUES"] = str(self._intern_values)
+        if self._deadline_ms > 0 or self._deadlines:
+            config["PYTRACEFLOW_DEADLINE_MS"] = str(self._deadline_ms)
+            config["PYTRACEFLOW_DEADLINES"] = ",".join(f"{pattern}={ms:g}" for pattern, ms in self._deadlines)
+        if self._stream_spec:
+            config["PYTRACEFLOW_STREAM"] = str(self._stream_spec)
+            config["PYTRACEFLOW_STREAM_QUEUE"] = str(self._stream_queue)
+        # sitecustomize.py sits next to this module in a checkout
+        repo_dir = Path(__file__).resolve().parent
+        if (repo_dir / "sitecustomize.py").exists():
+            config["PYTHONPATH"] = str(repo_dir)
+        return config
+
+    def _child_env(self, exec_image=False):
+        """Autotrace config plus the link to the call that is starting a child."""
+        env = dict(self._child_config)
+        parent = self._current_entry()
+        env["PYTRACEFLOW_PARENT_PID"] = str(os.getpid())
+        if parent is not None and parent.get("id") is not None:
+            env["PYTRACEFLOW_PARENT_CALL_ID"] = str(parent["id"])
+        if exec_image:
+            env["PYTRACEFLOW_EXEC_DEPTH"] = str(self._exec_depth + 1)
+        elif self._exec_depth:
+            env["PYTRACEFLOW_PARENT_EXEC_DEPTH"] = str(self._exec_depth)
+        return env
+
+    def _finish_for_exec(self):
+        """Write the final trace before os.exec*() replaces this process image."""
+        self._live_mode_stopped = True
+        try:
+            self._end_profile(self._root_entry.get("callable", "__process__"), None)
+        except Exception:
+            pass
+
+    def _restore_environ(self):
+        if self._saved_environ is None:
+            return
+        saved, injected = self._saved_environ
+        self._saved_environ = None
+        for key, val in saved.items():
+            if os.environ.get(key) != injected[key]:
+                # changed by the traced program since; leave it alone
+                continue
+            if val is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = val
 
     def _end_profile(self, script_name: str, exc_raised: BaseException | None):
+        global _active_profiler
+        if self._profile_ended:
+            # already finished before an os.exec*() that then failed
+            if exc_raised:
+                raise exc_raised
+            return
+        self._profile_ended = True
         sys.setprofile(None)
+        if self._threads_active:
+            self._threads_active = False
+            threading.setprofile(None)
+        self._restore_dump_signal()
+        self._restore_sigterm()
+        self._restore_environ()
+        if _active_profiler is self:
+            _active_profiler = None
         total_ms = (
             round((time.perf_counter() - self._run_started) * 1000, 3)
             if self._run_started is not None
             else None
         )
+        root_ms = total_ms
+        if self._rotating and self._segment_started is not None:
+            # each segment root spans its own segment; merge adds them back up
+            root_ms = round((time.time() - self._segment_started) * 1000, 3)
         if self._root_entry is not None:
-            self._root_entry["duration_ms"] = total_ms
+            self._root_entry["duration_ms"] = root_ms
             self._root_entry["memory_after"] = self._memory_snapshot()
         if self._tracemalloc_enabled:
+            import tracemalloc
+
             tracemalloc.stop()
-        if self._root_entry is not None:
-            self._prune_calls(self._root_entry)
+        for root in self.records:
+            self._prune_calls(root)
+        if self._dedup_shapes and self._stream is None:
+            from pytraceflow_shapes import dedup_tree
+
+            # the flush thread may still be serializing a snapshot
+            with self._write_lock:
+                for root in self.records:
+                    if "calls" in root:
+                        root["shape_dedup"] = dedup_tree(root, self._dedup_shapes)
         self._dirty = True
-        self._maybe_flush(force=True, log=self._log_flushes)
+        rotating, self._rotating = self._rotating, False
+        if self._measure_overhead and self._root_entry is not None:
+            self._root_entry["overhead"] = self._overhead_report()
+        if self._tail is not None and self._root_entry is not None:
+            self._root_entry["tail_sampling"] = self._tail.report()
+        if self._watchdog_thread is not None and self._root_entry is not None:
+            self._root_entry["deadlines"] = self._deadline_report()
+        if self._fold_runs and self._root_entry is not None:
+            self._root_entry["run_folding"] = self._run_report()
+        if self._values is not None and self._root_entry is not None:
+            self._root_entry["value_interning"] = self._values.report()
+        if self._stream is not None:
+            self._close_stream()
+        else:
+            self._maybe_flush(force=True, log=self._log_flushes)
+        if rotating:
+            self._close_segment()
+            self._write_manifest()
         self._stop_flush.set()
         if self._flush_thread:
             self._flush_thread.join(timeout=1)
         if self._heartbeat_thread:
             self._heartbeat_thread.join(timeout=1)
+        if self._governor_thread:
+            self._governor_thread.join(timeout=1)
+        if self._watchdog_thread:
+            self._watchdog_thread.join(timeout=1)
         if total_ms is not None:
             sys.stderr.write(
                 f"[FlowTrace] Profiling finished in {total_ms/1000:.3f}s (script={script_name})\n"
             )
             sys.stderr.flush()
+        if self._measure_overhead and self._root_entry is not None:
+            sys.stderr.write(
+                f"[FlowTrace pid={os.getpid()}] overhead "
+                f"{self._overhead_summary(self._root_entry.get('overhead'))}\n"
+            )
+            sys.stderr.flush()
         if exc_raised:
             raise exc_raised
 
     def _is_class_definition_node(self, node):
-        return (
-            node.get("module") == "__main__"
-            and node.get("callable") == node.get("called")
-            and not node.get("inputs")
-            and node.get("output") is None
-            and node.get("error") is None
-            and node.get("callable") not in ("__main__", "__instance__")
+        return _is_class_definition_node(node)
+
+
+# output path -> profiler shared by every trace()/@traced scope writing there
+_scope_sessions = {}
+_scope_lock = threading.Lock()
+_scope_atexit = False
+
+
+def _scope_session(output, options):
+    global _scope_atexit
+    key = os.path.abspath(output)
+    session = _scope_sessions.get(key)
+    if session is not None and session._root_entry["pid"] == os.getpid():
+        return session
+    with _scope_lock:
+        session = _scope_sessions.get(key)
+        if session is not None and session._root_entry["pid"] == os.getpid():
+            return session
+        if session is not None:
+            # forked child: its scopes go to pft_<childpid>-style output of its own
+            output = session._child_output_path(session._root_entry["pid"])
+        options.setdefault("allow_any", True)
+        session = PyFlowTraceProfiler(sys.argv[0] if sys.argv else "", output, **options)
+        session._begin_scopes()
+        _scope_sessions[key] = session
+        if not _scope_atexit:
+            import atexit
+
+            atexit.register(close_traces)
+            _scope_atexit = True
+    return session
+
+
+class _TraceScope:
+    def __init__(self, output, name, module, options):
+        self._output = output
+        self._name = name
+        self._module = module
+        self._options = options
+        self.node = None
+
+    def __enter__(self):
+        self._session = _scope_session(self._output, self._options)
+        self.node, self._token = self._session._enter_scope(
+            self._name, self._module, sys._getframe(1)
         )
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._session._exit_scope(self.node, self._token, exc)
+        return False
+
+
+def trace(output="pft.json", name=None, **options):
+    """Trace only the dynamic extent of a `with` block.
+
+        with pytraceflow.trace("handler.json"):
+            handle(request)
+
+    The profile hook is set on entry and removed on exit, so code outside any
+    scope runs untraced. Each scope becomes a `__scope__` node (nested scopes
+    nest); scopes sharing an output share one trace and its background writer.
+    `options` are PyFlowTraceProfiler arguments (skip_inputs -> capture_inputs=False,
+    ...), applied when the first scope opens that output.
+    """
+    caller = sys._getframe(1)
+    return _TraceScope(
+        output,
+        name or caller.f_code.co_name,
+        caller.f_globals.get("__name__", ""),
+        options,
+    )
+
+
+def traced(func=None, *, output="pft.json", name=None, **options):
+    """Decorator form of trace(): every call of func runs inside its own scope.
+
+    Coroutine functions and async generators keep the scope open until they
+    finish, across their awaits, not just until the coroutine object is built.
+    """
+    def decorate(func):
+        import functools
+        import inspect
+
+        scope_name = name or func.__qualname__
+
+        if inspect.isasyncgenfunction(func):
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with _TraceScope(output, scope_name, func.__module__, options):
+                    agen = func(*args, **kwargs)
+                    try:
+                        item = await agen.__anext__()
+                        while True:
+                            try:
+                                sent = yield item
+                            except GeneratorExit:
+                                raise
+                            except BaseException as exc:
+                                item = await agen.athrow(exc)
+                            else:
+                                item = await agen.asend(sent)
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        await agen.aclose()
+
+            return wrapper
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with _TraceScope(output, scope_name, func.__module__, options):
+                    return await func(*args, **kwargs)
+
+            return wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _TraceScope(output, scope_name, func.__module__, options):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate(func) if func is not None else decorate
+
+
+def close_traces():
+    """Write and close every trace()/@traced output (also runs at exit)."""
+    with _scope_lock:
+        sessions = list(_scope_sessions.values())
+        _scope_sessions.clear()
+    for session in sessions:
+        if session._root_entry["pid"] == os.getpid():
+            session._close_scopes()
+
+
+def _resolve_signal(signum, default):
+    """signal.Signals from a number, a name ("USR2", "SIGUSR2") or None (= default)."""
+    import signal
+
+    if signum is None or signum is True:
+        signum = default
+    wanted = signum
+    if isinstance(signum, str):
+        name = signum.upper()
+        if name.isdigit():
+            signum = int(name)
+        else:
+            signum = getattr(signal, name if name.startswith("SIG") else f"SIG{name}", None)
+    try:
+        return signal.Signals(signum)
+    except ValueError:
+        raise ValueError(f"signal {wanted!r} is not available on this platform") from None
+
+
+class DormantTracer:
+    """Signal-armed capture: nothing runs until `signum` arrives.
+
+    The first signal starts a live capture into
+    <out_dir>/pft_<pid>_<YYYYmmdd-HHMMSS>.json; it stops after `seconds`
+    (0 = no limit) or at the next signal, and the following signal starts a
+    new window. `options` are PyFlowTraceProfiler arguments.
+    """
+
+    def __init__(self, out_dir, signum=None, seconds=30.0, **options):
+        self.signum = _resolve_signal(signum, "SIGUSR1")
+        self.out_dir = Path(out_dir)
+        self.seconds = float(seconds or 0)
+        # children keep their own dormant handler; a capture must not rewrite os.environ
+        options["trace_subprocesses"] = False
+        options.setdefault("trace_threads", True)
+        self.options = options
+        self.profiler = None
+        self.captures = []
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._previous_handler = None
+        self._installed = False
+
+    def install(self):
+        import signal
+
+        if threading.current_thread() is not threading.main_thread():
+            raise RuntimeError("install_dormant() must be called from the main thread")
+        self._previous_handler = signal.signal(self.signum, self._on_signal)
+        if not self._installed:
+            import atexit
+
+            atexit.register(self.uninstall)
+            self._installed = True
+        return self
+
+    def uninstall(self):
+        """Finish a running capture and restore the previous signal handler."""
+        import signal
+
+        with self._lock:
+            if self.profiler is not None:
+                self._stop("exit")
+        if self._previous_handler is not None and threading.current_thread() is threading.main_thread():
+            signal.signal(self.signum, self._previous_handler)
+            self._previous_handler = None
+
+    def _on_signal(self, signum, frame):
+        # handlers run in the main thread, so the hook set here is the main thread's;
+        # a signal landing while a window is being started/stopped is ignored
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self.profiler is not None:
+                self._stop("signal")
+            else:
+                self._start()
+        finally:
+            self._lock.release()
+
+    def _start(self):
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        output = self.out_dir / f"pft_{os.getpid()}_{stamp}.json"
+        index = 1
+        while output.exists():
+            index += 1
+            output = self.out_dir / f"pft_{os.getpid()}_{stamp}_{index}.json"
+        self._generation += 1
+        if self.seconds > 0:
+            # started before the capture so threading.setprofile does not reach it
+            timer = threading.Timer(self.seconds, self._expire, args=(self._generation,))
+            timer.daemon = True
+            timer.start()
+        profiler = PyFlowTraceProfiler(sys.argv[0] if sys.argv else "", output, **self.options)
+        profiler.start_live()
+        if profiler._trace_threads and hasattr(threading, "setprofile_all_threads"):
+            # 3.12+: threads that already run get the hook too
+            threading.setprofile_all_threads(profiler._thread_profile)
+        profile = profiler._profile
+
+        def _main_profile(frame, event, arg):
+            # a capture stopped from the timer thread can't clear this thread's hook itself
+            if profiler._profile_ended:
+                sys.setprofile(None)
+                return
+            profile(frame, event, arg)
+
+        sys.setprofile(_main_profile)
+        profiler._root_entry["capture"] = {
+            "signal": self.signum.name,
+            "started": time.time(),
+            "seconds": self.seconds,
+            "stopped_by": None,
+        }
+        self.profiler = profiler
+        sys.stderr.write(
+            f"[FlowTrace pid={os.getpid()}] {self.signum.name}: capture started -> {output}\n"
+        )
+        sys.stderr.flush()
+
+    def _stop(self, reason):
+        profiler, self.profiler = self.profiler, None
+        profiler._root_entry["capture"]["stopped_by"] = reason
+        profiler.stop_live()
+        if profiler._trace_threads and hasattr(threading, "setprofile_all_threads"):
+            threading.setprofile_all_threads(None)
+        self.captures.append(str(profiler.output_path))
+        sys.stderr.write(
+            f"[FlowTrace pid={os.getpid()}] capture stopped ({reason}) -> {profiler.output_path}\n"
+        )
+        sys.stderr.flush()
+
+    def _expire(self, generation):
+        with self._lock:
+            if generation == self._generation and self.profiler is not None:
+                self._stop("timer")
+
+
+def install_dormant(out_dir="bench-output/dormant", signum=None, seconds=30.0, **options):
+    """Arm a DormantTracer for this process (main thread only) and return it."""
+    return DormantTracer(out_dir, signum, seconds, **options).install()
 
 
 def _build_parser():
+    import argparse
+
     parser = argparse.ArgumentParser(description="Post-mortem JSON trace profiler")
     parser.add_argument(
         "-s",
@@ -606,6 +3420,180 @@ def _build_parser():
         action="store_true",
         help="Trace any non-stdlib file (disable root-dir filter; useful in autotrace/multiprocess)",
     )
+    parser.add_argument(
+        "--max-nodes",
+        type=int,
+        default=0,
+        help="Node budget; capture degrades (no payloads -> aggregate -> spine) as it fills. 0 disables",
+    )
+    parser.add_argument(
+        "--max-bytes",
+        type=int,
+        default=0,
+        help="Approximate JSON size budget in bytes, degrading like --max-nodes. 0 disables",
+    )
+    parser.add_argument(
+        "--rotate-mb",
+        type=float,
+        default=0,
+        help="Start a new segment file once the current snapshot exceeds N MB (0 disables)",
+    )
+    parser.add_argument(
+        "--rotate-seconds",
+        type=float,
+        default=0,
+        help="Start a new segment file every N seconds (0 disables)",
+    )
+    parser.add_argument(
+        "--rotate-roots",
+        type=int,
+        default=0,
+        help="Start a new segment file after N top-level calls (0 disables)",
+    )
+    parser.add_argument(
+        "--retain-segments",
+        type=int,
+        default=0,
+        help="Keep only the newest N segment files when rotating (0 keeps all)",
+    )
+    parser.add_argument(
+        "--propagate-tasks",
+        action="store_true",
+        help="Link multiprocessing Pool/ProcessPoolExecutor tasks to the submitting call (for autotraced workers)",
+    )
+    parser.add_argument(
+        "--trace-threads",
+        action="store_true",
+        help="Also trace threads started while profiling; executor work links to the submitting call",
+    )
+    parser.add_argument(
+        "--trace-subprocesses",
+        action="store_true",
+        help="Autotrace Python children (subprocess, os.exec*, multiprocessing) linked to the spawning call",
+    )
+    parser.add_argument(
+        "--stream",
+        default=None,
+        help="Stream events to a collector instead of writing JSON: unix:///path.sock, tcp://127.0.0.1:PORT (comma list = fallbacks) or shm://DIR (shared-memory ring)",
+    )
+    parser.add_argument(
+        "--stream-queue",
+        type=int,
+        default=100_000,
+        help="Max queued events (ring slots for shm://) before new ones are dropped (default: 100000)",
+    )
+    parser.add_argument(
+        "--measure-overhead",
+        action="store_true",
+        help="Time the tracer's own stages (sampled) and report ns/event per stage and flush cost",
+    )
+    parser.add_argument(
+        "--overhead-sample",
+        type=int,
+        default=64,
+        help="Time one hook event out of every N when measuring overhead (default: 64)",
+    )
+    parser.add_argument(
+        "--max-overhead-pct",
+        type=float,
+        default=0,
+        help="Cap tracer cost at this %% of the app's time per window, shedding memory -> payloads -> aggregate (0 disables)",
+    )
+    parser.add_argument(
+        "--overhead-window",
+        type=float,
+        default=1.0,
+        help="Seconds per governor measurement window (default: 1.0)",
+    )
+    parser.add_argument(
+        "--tail-slow-ms",
+        type=float,
+        default=0,
+        help="Tail sampling: keep top-level calls/tasks taking at least this many ms (rules combine with OR)",
+    )
+    parser.add_argument(
+        "--tail-percentile",
+        type=float,
+        default=0,
+        help="Tail sampling: keep units at or above this percentile of their function's recent durations (e.g. 95)",
+    )
+    parser.add_argument(
+        "--tail-errors",
+        action="store_true",
+        help="Tail sampling: keep units with an error anywhere in their subtree",
+    )
+    parser.add_argument(
+        "--tail-match",
+        action="append",
+        default=[],
+        help="Tail sampling: keep units that call a function matching module:callable (fnmatch, repeatable)",
+    )
+    parser.add_argument(
+        "--tail-window",
+        type=int,
+        default=256,
+        help="Recent durations per function used by --tail-percentile (default: 256)",
+    )
+    parser.add_argument(
+        "--dump-signal",
+        nargs="?",
+        const="SIGUSR2",
+        default=None,
+        help="On this signal (default SIGUSR2) write every thread's in-flight calls to <output>.inflight.json",
+    )
+    parser.add_argument(
+        "--deadline-ms",
+        type=float,
+        default=0.0,
+        help="Watchdog: report calls still running after this many ms (0 disables)",
+    )
+    parser.add_argument(
+        "--deadline",
+        action="append",
+        default=[],
+        metavar="PATTERN=MS",
+        help="Watchdog deadline for functions matching module:callable (fnmatch, repeatable; first match wins)",
+    )
+    parser.add_argument(
+        "--trigger",
+        action="append",
+        default=[],
+        metavar="MODULE:QUALNAME",
+        help="Record only beneath these functions (fnmatch, repeatable); each invocation becomes its own top-level call",
+    )
+    parser.add_argument(
+        "--policy",
+        default=None,
+        help="JSON/TOML file with per-function capture rules (inputs/outputs/memory by module:qualname)",
+    )
+    parser.add_argument(
+        "--dedup-shapes",
+        nargs="?",
+        type=int,
+        const=3,
+        default=0,
+        metavar="MIN_NODES",
+        help="At the final write, store repeated subtrees (>= MIN_NODES nodes, default 3) once as shapes",
+    )
+    parser.add_argument(
+        "--fold-runs",
+        action="store_true",
+        help="Fold consecutive identical sibling calls into one run node (count and duration stats) as they finish",
+    )
+    parser.add_argument(
+        "--run-durations",
+        action="store_true",
+        help="With --fold-runs, also keep every call's duration in the run (implies --fold-runs)",
+    )
+    parser.add_argument(
+        "--intern-values",
+        nargs="?",
+        type=int,
+        const=64,
+        default=0,
+        metavar="MIN_BYTES",
+        help="Store payloads of >= MIN_BYTES JSON bytes (default 64) once in root['values']; nodes hold {'$v': key}",
+    )
     parser.add_argument(
         "--verbose",
         action="store_true",
@@ -629,9 +3617,32 @@ def main():
     if len(sys.argv) == 1:
         _build_parser().print_help()
         sys.exit(0)
+    if sys.argv[1] == "merge":
+        from pytraceflow_merge import main as merge_main
+
+        merge_main(sys.argv[2:])
+        return
+    if sys.argv[1] == "collect":
+        from pytraceflow_collector import main as collect_main
+
+        collect_main(sys.argv[2:])
+        return
+    if sys.argv[1] == "dedup":
+        from pytraceflow_shapes import main as dedup_main
+
+        dedup_main(sys.argv[2:])
+        return
+    if sys.argv[1] == "values":
+        from pytraceflow_values import main as values_main
+
+        values_main(sys.argv[2:])
+        return
     _, args = _parse_args()
+    # let "import pytraceflow" (pickled task wrappers, API users) resolve to this module
+    sys.modules.setdefault("pytraceflow", sys.modules[__name__])
     capture_memory = args.with_memory and not args.no_memory
-    enable_tracemalloc = capture_memory and not args.no_tracemalloc
+    # only started when memory is captured, globally or by a --policy rule
+    enable_tracemalloc = not args.no_tracemalloc
     if args.verbose:
         args.log_flushes = True
     profiler = PyFlowTraceProfiler(
@@ -648,6 +3659,37 @@ def main():
         enable_tracemalloc=enable_tracemalloc,
         verbose=args.verbose,
         allow_any=args.trace_any,
+        max_nodes=args.max_nodes,
+        max_bytes=args.max_bytes,
+        rotate_bytes=int(args.rotate_mb * 1024 * 1024),
+        rotate_seconds=args.rotate_seconds,
+        rotate_roots=args.rotate_roots,
+        retain_segments=args.retain_segments,
+        propagate_tasks=args.propagate_tasks,
+        trace_threads=args.trace_threads,
+        trace_subprocesses=args.trace_subprocesses,
+        stream=args.stream,
+        stream_queue=args.stream_queue,
+        measure_overhead=args.measure_overhead,
+        overhead_sample=args.overhead_sample,
+        max_overhead_pct=args.max_overhead_pct,
+        overhead_window=args.overhead_window,
+        tail=TailSampler(
+            slow_ms=args.tail_slow_ms,
+            percentile=args.tail_percentile,
+            errors=args.tail_errors,
+            match=args.tail_match,
+            window=args.tail_window,
+        ),
+        dump_signal=args.dump_signal,
+        deadline_ms=args.deadline_ms,
+        deadlines=args.deadline,
+        triggers=args.trigger,
+        policy=args.policy,
+        dedup_shapes=args.dedup_shapes,
+        fold_runs=args.fold_runs,
+        run_durations=args.run_durations,
+        intern_values=args.intern_values,
     )
     profiler.run()
 
@@ -0,0 +1,431 @@
+"""
+Collector for live PyTraceFlow streams (--stream / PYTRACEFLOW_STREAM).
+
+Listens on one or more Unix/TCP endpoints and/or drains the shared-memory rings
+registered in shm:// directories, accepts many traced processes at once and
+rebuilds each process tree from its event stream. Trees are written as
+pft_<pid>.json per process (same layout as autotrace, so `pytraceflow merge`
+works on the output directory) and/or as one merged process tree.
+
+Usage:
+  pytraceflow-collector --listen unix:///tmp/pft.sock -o bench-output/stream
+  python pytraceflow.py collect --listen unix:///tmp/pft.sock --listen tcp://127.0.0.1:7531 \\
+      -o bench-output/stream --store both --merged bench-output/stream_merged.json
+  pytraceflow-collector --listen shm:///tmp/pft-rings -o bench-output/stream
+"""
+
+import argparse
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+from pathlib import Path
+
+from pytraceflow import prune_calls
+from pytraceflow_merge import merge_traces
+from pytraceflow_stream import ShmRingReader, parse_endpoints
+
+_RETURN_FIELDS = ("duration_ms", "output", "error", "inputs_after", "memory_after")
+
+
+def _copy_calls(node):
+    """Copy of the call structure; payloads are shared, the live tree stays untouched."""
+    if "calls" not in node:
+        return node
+    return {**node, "calls": [_copy_calls(child) for child in node["calls"]]}
+
+
+class ProcessStore:
+    """Call tree of one traced process, rebuilt from its events."""
+
+    def __init__(self, hello):
+        self.lock = threading.Lock()
+        self.root = dict(hello)
+        self.root["calls"] = []
+        self.tasks = []
+        self.nodes = {self.root.get("id", 0): self.root}
+        self.events = 0
+        self.unmatched = 0
+        self.connections = 0
+        self.finished = False
+        self.dirty = True
+
+    @property
+    def pid(self):
+        return self.root.get("pid")
+
+    @property
+    def file_name(self):
+        exec_depth = self.root.get("exec_depth")
+        if exec_depth:
+            return f"pft_{self.pid}_exec{exec_depth}.json"
+        return f"pft_{self.pid}.json"
+
+    def _attach(self, parent_id, node):
+        self.nodes[node["id"]] = node
+        if parent_id is None:
+            # task roots live next to the process root, like records[1:]
+            self.tasks.append(node)
+            return
+        parent = self.nodes.get(parent_id)
+        if parent is None:
+            # parent event dropped or never traced
+            self.unmatched += 1
+            parent = self.root
+        parent["calls"].append(node)
+
+    def apply(self, events):
+        with self.lock:
+            for event in events:
+                kind = event[0]
+                if kind == "c":
+                    (
+                        _, parent_id, node_id, callable_, module, called,
+                        caller, instance_id, inputs, _started, memory_before,
+                    ) = event
+                    node = {
+                        "id": node_id,
+                        "callable": callable_,
+                        "module": module,
+                        "called": called,
+                        "caller": caller,
+                        "instance_id": instance_id,
+                        "inputs": inputs,
+                        "calls": [],
+                    }
+                    if memory_before:
+                        node["memory_before"] = memory_before
+                    self._attach(parent_id, node)
+                elif kind == "r":
+                    node = self.nodes.get(event[1])
+                    if node is None:
+                        self.unmatched += 1
+                        continue
+                    for key, val in zip(_RETURN_FIELDS, event[2:]):
+                        if val is not None or key in ("output", "error"):
+                            node[key] = val
+                elif kind == "n":
+                    node = dict(event[2])
+                    node.setdefault("calls", [])
+                    self._attach(event[1], node)
+                elif kind == "u":
+                    node = self.nodes.get(event[1])
+                    if node is None:
+                        self.unmatched += 1
+                        continue
+                    node.update(event[2])
+            self.events += len(events)
+            self.dirty = True
+
+    def finish(self, bye):
+        with self.lock:
+            for key, val in bye.items():
+                if key != "calls":
+                    self.root[key] = val
+            self.root.setdefault("stream", {})["unmatched"] = self.unmatched
+            self.finished = True
+            self.dirty = True
+
+    def snapshot(self):
+        with self.lock:
+            self.dirty = False
+            # same pruning as a local trace file; later events may still target the
+            # synthetic nodes, so prune a copy and keep the live tree intact
+            roots = [_copy_calls(root) for root in (self.root, *self.tasks)]
+            for root in roots:
+                prune_calls(root)
+            return json.dumps(roots, ensure_ascii=True, separators=(",", ":"))
+
+
+class Collector:
+    def __init__(self, output_dir, store="per-process", merged_path=None):
+        self.output_dir = Path(output_dir)
+        self.store = store
+        self.merged_path = Path(merged_path) if merged_path else None
+        self.stores = {}
+        self.active = 0
+        self.last_activity = time.time()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def open_process(self, hello):
+        key = (hello.get("pid"), hello.get("exec_depth") or 0)
+        with self._lock:
+            store = self.stores.get(key)
+            if store is None or store.finished:
+                store = self.stores[key] = ProcessStore(hello)
+            store.connections += 1
+            self.active += 1
+            self.last_activity = time.time()
+        return store
+
+    def close_process(self, store):
+        with self._lock:
+            self.active -= 1
+            self.last_activity = time.time()
+
+    def write(self, final=False):
+        with self._write_lock:
+            stores = list(self.stores.values())
+            merged_due = self.merged_path is not None and (
+                final or any(store.dirty for store in stores)
+            )
+            snapshots = []
+            for store in stores:
+                dirty = store.dirty
+                if not (dirty or final or merged_due):
+                    continue
+                payload = store.snapshot()
+                snapshots.append(payload)
+                if self.store != "merged" and (dirty or final):
+                    (self.output_dir / store.file_name).write_text(payload, encoding="utf-8")
+            if merged_due:
+                # merge_traces rewrites ids in place, so work on decoded copies
+                merged, processes = merge_traces([json.loads(payload) for payload in snapshots])
+                self.merged_path.write_text(
+                    json.dumps(merged, ensure_ascii=True, separators=(",", ":")),
+                    encoding="utf-8",
+                )
+                index_path = self.merged_path.with_name(f"{self.merged_path.stem}.index.json")
+                index_path.write_text(json.dumps({"processes": processes}, indent=2), encoding="utf-8")
+
+
+class _StreamHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        collector = self.server.collector
+        store = None
+        try:
+            for line in self.rfile:
+                try:
+                    kind, body = json.loads(line)
+                except ValueError:
+                    continue
+                if kind == "hello":
+                    store = collector.open_process(body)
+                elif store is None:
+                    continue
+                elif kind == "ev":
+                    store.apply(body)
+                elif kind == "bye":
+                    store.finish(body)
+        finally:
+            if store is not None:
+                collector.close_process(store)
+
+
+def _pid_alive(pid):
+    if not pid:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class _ShmPoller:
+    """Attach to rings registered in a directory and drain them into process stores."""
+
+    def __init__(self, directory, collector, interval=0.02, scan_interval=0.25):
+        self.directory = Path(directory)
+        self.collector = collector
+        self.interval = interval
+        self.scan_interval = scan_interval
+        self.rings = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        for path in list(self.rings):
+            self._drain(path, final=True)
+
+    def _scan(self):
+        for path in self.directory.glob("*.ring"):
+            if path in self.rings:
+                continue
+            try:
+                info = json.loads(path.read_text(encoding="utf-8"))
+                reader = ShmRingReader(info["shm"])
+            except FileNotFoundError:
+                # producer gone without cleaning up its registry file
+                if time.time() - path.stat().st_mtime > 5:
+                    path.unlink()
+                continue
+            except (OSError, ValueError, KeyError):
+                continue
+            self.rings[path] = [reader, None, info.get("pid")]
+
+    def _drain(self, path, final=False):
+        entry = self.rings[path]
+        reader, store, pid = entry
+        closed = reader.closed
+        dead = not closed and not _pid_alive(pid)
+        for kind, body in reader.drain():
+            if kind == "hello":
+                store = entry[1] = self.collector.open_process(body)
+            elif store is None:
+                continue
+            elif kind == "ev":
+                store.apply(body)
+            elif kind == "bye":
+                body.setdefault("stream", {})["overflow"] = reader.overflow
+                store.finish(body)
+        if closed or dead or final:
+            # everything published before "closed" has been drained above
+            reader.close(unlink=dead)
+            del self.rings[path]
+            if dead:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            if store is not None:
+                self.collector.close_process(store)
+
+    def _run(self):
+        next_scan = 0.0
+        while not self._stop.wait(self.interval):
+            now = time.time()
+            if now >= next_scan:
+                try:
+                    self._scan()
+                except OSError:
+                    pass
+                next_scan = now + self.scan_interval
+            for path in list(self.rings):
+                try:
+                    self._drain(path)
+                except Exception:
+                    self.rings.pop(path, None)
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+
+    class _ThreadingUnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+def _serve(endpoint, collector):
+    family, address = endpoint
+    if family == "shm":
+        poller = _ShmPoller(address, collector)
+        poller.start()
+        return poller
+    if family == "unix":
+        if os.path.exists(address):
+            os.unlink(address)
+        server = _ThreadingUnixServer(address, _StreamHandler)
+    else:
+        server = _ThreadingTCPServer(address, _StreamHandler)
+    server.collector = collector
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="pytraceflow collect",
+        description="Collect live PyTraceFlow event streams from many processes",
+    )
+    parser.add_argument(
+        "--listen",
+        action="append",
+        required=True,
+        help="Endpoint to listen on: unix:///path.sock, tcp://127.0.0.1:PORT or shm://DIR (repeatable)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        default="bench-output/stream",
+        help="Directory for per-process pft_<pid>.json stores (default: bench-output/stream)",
+    )
+    parser.add_argument(
+        "--store",
+        choices=("per-process", "merged", "both"),
+        default="per-process",
+        help="Write one JSON per process, one merged process tree, or both",
+    )
+    parser.add_argument(
+        "--merged",
+        default=None,
+        help="Merged output path (default: <output-dir>/pft_merged.json)",
+    )
+    parser.add_argument(
+        "--write-interval",
+        type=float,
+        default=2.0,
+        help="Seconds between store writes while streams are live",
+    )
+    parser.add_argument(
+        "--exit-after-idle",
+        type=float,
+        default=0,
+        help="Exit once no process has been connected for N seconds (0 runs until interrupted)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    merged_path = args.merged or (
+        str(output_dir / "pft_merged.json") if args.store != "per-process" else None
+    )
+    collector = Collector(output_dir, store=args.store, merged_path=merged_path)
+    endpoints = []
+    for spec in args.listen:
+        endpoints.extend(parse_endpoints(spec))
+    servers = [_serve(endpoint, collector) for endpoint in endpoints]
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    sys.stderr.write(
+        f"[pytraceflow-collector] Listening on {', '.join(args.listen)} -> {output_dir}\n"
+    )
+    sys.stderr.flush()
+    while not stop.wait(args.write_interval):
+        collector.write()
+        if (
+            args.exit_after_idle > 0
+            and collector.stores
+            and collector.active == 0
+            and time.time() - collector.last_activity >= args.exit_after_idle
+        ):
+            break
+    for server, (family, address) in zip(servers, endpoints):
+        server.shutdown()
+        if family == "shm":
+            continue
+        server.server_close()
+        if family == "unix" and os.path.exists(address):
+            os.unlink(address)
+    collector.write(final=True)
+    events = sum(store.events for store in collector.stores.values())
+    sys.stderr.write(
+        f"[pytraceflow-collector] {len(collector.stores)} processes, {events} events stored in {output_dir}\n"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Merge per-process PyTraceFlow traces into a single process-tree trace.
+
+Autotrace writes one pft_<pid>.json per process. This tool loads every trace in a
+directory (in parallel), reassembles rotated segments from their manifests and
+attaches each child process root under the call that spawned it, using the
+pid/ppid/parent_call_id metadata recorded in the root entries (os.exec*() images
+hang under the call that exec'd them). Pool task roots
+are attached under the call that submitted them.
+
+Usage:
+  pytraceflow merge bench-output/autotrace -o merged.json
+  python pytraceflow_merge.py bench-output/autotrace -o merged.json --jobs 4
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from pytraceflow import prune_calls
+from pytraceflow_shapes import expand_tree
+from pytraceflow_values import resolve_trace
+
+_PID_RE = re.compile(r"(\d+)")
+_SEGMENT_RE = re.compile(r"\.seg\d+\.json$")
+
+
+def _pid_from_name(path):
+    match = _PID_RE.search(path.name)
+    return int(match.group(1)) if match else None
+
+
+def discover(directory):
+    """Return trace sources in a directory: plain JSON files and rotation manifests."""
+    directory = Path(directory)
+    manifests = sorted(directory.glob("*.manifest.json"))
+    sources = [str(p) for p in manifests]
+    for path in sorted(directory.glob("*.json")):
+        if path.name.endswith(".manifest.json") or path.name.endswith(".index.json"):
+            continue
+        if _SEGMENT_RE.search(path.name):
+            # segments are loaded through their manifest
+            continue
+        sources.append(str(path))
+    return sources
+
+
+def _fold_continued(node, siblings, nodes):
+    """Fold `node` into its earlier copy (same id) or append it to `siblings`.
+
+    Ids are matched across the whole tree: a carried node may sit under another
+    parent once the final segment is pruned.
+    """
+    node_id = node.get("id")
+    known = nodes.get(node_id) if node_id is not None else None
+    calls = node.get("calls", [])
+    if known is None:
+        if node_id is not None:
+            nodes[node_id] = node
+        siblings.append(node)
+        known = node
+        if "calls" in node:
+            node["calls"] = []
+    else:
+        for key, val in node.items():
+            if key in ("calls", "continued"):
+                continue
+            if key == "values" and isinstance(known.get(key), dict):
+                # unresolved value tables: every segment holds the keys it refers to
+                known[key].update(val or {})
+            else:
+                known[key] = val
+    for child in calls:
+        _fold_continued(child, known.setdefault("calls", []), nodes)
+
+
+def fold_segments(segments):
+    """Fold rotated segments (their root lists, in order) into one list of roots.
+
+    A segment repeats the spine that was in flight when it opened ("continued"
+    nodes); those keep their ids and are folded into the earlier copy. The
+    process root spans the sum of the segment spans. Only the last segment was
+    pruned when it was written, so the folded tree is pruned again.
+    """
+    roots = []
+    nodes = {}
+    total_ms = 0.0
+    for segment_roots in segments:
+        if segment_roots and total_ms is not None:
+            span = segment_roots[0].get("duration_ms")
+            total_ms = None if span is None else total_ms + span
+        for root in segment_roots:
+            _fold_continued(root, roots, nodes)
+    for root in roots:
+        prune_calls(root)
+    if roots:
+        roots[0].pop("segment", None)
+        roots[0].pop("continues", None)
+        if total_ms is not None:
+            roots[0]["duration_ms"] = round(total_ms, 3)
+    return roots
+
+
+def _load_manifest(path):
+    manifest = json.loads(path.read_text(encoding="utf-8"))
+    segments = []
+    for segment in manifest.get("segments", []):
+        seg_path = path.parent / segment.get("path", "")
+        if not seg_path.is_file():
+            continue
+        roots = json.loads(seg_path.read_text(encoding="utf-8"))
+        if not roots:
+            continue
+        for node in roots:
+            if isinstance(node, dict) and node.get("shapes"):
+                expand_tree(node)
+        # every segment carries its own value table
+        resolve_trace(roots)
+        segments.append(roots)
+    roots = fold_segments(segments)
+    if roots:
+        roots[0].setdefault("pid", manifest.get("pid"))
+    return roots
+
+
+def load_process_trace(source):
+    """Load one process trace as [process_root, *task_roots]; None for non-traces."""
+    path = Path(source)
+    try:
+        if path.name.endswith(".manifest.json"):
+            roots = _load_manifest(path)
+        else:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            roots = data if isinstance(data, list) else []
+    except (OSError, ValueError):
+        return None
+    if not roots or not isinstance(roots[0], dict) or "calls" not in roots[0]:
+        return None
+    for node in roots:
+        if isinstance(node, dict) and node.get("shapes"):
+            # call ids inside folded subtrees are spawn points too
+            expand_tree(node)
+    # one value table per file, shared by its roots
+    resolve_trace(roots)
+    root = roots[0]
+    if root.get("pid") is None:
+        root["pid"] = _pid_from_name(path)
+    root["source"] = path.name
+    return roots
+
+
+def _prefix_ids(node, pid, index):
+    node_id = node.get("id")
+    if node_id is not None:
+        index[node_id] = node
+        node["id"] = f"{pid}:{node_id}"
+    for child in node.get("calls", []):
+        _prefix_ids(child, pid, index)
+
+
+def _process_key(root):
+    # an os.exec*() image keeps its pid; exec_depth tells the images apart
+    return (root.get("pid"), root.get("exec_depth") or 0)
+
+
+def merge_traces(traces):
+    """Attach child process roots and pool task roots under their spawning calls.
+
+    Takes one [process_root, *task_roots] list per process and returns
+    (merged_roots, process_index). Node ids become "<pid>:<id>" strings
+    ("<pid>.<exec_depth>:<id>" for exec'd images) so they stay unique across
+    processes.
+    """
+    by_key = {}
+    tasks = {}
+    node_index = {}
+    skipped = []
+    for roots in traces:
+        root = roots[0]
+        key = _process_key(root)
+        if key[0] is None or key in by_key:
+            # pid reuse or a leftover file: only one trace can own the pid's call ids
+            reason = "no pid" if key[0] is None else f"duplicate of {by_key[key].get('source')}"
+            sys.stderr.write(
+                f"[pytraceflow-merge] Skipped {root.get('source') or 'trace'} "
+                f"(pid={key[0]} exec_depth={key[1]}): {reason}\n"
+            )
+            skipped.append(
+                {
+                    "pid": key[0],
+                    "exec_depth": key[1],
+                    "source": root.get("source"),
+                    "skipped": reason,
+                }
+            )
+            continue
+        by_key[key] = root
+        tasks[key] = roots[1:]
+        node_index[key] = {}
+        prefix = key[0] if not key[1] else f"{key[0]}.{key[1]}"
+        for node in roots:
+            _prefix_ids(node, prefix, node_index[key])
+
+    def _spawn_point(parent_pid, parent_call_id, exec_depth=0):
+        key = (parent_pid, exec_depth or 0)
+        if key not in by_key:
+            return None
+        return node_index[key].get(parent_call_id) or by_key[key]
+
+    merged = []
+    processes = []
+    for key in sorted(by_key, key=lambda k: (k[0] or 0, k[1])):
+        root = by_key[key]
+        pid, exec_depth = key
+        ppid = root.get("ppid")
+        parent_call_id = root.get("parent_call_id")
+        if exec_depth:
+            parent = _spawn_point(pid, parent_call_id, exec_depth - 1)
+        elif ppid != pid:
+            parent = _spawn_point(ppid, parent_call_id, root.get("parent_exec_depth"))
+        else:
+            parent = None
+        if parent is not None:
+            parent.setdefault("calls", []).append(root)
+        else:
+            merged.append(root)
+        task_run_ms = 0.0
+        task_queue_ms = 0.0
+        for task in tasks[key]:
+            info = task.get("task") or {}
+            task_run_ms += info.get("run_ms") or 0.0
+            task_queue_ms += info.get("queue_ms") or 0.0
+            target = _spawn_point(info.get("parent_pid"), info.get("parent_call_id"))
+            (target or root).setdefault("calls", []).append(task)
+        processes.append(
+            {
+                "pid": pid,
+                "exec_depth": exec_depth,
+                "ppid": ppid,
+                "parent_call_id": parent_call_id,
+                "attached_to": parent.get("id") if parent is not None else None,
+                "source": root.get("source"),
+                "nodes": len(node_index[key]),
+                "tasks": len(tasks[key]),
+                "task_run_ms": round(task_run_ms, 3),
+                "task_queue_ms": round(task_queue_ms, 3),
+            }
+        )
+    return merged, processes + skipped
+
+
+def _load_all(sources, jobs):
+    if jobs <= 1 or len(sources) <= 1:
+        return [load_process_trace(src) for src in sources]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(load_process_trace, sources, chunksize=4))
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="pytraceflow merge",
+        description="Merge per-process PyTraceFlow traces into one process-tree trace",
+    )
+    parser.add_argument("directory", help="Directory with pft_<pid>.json traces (PYTRACEFLOW_OUT_DIR)")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="pft_merged.json",
+        help="Merged JSON output path (default: pft_merged.json)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Worker processes used to load traces (default: CPU count)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    sources = discover(args.directory)
+    output = Path(args.output).resolve()
+    sources = [src for src in sources if Path(src).resolve() != output]
+    if not sources:
+        sys.stderr.write(f"[pytraceflow-merge] No traces found in {args.directory}\n")
+        sys.exit(1)
+    traces = [roots for roots in _load_all(sources, args.jobs) if roots]
+    merged, processes = merge_traces(traces)
+    output.write_text(
+        json.dumps(merged, ensure_ascii=True, separators=(",", ":")), encoding="utf-8"
+    )
+    index_path = output.with_name(f"{output.stem}.index.json")
+    index_path.write_text(json.dumps({"processes": processes}, indent=2), encoding="utf-8")
+    merged_count = sum(1 for proc in processes if "skipped" not in proc)
+    sys.stderr.write(
+        f"[pytraceflow-merge] Merged {merged_count} processes into {output} "
+        f"({len(merged)} top-level roots, index: {index_path.name})\n"
+    )
+
+
+if __name__ == "__main__":
+    main()
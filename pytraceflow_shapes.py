@@ -0,0 +1,244 @@
+"""
+Structural deduplication of repeated call subtrees ("shapes").
+
+    pytraceflow dedup pft.json -o pft.shapes.json --min-nodes 3
+    pytraceflow dedup pft.shapes.json -o pft.full.json --expand
+    python pytraceflow.py -s app.py -o pft.json --dedup-shapes   # at the final write
+
+Loops that call the same chain produce many subtrees with the same shape: the
+same module/called/callable at every node, recursively. dedup_tree() stores each
+repeated shape once in root["shapes"][sid] and replaces every occurrence with a
+reference node. The reference keeps the fields of its own top call (so tools
+that do not expand still show name, duration, inputs and output) plus:
+
+  "shape": sid
+  "ids", "durations":  one entry per node of the subtree, in preorder
+  "diff":              {"<preorder index>": {field: value}} where a payload
+                       differs from the template (inputs, output, ...); fields
+                       the node does not have are listed under "$absent"
+
+The template is the first occurrence without ids and durations; its top only
+keeps module/called/callable, since every reference carries its own top fields.
+expand_node() rebuilds each subtree from template + reference, so nothing is lost. Subtrees
+holding errors or special nodes (tasks, threads, scopes, requests, instances,
+annotated calls) are never folded.
+"""
+
+import json
+import sys
+from pathlib import Path
+
+# plain call nodes; anything carrying other keys stays as recorded (also the
+# --fold-runs rule in pytraceflow, so both features agree on what is plain)
+_PLAIN_KEYS = frozenset(
+    (
+        "id", "callable", "module", "called", "caller", "instance_id", "inputs",
+        "inputs_after", "output", "error", "duration_ms", "memory_before",
+        "memory_after", "run", "calls",
+    )
+)
+_PER_NODE = ("id", "duration_ms", "calls")
+_REF_KEYS = frozenset(("shape", "ids", "durations", "diff", "calls"))
+_STRUCTURE_KEYS = ("module", "called", "callable", "calls")
+_ABSENT = "$absent"
+
+
+def _preorder(node):
+    out = []
+    pending = [node]
+    while pending:
+        current = pending.pop()
+        out.append(current)
+        pending.extend(reversed(current.get("calls", ())))
+    return out
+
+
+def _shapes_of(root):
+    """{id(node): (shape number or None, subtree size)} computed bottom-up."""
+    table = {}
+    info = {}
+    pending = [(root, False)]
+    while pending:
+        node, done = pending.pop()
+        children = node.get("calls", ())
+        if not done:
+            pending.append((node, True))
+            pending.extend((child, False) for child in children)
+            continue
+        child_info = [info[id(child)] for child in children]
+        if (
+            node.keys() <= _PLAIN_KEYS
+            and not node.get("error")
+            and all(shape is not None for shape, _ in child_info)
+        ):
+            key = (
+                node.get("module"),
+                node.get("called"),
+                node.get("callable"),
+                tuple(shape for shape, _ in child_info),
+            )
+            shape = table.setdefault(key, len(table))
+            info[id(node)] = (shape, 1 + sum(size for _, size in child_info))
+        else:
+            info[id(node)] = (None, 0)
+    return info
+
+
+def dedup_tree(root, min_nodes=3):
+    """Fold repeated subtrees of at least `min_nodes` nodes under root; returns stats."""
+    min_nodes = max(int(min_nodes), 2)
+    info = _shapes_of(root)
+    shapes = root.setdefault("shapes", {})
+    templates = {}
+    refs = 0
+    folded = 0
+    frontier = [root]
+    while frontier:
+        # outermost candidates only: a folded subtree is not searched again
+        candidates = {}
+        pending = frontier
+        while pending:
+            node = pending.pop()
+            calls = node.get("calls", ())
+            for index, child in enumerate(calls):
+                shape, size = info[id(child)]
+                if shape is not None and size >= min_nodes:
+                    candidates.setdefault(shape, []).append((calls, index, child))
+                else:
+                    pending.append(child)
+        frontier = []
+        for shape, found in candidates.items():
+            if shape not in templates:
+                if len(found) < 2:
+                    # a lone occurrence would only add a template; look below it instead
+                    frontier.append(found[0][2])
+                    continue
+                sid = f"s{len(shapes) + 1}"
+                templates[shape] = (sid, found[0][2], _preorder(found[0][2]))
+            sid, template, template_nodes = templates[shape]
+            for calls, index, node in found:
+                nodes = template_nodes if node is template else _preorder(node)
+                calls[index] = _reference(sid, node, nodes, template_nodes)
+                refs += 1
+                folded += len(nodes) - 1
+            if sid not in shapes:
+                for tpl in template_nodes:
+                    tpl.pop("id", None)
+                    tpl.pop("duration_ms", None)
+                for key in [key for key in template if key not in _STRUCTURE_KEYS]:
+                    del template[key]
+                shapes[sid] = template
+    if not shapes:
+        root.pop("shapes", None)
+    return {"shapes": len(shapes), "refs": refs, "folded_nodes": folded}
+
+
+def _reference(sid, top, nodes, template_nodes):
+    ref = {key: val for key, val in top.items() if key != "calls"}
+    ref["shape"] = sid
+    ref["ids"] = [node.get("id") for node in nodes]
+    ref["durations"] = [node.get("duration_ms") for node in nodes]
+    if nodes is not template_nodes:
+        diff = {}
+        for index in range(1, len(nodes)):
+            node = nodes[index]
+            tpl = template_nodes[index]
+            changed = {}
+            absent = []
+            for key in node.keys() | tpl.keys():
+                if key in _PER_NODE:
+                    continue
+                if key not in node:
+                    absent.append(key)
+                elif key not in tpl or node[key] != tpl[key]:
+                    changed[key] = node[key]
+            if absent:
+                changed[_ABSENT] = sorted(absent)
+            if changed:
+                diff[str(index)] = changed
+        if diff:
+            ref["diff"] = diff
+    ref["calls"] = []
+    return ref
+
+
+def expand_node(ref, shapes):
+    """Rebuild the full subtree a reference node stands for."""
+    template = shapes[ref["shape"]]
+    copies = {}
+    for tpl in _preorder(template):
+        copy = dict(tpl)
+        copy["calls"] = []
+        copies[id(tpl)] = copy
+    for tpl in _preorder(template):
+        copies[id(tpl)]["calls"] = [copies[id(child)] for child in tpl.get("calls", ())]
+    top = copies[id(template)]
+    nodes = _preorder(top)
+    for index, node in enumerate(nodes):
+        node["id"] = ref["ids"][index]
+        node["duration_ms"] = ref["durations"][index]
+    for index, fields in (ref.get("diff") or {}).items():
+        node = nodes[int(index)]
+        node.update(fields)
+        node.pop(_ABSENT, None)
+        for key in fields.get(_ABSENT, ()):
+            node.pop(key, None)
+    # the top is exactly the reference's own call (template top keys never leak through)
+    calls = top["calls"]
+    top.clear()
+    top.update((key, val) for key, val in ref.items() if key not in _REF_KEYS)
+    top["calls"] = calls
+    return top
+
+
+def expand_tree(root):
+    """Replace every reference under root by its full subtree (in place)."""
+    shapes = root.pop("shapes", None)
+    root.pop("shape_dedup", None)
+    if not shapes:
+        return root
+    pending = [root]
+    while pending:
+        node = pending.pop()
+        calls = node.get("calls", ())
+        for index, child in enumerate(calls):
+            if "shape" in child and child["shape"] in shapes:
+                calls[index] = child = expand_node(child, shapes)
+            pending.append(child)
+    return root
+
+
+def _parse_args(argv=None):
+    # imported here: pytraceflow (so every autotraced process) imports this module
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fold (or expand) repeated subtrees of a PyTraceFlow trace")
+    parser.add_argument("input", help="Trace JSON written by pytraceflow")
+    parser.add_argument("-o", "--output", default=None, help="Output JSON (default: <input>.shapes.json)")
+    parser.add_argument("--min-nodes", type=int, default=3, help="Smallest subtree worth folding")
+    parser.add_argument("--expand", action="store_true", help="Expand references back into full subtrees")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    path = Path(args.input)
+    roots = json.loads(path.read_text(encoding="utf-8"))
+    if not isinstance(roots, list):
+        sys.stderr.write("[FlowTrace] dedup expects a trace list (merge rotated segments first)\n")
+        sys.exit(1)
+    for root in roots:
+        if args.expand:
+            expand_tree(root)
+        else:
+            root["shape_dedup"] = dedup_tree(root, args.min_nodes)
+    suffix = ".full.json" if args.expand else ".shapes.json"
+    output = Path(args.output) if args.output else path.with_name(path.stem + suffix)
+    output.write_text(json.dumps(roots, ensure_ascii=True, separators=(",", ":")), encoding="utf-8")
+    sys.stderr.write(
+        f"[FlowTrace] {path.stat().st_size} -> {output.stat().st_size} bytes ({output})\n"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,616 @@
+"""
+Live event streaming from a traced process to pytraceflow collector.
+
+Two transports share the event model below:
+ - sockets (unix:// or tcp://): a bounded queue drained by a sender thread;
+ - shm://DIR: a shared-memory ring of fixed-size binary records that the hook
+   writes directly (no thread, no syscall per event); the collector finds the
+   rings through small pft_<pid>_<name>.ring files in DIR and drains them.
+
+The profiler hook only appends small tuples to a bounded in-memory queue; a
+background thread batches them into newline-delimited JSON messages and sends
+them over a Unix socket (or TCP on localhost). When the collector is slow or
+gone, the queue fills and new events are dropped and counted, so the traced
+application never blocks on the collector.
+
+Messages (one JSON array per line):
+  ["hello", {root fields}]            first message on every connection
+  ["ev", [event, ...]]                a batch of events
+  ["bye", {root fields + "stream"}]   last message, final root state
+
+Events:
+  ["c", parent_id, id, callable, module, called, caller, instance_id, inputs, started, memory_before]
+  ["r", id, duration_ms, output, error, inputs_after, memory_after]
+  ["n", parent_id, {node fields}]     task/thread/instance nodes
+  ["u", id, {fields}]                 late updates of such nodes
+"""
+
+import collections
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Used when a unix:// endpoint is requested on a platform without AF_UNIX
+DEFAULT_TCP_PORT = 7531
+
+
+def parse_endpoints(spec):
+    """Parse "unix:///path.sock,tcp://127.0.0.1:7531" into [(family, address), ...]."""
+    endpoints = []
+    for url in str(spec).split(","):
+        url = url.strip()
+        if not url:
+            continue
+        if url.startswith("shm://"):
+            endpoints.append(("shm", url[len("shm://"):] or "."))
+        elif url.startswith("unix://"):
+            if hasattr(socket, "AF_UNIX"):
+                endpoints.append(("unix", url[len("unix://"):]))
+            else:
+                endpoints.append(("tcp", ("127.0.0.1", DEFAULT_TCP_PORT)))
+        elif url.startswith("tcp://"):
+            host, _, port = url[len("tcp://"):].rpartition(":")
+            endpoints.append(("tcp", (host or "127.0.0.1", int(port or DEFAULT_TCP_PORT))))
+        else:
+            raise ValueError(
+                f"Unsupported stream endpoint: {url} (use unix://, tcp:// or shm://)"
+            )
+    if not endpoints:
+        raise ValueError("No stream endpoint given")
+    return endpoints
+
+
+def connect(endpoint, timeout=2.0):
+    family, address = endpoint
+    if family == "unix":
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(address)
+    except OSError:
+        sock.close()
+        raise
+    sock.settimeout(None)
+    return sock
+
+
+def _encode(message):
+    return (json.dumps(message, ensure_ascii=True, separators=(",", ":")) + "\n").encode(
+        "utf-8"
+    )
+
+
+class StreamSender:
+    """Bounded event queue drained to a collector by a background thread."""
+
+    def __init__(self, spec, queue_size=100_000, batch_size=1024, interval=0.05):
+        self.endpoints = parse_endpoints(spec)
+        self.queue_size = int(queue_size)
+        self.batch_size = int(batch_size)
+        self.interval = float(interval)
+        self.sent = 0
+        self.dropped = 0
+        self._queue = collections.deque()
+        self._hello = None
+        self._sock = None
+        self._endpoint = None
+        self._retry_at = 0.0
+        self._backoff = 0.25
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def queued(self):
+        return len(self._queue)
+
+    def put(self, event):
+        # hot path: no locks, no syscalls; drop the newest event when full
+        if len(self._queue) >= self.queue_size:
+            self.dropped += 1
+            return
+        self._queue.append(event)
+
+    def start(self, hello):
+        self._hello = hello
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self, bye, timeout=5.0):
+        """Drain what is left, send the final root state and disconnect."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            if self._thread.is_alive():
+                # still stuck in sendall() on a stalled collector; do not block the exit
+                return
+            self._thread = None
+        bye = dict(bye)
+        bye["stream"] = {"sent": self.sent, "dropped": self.dropped + self.queued}
+        if self._ensure_connected(force=True):
+            try:
+                self._sock.sendall(_encode(["bye", bye]))
+            except OSError:
+                pass
+        self._disconnect()
+
+    def _run(self):
+        sys.setprofile(None)
+        while True:
+            stopping = self._stop.wait(self.interval)
+            try:
+                self._drain()
+            except Exception:
+                pass
+            if stopping:
+                return
+
+    def _drain(self):
+        queue = self._queue
+        while queue:
+            if not self._ensure_connected():
+                return
+            batch = []
+            popleft = queue.popleft
+            try:
+                for _ in range(self.batch_size):
+                    batch.append(popleft())
+            except IndexError:
+                pass
+            try:
+                payload = _encode(["ev", batch])
+            except (TypeError, ValueError, RecursionError):
+                # one unserializable event must not take the whole batch with it
+                batch = [event for event in batch if self._encodable(event)]
+                if not batch:
+                    continue
+                payload = _encode(["ev", batch])
+            try:
+                # blocks when the collector lags; the hook keeps running and drops instead
+                self._sock.sendall(payload)
+                self.sent += len(batch)
+            except OSError:
+                self.dropped += len(batch)
+                self._disconnect()
+
+    def _encodable(self, event):
+        try:
+            _encode(event)
+        except (TypeError, ValueError, RecursionError):
+            self.dropped += 1
+            return False
+        return True
+
+    def _ensure_connected(self, force=False):
+        if self._sock is not None:
+            return True
+        now = time.time()
+        if not force and now < self._retry_at:
+            return False
+        for endpoint in self.endpoints:
+            try:
+                sock = connect(endpoint)
+                sock.sendall(_encode(["hello", self._hello]))
+            except OSError:
+                continue
+            self._sock = sock
+            self._endpoint = endpoint
+            self._backoff = 0.25
+            return True
+        self._retry_at = now + self._backoff
+        self._backoff = min(self._backoff * 2, 5.0)
+        return False
+
+    def _disconnect(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+
+
+def open_sender(spec, queue_size=100_000):
+    """Return the event sender for a --stream spec (shm ring or socket queue)."""
+    endpoints = parse_endpoints(spec)
+    if endpoints[0][0] == "shm":
+        return ShmRingWriter(endpoints[0][1], slots=queue_size)
+    return StreamSender(spec, queue_size=queue_size)
+
+
+# Ring layout: 64-byte header followed by fixed 48-byte slots.
+# header: magic, slot size, slot count, write index, read index, overflow, closed, reader pid
+_RING_MAGIC = b"PFTRING1"
+_RING_HEADER = struct.Struct("<8sIIQQQQQ")
+_RING_HEADER_SIZE = 64
+_WRITE_OFF = 16
+_READ_OFF = 24
+_OVERFLOW_OFF = 32
+_CLOSED_OFF = 40
+_READER_OFF = 48
+_INDEX = struct.Struct("<Q")
+# slot: kind, flags, extra slots, str1, str2, str3, int1, int2, int3, float
+_SLOT = struct.Struct("<BBHIIIqqqd")
+_SLOT_SIZE = _SLOT.size
+# "extra" is a uint16: longest string one K_STRING record can carry (~3 MB)
+_MAX_STRING = 0xFFFF * _SLOT_SIZE
+
+K_STRING = 1  # string definition; raw utf-8 follows in "extra" slots
+K_CALL = 2
+K_RETURN = 3
+K_NODE = 4
+K_UPDATE = 5
+K_HELLO = 6
+K_BYE = 7
+K_MEMORY = 8  # memory snapshot for the K_CALL/K_RETURN record right after it
+# K_STRING flag: payload used once (inputs/outputs); names are kept for reuse
+_TRANSIENT = 1
+# K_RETURN flag: duration_ms was None
+_NO_DURATION = 1
+
+
+def _shared_memory(**kwargs):
+    """SharedMemory without the resource tracker.
+
+    Tracking would spawn a tracker process per traced process (itself autotraced
+    when subprocess tracing is on) and unlink rings before the collector drains
+    them. Rings are unlinked by the producer on close or by the collector when
+    the producer died.
+    """
+    from multiprocessing import resource_tracker, shared_memory
+
+    try:
+        return shared_memory.SharedMemory(track=False, **kwargs)
+    except TypeError:
+        pass
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kw: None
+    try:
+        return shared_memory.SharedMemory(**kwargs)
+    finally:
+        resource_tracker.register = register
+
+
+def _unlink_shared_memory(shm):
+    """SharedMemory.unlink() without telling a resource tracker we never registered with."""
+    from multiprocessing import resource_tracker
+
+    unregister = resource_tracker.unregister
+    resource_tracker.unregister = lambda *args, **kw: None
+    try:
+        # no-op on Windows: the mapping disappears with its last handle
+        shm.unlink()
+    except OSError:
+        pass
+    finally:
+        resource_tracker.unregister = unregister
+
+
+def _json_bytes(value):
+    return json.dumps(value, ensure_ascii=True, separators=(",", ":")).encode("utf-8")
+
+
+class _RingFull(Exception):
+    pass
+
+
+class ShmRingWriter:
+    """Writes events as fixed-size records into a shared-memory ring.
+
+    The hook encodes straight into the mapped buffer; names are interned as
+    string records sent once, payloads travel as one-shot string records. When
+    the collector falls behind the event is dropped and the ring's overflow
+    counter is bumped instead of waiting.
+    """
+
+    def __init__(self, directory, slots=100_000):
+        self.directory = Path(directory)
+        self.slots = max(int(slots), 1024)
+        self.sent = 0
+        self.dropped = 0
+        self._shm = None
+        self._buf = None
+        self._write = 0
+        self._names = {}
+        self._next_sid = 1
+        self._lock = threading.Lock()
+        self._registry = None
+
+    @property
+    def queued(self):
+        if self._buf is None:
+            return 0
+        return self._write - _INDEX.unpack_from(self._buf, _READ_OFF)[0]
+
+    def start(self, hello):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._shm = _shared_memory(
+            create=True, size=_RING_HEADER_SIZE + self.slots * _SLOT_SIZE
+        )
+        self._buf = self._shm.buf
+        _RING_HEADER.pack_into(
+            self._buf, 0, _RING_MAGIC, _SLOT_SIZE, self.slots, 0, 0, 0, 0, 0
+        )
+        self._registry = self.directory / f"pft_{os.getpid()}_{self._shm.name.lstrip('/')}.ring"
+        tmp = self._registry.with_suffix(".tmp")
+        tmp.write_text(
+            json.dumps({"shm": self._shm.name, "pid": os.getpid(), "slots": self.slots}),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self._registry)
+        self._put_json(K_HELLO, hello)
+
+    def close(self, bye, timeout=5.0):
+        """Write the final root state, wait briefly for the collector and unlink the ring."""
+        if self._buf is None:
+            return
+        bye = dict(bye)
+        bye["stream"] = {"sent": self.sent, "dropped": self.dropped}
+        self._put_json(K_BYE, bye)
+        _INDEX.pack_into(self._buf, _CLOSED_OFF, 1)
+        attached = _INDEX.unpack_from(self._buf, _READER_OFF)[0]
+        deadline = time.time() + (timeout if attached else min(timeout, 1.0))
+        while self.queued > 0 and time.time() < deadline:
+            time.sleep(0.01)
+            if not attached:
+                attached = _INDEX.unpack_from(self._buf, _READER_OFF)[0]
+        self._buf = None
+        try:
+            self._shm.close()
+        except (OSError, BufferError):
+            pass
+        _unlink_shared_memory(self._shm)
+        try:
+            self._registry.unlink()
+        except OSError:
+            pass
+
+    def put(self, event):
+        buf = self._buf
+        if buf is None:
+            return
+        if self._write - _INDEX.unpack_from(buf, _READ_OFF)[0] >= self.slots:
+            # full: skip encoding entirely
+            self.dropped += 1
+            _INDEX.pack_into(buf, _OVERFLOW_OFF, _INDEX.unpack_from(buf, _OVERFLOW_OFF)[0] + 1)
+            return
+        with self._lock:
+            records = []
+            names = {}
+            try:
+                kind = event[0]
+                if kind == "c":
+                    (
+                        _, parent_id, node_id, callable_, module, called,
+                        caller, instance_id, inputs, started, memory,
+                    ) = event
+                    if memory:
+                        self._memory(memory, node_id, records)
+                    name = self._name(f"{module}\0{callable_}\0{called}", records, names)
+                    caller_sid = self._name(caller, records, names) if caller else 0
+                    inputs_sid = self._payload(inputs, records) if inputs else 0
+                    records.append(
+                        (
+                            (K_CALL, 0, 0, name, inputs_sid, caller_sid, node_id,
+                             -1 if parent_id is None else parent_id, instance_id or 0, started),
+                            None,
+                        )
+                    )
+                elif kind == "r":
+                    _, node_id, duration_ms, output, error, inputs_after, memory = event
+                    if memory:
+                        self._memory(memory, node_id, records)
+                    out_sid = self._payload(output, records) if output is not None else 0
+                    err_sid = self._payload(error, records) if error is not None else 0
+                    after_sid = self._payload(inputs_after, records) if inputs_after else 0
+                    flags = _NO_DURATION if duration_ms is None else 0
+                    records.append(
+                        (
+                            (K_RETURN, flags, 0, out_sid, err_sid, after_sid, node_id, 0, 0,
+                             duration_ms or 0.0),
+                            None,
+                        )
+                    )
+                elif kind in ("n", "u"):
+                    fields_sid = self._payload(event[2], records)
+                    target = event[1]
+                    records.append(
+                        (
+                            (K_NODE if kind == "n" else K_UPDATE, 0, 0, fields_sid, 0, 0,
+                             -1 if target is None else target, 0, 0, 0.0),
+                            None,
+                        )
+                    )
+                self._commit(records)
+            except (_RingFull, struct.error, TypeError, ValueError, RecursionError):
+                # called from the profile hook: a bad event is a drop, never an exception
+                self.dropped += 1
+                overflow = _INDEX.unpack_from(self._buf, _OVERFLOW_OFF)[0]
+                _INDEX.pack_into(self._buf, _OVERFLOW_OFF, overflow + 1)
+                return
+            self._names.update(names)
+            self.sent += 1
+
+    def _put_json(self, kind, body):
+        with self._lock:
+            records = []
+            try:
+                sid = self._payload(body, records)
+                records.append(((kind, 0, 0, sid, 0, 0, 0, 0, 0, 0.0), None))
+                self._commit(records)
+            except (_RingFull, struct.error, TypeError, ValueError, RecursionError):
+                self.dropped += 1
+
+    def _string(self, data, flags, records):
+        if len(data) > _MAX_STRING:
+            raise _RingFull()
+        sid = self._next_sid
+        self._next_sid += 1
+        extra = (len(data) + _SLOT_SIZE - 1) // _SLOT_SIZE
+        records.append(((K_STRING, flags, extra, sid, 0, 0, len(data), 0, 0, 0.0), data))
+        return sid
+
+    def _name(self, text, records, names):
+        sid = self._names.get(text) or names.get(text)
+        if sid is None:
+            # only remembered once the record actually made it into the ring
+            sid = names[text] = self._string(text.encode("utf-8"), 0, records)
+        return sid
+
+    def _payload(self, value, records):
+        data = _json_bytes(value)
+        if len(data) > _MAX_STRING:
+            # keep the call, not a payload the slot header cannot describe
+            data = _json_bytes(f"<{len(data)} bytes: too large for the shm ring>")
+        return self._string(data, _TRANSIENT, records)
+
+    def _memory(self, memory, node_id, records):
+        sid = self._payload(memory, records)
+        records.append(((K_MEMORY, 0, 0, sid, 0, 0, node_id, 0, 0, 0.0), None))
+
+    def _commit(self, records):
+        buf = self._buf
+        need = sum(1 + values[2] for values, _ in records)
+        if need > self.slots:
+            raise _RingFull()
+        read = _INDEX.unpack_from(buf, _READ_OFF)[0]
+        if self._write + need - read > self.slots:
+            raise _RingFull()
+        index = self._write
+        for values, data in records:
+            _SLOT.pack_into(buf, _RING_HEADER_SIZE + (index % self.slots) * _SLOT_SIZE, *values)
+            index += 1
+            if data:
+                index = self._write_raw(index, data)
+        self._write = index
+        # publish after the slots are in place
+        _INDEX.pack_into(buf, _WRITE_OFF, index)
+
+    def _write_raw(self, index, data):
+        buf = self._buf
+        slots = (len(data) + _SLOT_SIZE - 1) // _SLOT_SIZE
+        pos = 0
+        while pos < len(data):
+            start = index % self.slots
+            run = min(self.slots - start, slots - pos // _SLOT_SIZE)
+            chunk = data[pos : pos + run * _SLOT_SIZE]
+            offset = _RING_HEADER_SIZE + start * _SLOT_SIZE
+            buf[offset : offset + len(chunk)] = chunk
+            pos += run * _SLOT_SIZE
+            index += run
+        return index
+
+
+class ShmRingReader:
+    """Collector side of a ShmRingWriter ring: decodes records back into stream events."""
+
+    def __init__(self, name):
+        self._shm = _shared_memory(name=name)
+        self._buf = self._shm.buf
+        magic, slot_size, slots = struct.unpack_from("<8sII", self._buf, 0)
+        if magic != _RING_MAGIC or slot_size != _SLOT_SIZE:
+            self.close()
+            raise ValueError(f"{name} is not a PyTraceFlow ring")
+        self.slots = slots
+        self._strings = {}
+        self._memory = None
+        _INDEX.pack_into(self._buf, _READER_OFF, os.getpid())
+
+    @property
+    def closed(self):
+        return bool(_INDEX.unpack_from(self._buf, _CLOSED_OFF)[0])
+
+    @property
+    def overflow(self):
+        return _INDEX.unpack_from(self._buf, _OVERFLOW_OFF)[0]
+
+    def _text(self, sid):
+        if not sid:
+            return None
+        text, flags = self._strings.get(sid, (None, 0))
+        if flags & _TRANSIENT:
+            self._strings.pop(sid, None)
+        return text
+
+    def _value(self, sid):
+        text = self._text(sid)
+        return json.loads(text) if text is not None else None
+
+    def _read_raw(self, index, extra, length):
+        parts = []
+        remaining = extra
+        while remaining:
+            start = index % self.slots
+            run = min(self.slots - start, remaining)
+            offset = _RING_HEADER_SIZE + start * _SLOT_SIZE
+            parts.append(bytes(self._buf[offset : offset + run * _SLOT_SIZE]))
+            index += run
+            remaining -= run
+        return b"".join(parts)[:length]
+
+    def _take_memory(self, node_id):
+        memory, self._memory = self._memory, None
+        if memory is None or memory[0] != node_id:
+            return None
+        return memory[1]
+
+    def drain(self):
+        """Decode everything published so far into [("hello"|"ev"|"bye", body), ...]."""
+        buf = self._buf
+        write = _INDEX.unpack_from(buf, _WRITE_OFF)[0]
+        index = _INDEX.unpack_from(buf, _READ_OFF)[0]
+        messages = []
+        events = []
+        while index < write:
+            kind, flags, extra, s1, s2, s3, q1, q2, q3, d1 = _SLOT.unpack_from(
+                buf, _RING_HEADER_SIZE + (index % self.slots) * _SLOT_SIZE
+            )
+            index += 1
+            if kind == K_STRING:
+                data = self._read_raw(index, extra, q1)
+                index += extra
+                self._strings[s1] = (data.decode("utf-8"), flags)
+            elif kind == K_MEMORY:
+                self._memory = (q1, self._value(s1))
+            elif kind == K_CALL:
+                module, callable_, called = (self._text(s1) or "\0\0").split("\0", 2)
+                events.append(
+                    [
+                        "c", None if q2 < 0 else q2, q1, callable_, module, called,
+                        self._text(s3), q3 or None, self._value(s2) or {}, d1, self._take_memory(q1),
+                    ]
+                )
+            elif kind == K_RETURN:
+                duration = None if flags & _NO_DURATION else d1
+                events.append(
+                    ["r", q1, duration, self._value(s1), self._value(s2), self._value(s3), self._take_memory(q1)]
+                )
+            elif kind in (K_NODE, K_UPDATE):
+                target = None if q1 < 0 else q1
+                events.append(["n" if kind == K_NODE else "u", target, self._value(s1)])
+            elif kind in (K_HELLO, K_BYE):
+                if events:
+                    messages.append(("ev", events))
+                    events = []
+                messages.append(("hello" if kind == K_HELLO else "bye", self._value(s1)))
+        if events:
+            messages.append(("ev", events))
+        _INDEX.pack_into(buf, _READ_OFF, index)
+        return messages
+
+    def close(self, unlink=False):
+        self._buf = None
+        try:
+            self._shm.close()
+        except (OSError, BufferError):
+            pass
+        if unlink:
+            # producer died without cleaning up
+            _unlink_shared_memory(self._shm)
@@ -0,0 +1,166 @@
+"""
+Value table for repeated input/output payloads.
+
+    python pytraceflow.py -s app.py -o pft.json --intern-values          # at capture time
+    pytraceflow values pft.json -o pft.values.json --min-bytes 64
+    pytraceflow values pft.values.json -o pft.full.json --resolve
+
+The same config dicts, lookup tables and long reprs are often captured on many
+nodes. With interning on, every argument value (inputs, inputs_after) and return
+value whose JSON is at least `min_bytes` long is stored once in root["values"]
+and the node holds {"$v": key} in its place. Keys come from a hash of the
+serialized JSON, so equal payloads share an entry whichever object produced
+them. resolve_trace() puts the values back.
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import sys
+from pathlib import Path
+
+REF = "$v"
+# fields holding {name: value} dicts of arguments; "output" holds the value itself
+_ARG_FIELDS = ("inputs", "inputs_after")
+
+
+class ValueTable:
+    """Content-addressed payloads of one trace; `values` is what lands in the JSON."""
+
+    def __init__(self, min_bytes=64):
+        self.min_bytes = max(int(min_bytes), 1)
+        self.values = {}
+        self.hits = 0
+        self._keys = {}
+        self._ids = itertools.count(1)
+
+    def intern(self, value):
+        """Reference to `value` in the table, or the value itself when too small."""
+        if isinstance(value, str):
+            if len(value) < self.min_bytes:
+                return value
+        elif not isinstance(value, (dict, list)) or not value:
+            return value
+        text = json.dumps(value, ensure_ascii=True, separators=(",", ":"))
+        if len(text) < self.min_bytes:
+            return value
+        digest = hashlib.blake2b(text.encode("ascii"), digest_size=12).digest()
+        key = self._keys.get(digest)
+        if key is None:
+            key = self._keys[digest] = f"v{next(self._ids)}"
+            self.values[key] = value
+        else:
+            self.hits += 1
+        return {REF: key}
+
+    def retain(self, nodes):
+        """Drop every value no node in `nodes` refers to (rotation keeps the live spine)."""
+        keep = set()
+        for node in nodes:
+            keep.update(_refs_of(node))
+        for key in [key for key in self.values if key not in keep]:
+            del self.values[key]
+        self._keys = {digest: key for digest, key in self._keys.items() if key in keep}
+
+    def report(self):
+        return {"values": len(self.values), "hits": self.hits, "min_bytes": self.min_bytes}
+
+
+def _is_ref(value):
+    return isinstance(value, dict) and len(value) == 1 and REF in value
+
+
+def _refs_of(node):
+    for field in _ARG_FIELDS:
+        args = node.get(field)
+        if isinstance(args, dict):
+            for val in args.values():
+                if _is_ref(val):
+                    yield val[REF]
+    if _is_ref(node.get("output")):
+        yield node["output"][REF]
+
+
+def _walk(roots):
+    pending = list(roots)
+    while pending:
+        node = pending.pop()
+        yield node
+        pending.extend(node.get("calls", ()))
+        # pytraceflow dedup: shape templates and per-reference diffs hold payloads too
+        pending.extend((node.get("shapes") or {}).values())
+        pending.extend((node.get("diff") or {}).values())
+
+
+def resolve_node(node, values):
+    """Replace the references in one node's payload fields (in place)."""
+    for field in _ARG_FIELDS:
+        args = node.get(field)
+        if isinstance(args, dict):
+            for name, val in args.items():
+                if _is_ref(val) and val[REF] in values:
+                    args[name] = values[val[REF]]
+    output = node.get("output")
+    if _is_ref(output) and output[REF] in values:
+        node["output"] = values[output[REF]]
+    return node
+
+
+def resolve_trace(roots):
+    """Resolve every reference in a trace file's roots; the tables are removed."""
+    values = {}
+    for root in roots:
+        values.update(root.pop("values", None) or {})
+        root.pop("value_interning", None)
+    if values:
+        for node in _walk(roots):
+            resolve_node(node, values)
+    return roots
+
+
+def intern_trace(roots, min_bytes=64):
+    """Move repeated payloads of an existing trace into a value table on its first root."""
+    table = ValueTable(min_bytes)
+    for node in _walk(roots):
+        for field in _ARG_FIELDS:
+            args = node.get(field)
+            if isinstance(args, dict):
+                node[field] = {name: table.intern(val) for name, val in args.items()}
+        if "output" in node:
+            node["output"] = table.intern(node["output"])
+    if roots:
+        roots[0]["values"] = table.values
+        roots[0]["value_interning"] = table.report()
+    return table
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Intern (or resolve) repeated payloads of a PyTraceFlow trace")
+    parser.add_argument("input", help="Trace JSON written by pytraceflow")
+    parser.add_argument("-o", "--output", default=None, help="Output JSON (default: <input>.values.json)")
+    parser.add_argument("--min-bytes", type=int, default=64, help="Smallest serialized payload worth a table entry")
+    parser.add_argument("--resolve", action="store_true", help="Put the values back into every node")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    path = Path(args.input)
+    roots = json.loads(path.read_text(encoding="utf-8"))
+    if not isinstance(roots, list):
+        sys.stderr.write("[FlowTrace] values expects a trace list (merge rotated segments first)\n")
+        sys.exit(1)
+    resolve_trace(roots)
+    if not args.resolve:
+        intern_trace(roots, args.min_bytes)
+    suffix = ".full.json" if args.resolve else ".values.json"
+    output = Path(args.output) if args.output else path.with_name(path.stem + suffix)
+    output.write_text(json.dumps(roots, ensure_ascii=True, separators=(",", ":")), encoding="utf-8")
+    sys.stderr.write(
+        f"[FlowTrace] {path.stat().st_size} -> {output.stat().st_size} bytes ({output})\n"
+    )
+
+
+if __name__ == "__main__":
+    main()
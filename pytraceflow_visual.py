@@ -3,6 +3,9 @@ import html
 import json
 from pathlib import Path
 
+from pytraceflow_merge import fold_segments
+from pytraceflow_shapes import _preorder, expand_tree
+
 
 def _escape(value):
     if value is None:
@@ -12,6 +15,17 @@ def _escape(value):
     return html.escape(str(value))
 
 
+def _is_value_ref(value):
+    return isinstance(value, dict) and len(value) == 1 and "$v" in value
+
+
+def _value_refs_class(value):
+    # --intern-values: the field is resolved from root["values"] when opened
+    if _is_value_ref(value) or (isinstance(value, dict) and any(map(_is_value_ref, value.values()))):
+        return " value-refs"
+    return ""
+
+
 def _render_field(
     label, value, opened=False, extra_class="", icon_class="", raw_html=False, attrs=""
 ):
@@ -44,29 +58,43 @@ def _group_calls(calls):
     return ordered
 
 
-def _render_calls(calls, depth, node_id, node_title, path):
-    total = len(calls)
-    if not total:
-        return ""
+def _calls_body(calls, depth, path, shapes=None, shape_index=None):
     body = ""
     for g_idx, group in enumerate(_group_calls(calls)):
         key = group["key"]
         label = f"{key[1]} :: {key[2]} (x{len(group['calls'])})"
         if len(group["calls"]) == 1:
-            body += _render_node(group["calls"][0], depth + 1, path=f"{path}-g{g_idx}")
+            body += _render_node(group["calls"][0], depth + 1, path=f"{path}-g{g_idx}", shapes=shapes, shape_index=shape_index)
         else:
             body += (
                 "<details class='group'>"
                 + f"<summary class='group-title'>{_escape(label)}</summary>"
                 + "<div class='group-body'>"
                 + "".join(
-                    _render_node(child, depth + 1, path=f"{path}-g{g_idx}-c{idx}")
+                    _render_node(child, depth + 1, path=f"{path}-g{g_idx}-c{idx}", shapes=shapes, shape_index=shape_index)
                     for idx, child in enumerate(group["calls"])
                 )
                 + "</div></details>"
             )
+    return body
+
+
+def _render_calls(calls, depth, node_id, node_title, path, shapes=None, shape_index=None):
+    total = len(calls)
+    if not total:
+        return ""
+    body = _calls_body(calls, depth, path, shapes, shape_index)
     calls_id = f"calls-{node_id}" if node_id is not None else f"calls-{path}"
-    field = _render_field(
+    return _calls_field(total, calls_id, node_title, path) + f"<template id='{calls_id}'>{body}</template>"
+
+
+def _shape_template_id(path, sid):
+    # shapes are per root; the root's path prefix keeps ids unique across roots
+    return f"shape-{path.split('-', 1)[0]}-{sid}"
+
+
+def _calls_field(total, calls_id, node_title, path, extra_attrs=""):
+    return _render_field(
         f"calls ({total})",
         "<div class='calls-preview' data-i18n='callsPreview'>Abrir llamadas</div>",
         opened=False,
@@ -80,14 +108,13 @@ def _render_calls(calls, depth, node_id, node_title, path):
                 "data-i18n-label='calls' ",
                 f"data-count='{total}' ",
                 f"data-node-path='{_escape(path)}' ",
+                extra_attrs,
             ]
         ),
     )
-    template = f"<template id='{calls_id}'>{body}</template>"
-    return field + template
 
 
-def _render_node(node, depth=0, path="r"):
+def _render_node(node, depth=0, path="r", shapes=None, shape_index=None):
     if node.get("callable") == "__instance__":
         title = node.get("called")
     else:
@@ -104,6 +131,18 @@ def _render_node(node, depth=0, path="r"):
     calls = node.get("calls", [])
     node_id = node.get("id")
     dom_id = node_id if node_id is not None else path
+    degradation = node.get("degradation")
+    aggregates = node.get("aggregates")
+    overhead = node.get("overhead")
+    governor = node.get("overhead_governor")
+    request = node.get("request")
+    tail = node.get("tail_sampling")
+    capture = node.get("capture")
+    deadline = node.get("deadline")
+    run = node.get("run")
+    run_folding = node.get("run_folding")
+    shapes = node.get("shapes", shapes)
+    shape = node.get("shape") if shapes and node.get("shape") in shapes else None
 
     def _pick_mem(snapshot):
         if not isinstance(snapshot, dict):
@@ -146,6 +185,11 @@ def _render_node(node, depth=0, path="r"):
 
     mem_text = _format_mem(mem_before, mem_after)
 
+    degraded_text = None
+    if isinstance(degradation, dict) and degradation.get("level"):
+        first = (degradation.get("transitions") or [{}])[0]
+        degraded_text = f"{degradation.get('mode')} (from #{first.get('from_id')})"
+
     parts = [
         "<summary>",
         f"<span class='title'>{_escape(title)}</span>",
@@ -159,6 +203,11 @@ def _render_node(node, depth=0, path="r"):
             if mem_text
             else ""
         ),
+        (
+            f"<span class='badge badge-error badge-degraded'>degraded: {_escape(degraded_text)}</span>"
+            if degraded_text
+            else ""
+        ),
         "</span>",
         "</summary>",
     ]
@@ -166,6 +215,7 @@ def _render_node(node, depth=0, path="r"):
     inputs_class = "inputs-field"
     if not inputs:
         inputs_class += " inputs-empty"
+    inputs_class += _value_refs_class(inputs)
     parts.append(
         _render_field(
             "inputs", inputs, opened=False, extra_class=inputs_class, icon_class="icon-in"
@@ -177,12 +227,14 @@ def _render_node(node, depth=0, path="r"):
                 "inputs_after",
                 inputs_after,
                 opened=False,
+                extra_class=_value_refs_class(inputs_after).strip(),
                 icon_class="icon-in-after",
             )
         )
     output_class = "output-field"
     if output is None and not error:
         output_class += " output-empty"
+    output_class += _value_refs_class(output)
     parts.append(
         _render_field(
             "output",
@@ -192,8 +244,53 @@ def _render_node(node, depth=0, path="r"):
             icon_class="icon-out",
         )
     )
-    if calls:
-        parts.append(_render_calls(calls, depth, dom_id, title, path))
+    if request:
+        parts.append(_render_field("request", request, opened=False))
+    if degradation:
+        parts.append(
+            _render_field("degradation", degradation, opened=bool(degraded_text))
+        )
+    if aggregates:
+        parts.append(_render_field(f"aggregates ({len(aggregates)})", aggregates))
+    if governor:
+        parts.append(
+            _render_field("overhead governor", governor, opened=bool(governor.get("transitions")))
+        )
+    if overhead:
+        parts.append(_render_field("overhead", overhead, opened=False))
+    if tail:
+        parts.append(_render_field("tail sampling", tail, opened=False))
+    if capture:
+        parts.append(_render_field("capture", capture, opened=False))
+    if deadline:
+        parts.append(_render_field("deadline exceeded", deadline, opened=True))
+    if run:
+        # payloads/subtree are the first call's; duration_ms is the sum of the run
+        parts.append(_render_field(f"run (x{run.get('count')})", run, opened=False))
+    if run_folding:
+        parts.append(_render_field("run folding", run_folding, opened=False))
+    if shape:
+        # folded subtree: per-instance ids/timings here, the shared calls are rendered once
+        info = {
+            "shape": shape,
+            "nodes": len(node.get("ids") or ()),
+            "durations": node.get("durations"),
+            "diff": node.get("diff"),
+        }
+        parts.append(_render_field(f"shape {shape}", info, opened=False))
+        shape_calls = shapes[shape].get("calls", [])
+        if shape_calls:
+            parts.append(
+                _calls_field(
+                    len(shape_calls),
+                    _shape_template_id(path, shape),
+                    title,
+                    path,
+                    extra_attrs=f"data-shape-ref='{_escape(dom_id)}' ",
+                )
+            )
+    elif calls:
+        parts.append(_render_calls(calls, depth, dom_id, title, path, shapes, shape_index))
     parts.append("</div>")
     hue = (30 + depth * 38) % 360
     extra_cls = " python-internal" if str(node.get("callable", "")).startswith("<") else ""
@@ -203,6 +300,8 @@ def _render_node(node, depth=0, path="r"):
         + "' "
         + f"data-node-id='{_escape(dom_id)}' "
         + f"data-node-title='{_escape(title)}' "
+        # shape template nodes: preorder index into each reference's ids/durations/diff
+        + (f"data-shape-index='{shape_index[id(node)]}' " if shape_index and id(node) in shape_index else "")
         + f"style='--hue:"
         + str(hue)
         + "'>"
@@ -221,6 +320,15 @@ def _render_html(data):
         root_nodes = []
 
     tree = "".join(_render_node(node, path=f"r{idx}") for idx, node in enumerate(root_nodes))
+    for idx, node in enumerate(root_nodes):
+        for sid, template in (node.get("shapes") or {}).items():
+            # rendered once; the viewer fills in each reference's ids/durations/diff when opened
+            shape_index = {id(tpl): index for index, tpl in enumerate(_preorder(template))}
+            tree += (
+                f"<template id='{_shape_template_id(f'r{idx}', sid)}'>"
+                + _calls_body(template.get("calls", []), 1, f"r{idx}-{sid}", node["shapes"], shape_index)
+                + "</template>"
+            )
     data_json = json.dumps(data, ensure_ascii=True).replace("</", "<\\/")
     template = """<!doctype html>
 <html lang="es">
@@ -825,6 +933,77 @@ def _render_html(data):
     const tracerData = tracerDataEl ? JSON.parse(tracerDataEl.textContent) : [];
     const searchIndex = [];
     const searchMap = new Map();
+    // --intern-values: payloads stored once per trace, nodes hold {{"$v": key}}
+    const valueTable = {{}};
+    (Array.isArray(tracerData) ? tracerData : [tracerData]).forEach((root) => {{
+      if (root && root.values) Object.assign(valueTable, root.values);
+    }});
+    function isValueRef(value) {{
+      return value !== null && typeof value === 'object' && !Array.isArray(value)
+        && Object.keys(value).length === 1 && Object.prototype.hasOwnProperty.call(value, '$v');
+    }}
+    function resolveValues(value) {{
+      if (isValueRef(value)) return value.$v in valueTable ? valueTable[value.$v] : value;
+      if (value === null || typeof value !== 'object' || Array.isArray(value)) return value;
+      const out = {{}};
+      Object.keys(value).forEach((key) => {{ out[key] = isValueRef(value[key]) ? resolveValues(value[key]) : value[key]; }});
+      return out;
+    }}
+    document.addEventListener('toggle', (event) => {{
+      const field = event.target;
+      if (!field.open || !field.classList || !field.classList.contains('value-refs')) return;
+      const pre = field.querySelector(':scope > pre');
+      if (!pre || pre.hasAttribute('data-resolved')) return;
+      try {{
+        pre.textContent = JSON.stringify(resolveValues(JSON.parse(pre.textContent)), null, 2);
+      }} catch (e) {{}}
+      pre.setAttribute('data-resolved', '1');
+    }}, true);
+    // pytraceflow dedup: put one reference's ids, durations and diffs on a shape template copy
+    function applyShapeRef(fragment, shapeRef) {{
+      const entry = searchMap.get(String(shapeRef));
+      const ref = entry && entry.node;
+      if (!ref || !Array.isArray(ref.durations)) return;
+      const diff = ref.diff || {{}};
+      const payloadIcons = {{ inputs: 'icon-in', inputs_after: 'icon-in-after', output: 'icon-out' }};
+      fragment.querySelectorAll('[data-shape-index]').forEach((node) => {{
+        const index = Number(node.getAttribute('data-shape-index'));
+        if (Array.isArray(ref.ids) && ref.ids[index] !== undefined) {{
+          node.setAttribute('data-node-id', String(ref.ids[index]));
+        }}
+        const badge = node.querySelector(':scope > summary .badge-duration');
+        if (badge) badge.textContent = 'duration_ms: ' + ref.durations[index];
+        const fields = diff[String(index)];
+        if (!fields) return;
+        const rest = {{}};
+        Object.keys(fields).forEach((key) => {{
+          const value = fields[key];
+          const icon = payloadIcons[key] && node.querySelector(':scope > .content > .field-block > summary > .' + payloadIcons[key]);
+          const pre = icon && icon.closest('.field-block').querySelector(':scope > pre');
+          if (pre) {{
+            pre.textContent = JSON.stringify(resolveValues(value), null, 2);
+            pre.setAttribute('data-resolved', '1');
+          }} else if (key === 'error') {{
+            const err = node.querySelector(':scope > summary .badge-error');
+            if (err) err.textContent = 'error: ' + value;
+          }} else {{
+            rest[key] = value;
+          }}
+        }});
+        if (Object.keys(rest).length) {{
+          const block = document.createElement('details');
+          block.className = 'field-block';
+          block.innerHTML = '<summary class="field-label"><span class="icon" aria-hidden="true"></span>diff</summary><pre></pre>';
+          block.querySelector('pre').textContent = JSON.stringify(rest, null, 2);
+          const body = node.querySelector(':scope > .content');
+          if (body) body.appendChild(block);
+        }}
+      }});
+      // nested calls of the copy belong to the same reference
+      fragment.querySelectorAll('.calls-field[data-calls-id]').forEach((nested) => {{
+        if (!nested.hasAttribute('data-shape-ref')) nested.setAttribute('data-shape-ref', String(shapeRef));
+      }});
+    }}
     (function buildIndex() {{
       function walk(node, path, parentId) {{
         const domId = (node && node.id !== undefined && node.id !== null) ? String(node.id) : path;
@@ -832,6 +1011,9 @@ def _render_html(data):
         if (node && typeof node === 'object') {{
           shallow = Object.assign({{}}, node);
           if (shallow.calls) delete shallow.calls;
+          ['inputs', 'inputs_after', 'output'].forEach((key) => {{
+            if (key in shallow) shallow[key] = resolveValues(shallow[key]);
+          }});
         }}
         let searchText = '';
         try {{
@@ -1385,14 +1567,17 @@ function openSearchPanel(entry) {{
       const title = field.getAttribute('data-calls-title') || (t.calls || 'Calls');
       const template = document.getElementById(callsId);
       if (!template) return;
-      const existing = document.querySelector('.panel[data-calls-id="' + callsId + '"]');
+      // shape templates are shared: one panel per reference that opens them
+      const shapeRef = field.getAttribute('data-shape-ref');
+      const panelKey = shapeRef ? callsId + '@' + shapeRef : callsId;
+      const existing = document.querySelector('.panel[data-calls-id="' + escapeSelector(panelKey) + '"]');
       if (existing) {{
         closePanel(existing);
         return;
       }}
       const panel = document.createElement('div');
       panel.className = 'panel floating';
-      panel.setAttribute('data-calls-id', callsId);
+      panel.setAttribute('data-calls-id', panelKey);
       const parentPanel = summary.closest('.panel');
       if (parentPanel) {{
         const parentId = parentPanel.getAttribute('data-calls-id');
@@ -1410,7 +1595,9 @@ function openSearchPanel(entry) {{
         '</div>' +
         '</div>' +
         '<div class="panel-body"></div>';
-      panel.querySelector('.panel-body').appendChild(template.content.cloneNode(true));
+      const content = template.content.cloneNode(true);
+      if (shapeRef) applyShapeRef(content, shapeRef);
+      panel.querySelector('.panel-body').appendChild(content);
       const btnClose = panel.querySelector('.panel-close');
       const btnMin = panel.querySelector('.btn-minimize');
       const btnMax = panel.querySelector('.btn-maximize');
@@ -1519,6 +1706,23 @@ function openSearchPanel(entry) {{
     return template.replace("__TREE__", tree).replace("__DATA__", data_json)
 
 
+def _load_trace(path):
+    data = json.loads(path.read_text(encoding="utf-8"))
+    if isinstance(data, dict) and isinstance(data.get("segments"), list):
+        # rotation manifest: fold the segments that are still on disk into one tree
+        segments = []
+        for segment in data["segments"]:
+            seg_path = path.parent / segment.get("path", "")
+            if seg_path.is_file():
+                roots = json.loads(seg_path.read_text(encoding="utf-8"))
+                for node in roots:
+                    if isinstance(node, dict) and node.get("shapes"):
+                        expand_tree(node)
+                segments.append(roots)
+        return fold_segments(segments)
+    return data
+
+
 def _parse_args():
     parser = argparse.ArgumentParser(description="Tracerado JSON visualizer")
     parser.add_argument(
@@ -1538,7 +1742,7 @@ def _parse_args():
 
 def main():
     args = _parse_args()
-    data = json.loads(Path(args.input).read_text(encoding="utf-8"))
+    data = _load_trace(Path(args.input))
     html_doc = _render_html(data)
     Path(args.output).write_text(html_doc, encoding="utf-8")
 
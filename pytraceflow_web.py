@@ -0,0 +1,367 @@
+"""
+Per-request tracing for web services (WSGI and ASGI middleware).
+
+    app = WSGIMiddleware(app, out_dir="bench-output/requests", sample_rate=0.1, slow_ms=200)
+    app = ASGIMiddleware(app, out_dir="bench-output/requests")
+
+Each sampled request is captured as its own trace: a `__request__` root tagged
+with method, path, route and status, holding the calls made while serving it.
+The profile hook is only set while a sampled request is running on a thread,
+and the calls are attributed through a context variable, so concurrent asyncio
+requests on one loop each get their own tree.
+
+Finished traces are handed to a RequestWriter: request threads only enqueue,
+a small pool of background threads serializes and writes them as
+req_<pid>_<id>.json (viewer-compatible) plus one line per request in
+requests.index.jsonl. When the queue is full the trace is dropped and counted.
+With slow_ms or tail=TailSampler(...), requests matching no rule are discarded
+before they reach the writer; kept traces carry the running tail_sampling counts.
+"""
+
+import contextvars
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+from pytraceflow import PyFlowTraceProfiler, TailSampler
+
+# One background writer per output directory, shared by every middleware writing there
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+class RequestWriter:
+    """Bounded queue of finished request traces drained by `workers` threads."""
+
+    def __init__(self, out_dir, workers=1, queue_size=1000):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.out_dir / "requests.index.jsonl"
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max(int(queue_size), 1))
+        self._index_lock = threading.Lock()
+        self._threads = []
+        for _ in range(max(int(workers), 1)):
+            thread = threading.Thread(target=self._worker, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, root, prepare=None):
+        """Queue a finished trace; `prepare(root)` runs on the writer thread first."""
+        try:
+            self._queue.put_nowait((root, prepare))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _worker(self):
+        sys.setprofile(None)
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            root, prepare = item
+            try:
+                if prepare is not None:
+                    prepare(root)
+                self._write(root)
+            except Exception as exc:
+                sys.stderr.write(f"[FlowTrace] request trace write failed: {exc}\n")
+
+    def _write(self, root):
+        path = self.out_dir / f"req_{root['pid']}_{root['id']}.json"
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(json.dumps([root], ensure_ascii=True, separators=(",", ":")))
+        line = dict(root["request"], id=root["id"], pid=root["pid"], file=path.name)
+        with self._index_lock:
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(line, ensure_ascii=True) + "\n")
+            self.written += 1
+
+    def close(self, timeout=5.0):
+        """Write what is queued and stop the threads (safe to call twice)."""
+        threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout=timeout)
+
+
+def shared_writer(out_dir, workers=1, queue_size=1000):
+    key = os.path.abspath(out_dir)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = _writers[key] = RequestWriter(out_dir, workers, queue_size)
+            if len(_writers) == 1:
+                import atexit
+
+                atexit.register(close_writers)
+    return writer
+
+
+def close_writers():
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+
+class _Request:
+    __slots__ = ("root", "started", "token", "status")
+
+    def __init__(self, root, started, token):
+        self.root = root
+        self.started = started
+        self.token = token
+        self.status = None
+
+
+class _RequestTracer:
+    """Shared part of the WSGI/ASGI middleware: sampling, hook and hand-off."""
+
+    kind = "request"
+
+    def __init__(
+        self,
+        app,
+        out_dir="bench-output/requests",
+        sample_rate=1.0,
+        slow_ms=0.0,
+        keep_errors=True,
+        route=None,
+        capture_inputs=True,
+        capture_outputs=True,
+        capture_memory=False,
+        writer=None,
+        workers=1,
+        queue_size=1000,
+        tail=None,
+    ):
+        self.app = app
+        self.sample_rate = float(sample_rate)
+        # slow_ms/keep_errors are the short form of a TailSampler; pass tail= for more rules
+        if tail is None and slow_ms:
+            tail = TailSampler(slow_ms=slow_ms, errors=keep_errors)
+        self.tail = tail if tail is not None and tail.enabled else None
+        self._route = route
+        self.writer = writer or shared_writer(out_dir, workers, queue_size)
+        self.requests = 0
+        self.sampled = 0
+        self.kept = 0
+        # hook engine only: never flushes, every node lands under a request root
+        self._profiler = PyFlowTraceProfiler(
+            sys.argv[0] if sys.argv else "",
+            os.devnull,
+            flush_interval=0,
+            capture_inputs=capture_inputs,
+            capture_outputs=capture_outputs,
+            capture_memory=capture_memory,
+            allow_any=True,
+        )
+        # the middleware's own frames (response wrappers, send) are not app calls
+        self._profiler._file_verdicts[__file__] = False
+        self._profiler._file_verdicts[os.path.realpath(__file__)] = False
+        self._stack = contextvars.ContextVar(f"pytraceflow_request_{id(self)}", default=None)
+        self._tls = threading.local()
+        profile = self._profiler._profile
+        current = self._stack.get
+
+        def _hook(frame, event, arg):
+            state = current()
+            if state is not None and id(frame) not in state[1]:
+                profile(frame, event, arg, state[0])
+
+        self._hook = _hook
+
+    def _sample(self):
+        self.requests += 1
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        self.sampled += 1
+        return True
+
+    def _begin(self, method, path, query, outside=frozenset()):
+        """Open the request root; `outside` are ids of frames above the middleware."""
+        started = time.time()
+        root = {
+            "id": self._profiler._alloc_id(),
+            "callable": f"{method} {path}",
+            "module": self.kind,
+            "called": "__request__",
+            "inputs": {"method": method, "path": path, "query": query},
+            "output": None,
+            "error": None,
+            "duration_ms": None,
+            "pid": os.getpid(),
+            "calls": [],
+        }
+        token = self._stack.set(([root], outside))
+        # one hook per thread while it serves at least one sampled request
+        tls = self._tls
+        active = getattr(tls, "active", 0)
+        if not active:
+            tls.previous = sys.getprofile()
+            sys.setprofile(self._hook)
+        tls.active = active + 1
+        return _Request(root, started, token)
+
+    def _end(self, req, method, path, route_of, exc=None):
+        tls = self._tls
+        tls.active -= 1
+        if not tls.active:
+            sys.setprofile(tls.previous)
+            tls.previous = None
+        self._stack.reset(req.token)
+        # after the hook is gone, so a user route() callback is not traced
+        route = route_of()
+        duration_ms = round((time.time() - req.started) * 1000, 3)
+        root = req.root
+        root["duration_ms"] = duration_ms
+        root["output"] = req.status
+        failed = exc is not None or (req.status or 0) >= 500
+        if exc is not None:
+            root["error"] = repr(exc)
+            self._profiler._propagate_error(root, root["error"])
+        root["callable"] = f"{method} {route}"
+        root["request"] = {
+            "method": method,
+            "path": path,
+            "route": route,
+            "status": req.status,
+            "duration_ms": duration_ms,
+            "thread": threading.current_thread().name,
+            "started": req.started,
+        }
+        # instance ids are only meaningful while this request's objects are alive
+        for child in root["calls"]:
+            if child.get("callable") == "__instance__":
+                self._profiler._instance_roots.pop(child.get("instance_id"), None)
+        if self.tail is not None:
+            keep, _ = self.tail.decide(root, failed)
+            if not keep:
+                return
+            root["tail_sampling"] = self.tail.report()
+        if self.writer.submit(root, self._profiler._prune_calls):
+            self.kept += 1
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "sampled": self.sampled,
+            "kept": self.kept,
+            "tail_dropped": self.tail.dropped if self.tail is not None else 0,
+            "written": self.writer.written,
+            "dropped": self.writer.dropped,
+        }
+
+
+class _ClosingIterable:
+    """WSGI response wrapper: the request ends when the server closes the body."""
+
+    def __init__(self, result, on_close):
+        self._result = result
+        self._on_close = on_close
+
+    def __iter__(self):
+        return iter(self._result)
+
+    def close(self):
+        try:
+            close = getattr(self._result, "close", None)
+            if close is not None:
+                close()
+        finally:
+            on_close, self._on_close = self._on_close, None
+            if on_close is not None:
+                on_close()
+
+
+class WSGIMiddleware(_RequestTracer):
+    """Trace each sampled WSGI request into its own file.
+
+    `route(environ)` names the request for tags (default: PATH_INFO); it runs
+    once the response is done, so routing info set by the app is available.
+    """
+
+    kind = "wsgi"
+
+    def __call__(self, environ, start_response):
+        if not self._sample():
+            return self.app(environ, start_response)
+        method = environ.get("REQUEST_METHOD", "GET")
+        path = environ.get("PATH_INFO") or "/"
+        req = self._begin(method, path, environ.get("QUERY_STRING", ""))
+
+        def _start_response(status, headers, exc_info=None):
+            try:
+                req.status = int(str(status).split(" ", 1)[0])
+            except ValueError:
+                pass
+            if exc_info is None:
+                return start_response(status, headers)
+            return start_response(status, headers, exc_info)
+
+        def _finish(exc=None):
+            self._end(req, method, path, lambda: self._route(environ) if self._route else path, exc)
+
+        try:
+            result = self.app(environ, _start_response)
+        except BaseException as exc:
+            _finish(exc)
+            raise
+        return _ClosingIterable(result, _finish)
+
+
+class ASGIMiddleware(_RequestTracer):
+    """Trace each sampled ASGI HTTP request into its own file.
+
+    `route(scope)` names the request (default: the matched route's path when the
+    framework sets scope["route"], else the request path). Other scope types
+    (lifespan, websocket) pass through untraced.
+    """
+
+    kind = "asgi"
+
+    async def __call__(self, scope, receive, send):
+        if scope.get("type") != "http" or not self._sample():
+            return await self.app(scope, receive, send)
+        method = scope.get("method", "GET")
+        path = scope.get("path") or "/"
+        query = scope.get("query_string", b"")
+        if isinstance(query, bytes):
+            query = query.decode("latin-1")
+        # a resumed task re-enters the coroutines that awaited this one; they are not the request
+        outside = set()
+        frame = sys._getframe(1)
+        while frame is not None:
+            outside.add(id(frame))
+            frame = frame.f_back
+        req = self._begin(method, path, query, outside)
+
+        async def _send(message):
+            if message.get("type") == "http.response.start":
+                req.status = message.get("status")
+            await send(message)
+
+        exc_raised = None
+        try:
+            await self.app(scope, receive, _send)
+        except BaseException as exc:
+            exc_raised = exc
+            raise
+        finally:
+            self._end(req, method, path, lambda: self._route_of(scope, path), exc_raised)
+
+    def _route_of(self, scope, path):
+        if self._route:
+            return self._route(scope)
+        return getattr(scope.get("route"), "path", None) or path
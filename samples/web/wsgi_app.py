@@ -0,0 +1,133 @@
+"""
+Per-request tracing of a small WSGI app served by wsgiref.
+
+    python samples/web/wsgi_app.py --requests 20 --out-dir bench-output/requests
+    python samples/web/wsgi_app.py --serve --port 8000   # keep serving; Ctrl+C to stop
+
+Each request becomes bench-output/requests/req_<pid>_<id>.json (open it with
+pytraceflow_visual.py) and a line in requests.index.jsonl.
+"""
+
+import argparse
+import json
+import sys
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+# ensure project root on sys.path when running directly
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from pytraceflow_web import WSGIMiddleware, close_writers  # noqa: E402
+
+ITEMS = {str(i): {"id": i, "name": f"item-{i}", "price": 10 + i} for i in range(1, 6)}
+
+
+def load_item(item_id):
+    return ITEMS.get(item_id)
+
+
+def price_with_tax(item, rate=0.21):
+    return round(item["price"] * (1 + rate), 2)
+
+
+def render(payload, status="200 OK"):
+    return status, json.dumps(payload).encode("utf-8")
+
+
+def list_items(limit=10):
+    return render([{"id": item["id"], "total": price_with_tax(item)} for item in ITEMS.values()][:limit])
+
+
+def show_item(item_id):
+    item = load_item(item_id)
+    if item is None:
+        return render({"error": "not found"}, "404 Not Found")
+    return render(dict(item, total=price_with_tax(item)))
+
+
+def fail(reason="boom"):
+    raise RuntimeError(reason)
+
+
+def route_of(environ):
+    """Route template used as the trace tag (keeps item ids out of it)."""
+    parts = environ.get("PATH_INFO", "/").strip("/").split("/")
+    if parts[0] == "items" and len(parts) == 2:
+        return "/items/{id}"
+    return "/" + "/".join(parts)
+
+
+def app(environ, start_response):
+    parts = environ.get("PATH_INFO", "/").strip("/").split("/")
+    if parts == ["items"]:
+        status, body = list_items()
+    elif parts[0] == "items" and len(parts) == 2:
+        status, body = show_item(parts[1])
+    elif parts == ["fail"]:
+        status, body = fail()
+    else:
+        status, body = render({"error": "no route"}, "404 Not Found")
+    start_response(status, [("Content-Type", "application/json")])
+    return [body]
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def _error_app(traced):
+    """Turn exceptions into 500 responses so the client sees a status."""
+    def wrapper(environ, start_response):
+        try:
+            return traced(environ, start_response)
+        except Exception:
+            start_response("500 Internal Server Error", [("Content-Type", "text/plain")])
+            return [b"error"]
+
+    return wrapper
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="wsgiref demo of pytraceflow_web.WSGIMiddleware")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--requests", type=int, default=20, help="Requests sent by the built-in client")
+    parser.add_argument("--out-dir", default="bench-output/requests")
+    parser.add_argument("--sample-rate", type=float, default=1.0)
+    parser.add_argument("--slow-ms", type=float, default=0.0)
+    parser.add_argument("--serve", action="store_true", help="Serve until interrupted instead of self-testing")
+    args = parser.parse_args(argv)
+
+    traced = WSGIMiddleware(
+        app, out_dir=args.out_dir, sample_rate=args.sample_rate, slow_ms=args.slow_ms, route=route_of
+    )
+    server = make_server("127.0.0.1", args.port, _error_app(traced), handler_class=_QuietHandler)
+    port = server.server_address[1]
+    if args.serve:
+        print(f"serving on http://127.0.0.1:{port}/items")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    else:
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        paths = ["/items", "/items/2", "/items/9", "/fail"]
+        for i in range(args.requests):
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}{paths[i % len(paths)]}").read()
+            except urllib.error.HTTPError:
+                pass
+        server.shutdown()
+    server.server_close()
+    close_writers()
+    print(f"stats: {traced.stats()} -> {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,18 +13,82 @@ Usage:
   set PYTRACEFLOW_SKIP_OUTPUTS=1
   set PYTRACEFLOW_VERBOSE=1
   set PYTRACEFLOW_WITH_MEMORY=0
+  set PYTRACEFLOW_MAX_NODES=200000
+  set PYTRACEFLOW_MAX_BYTES=50000000
+  set PYTRACEFLOW_ROTATE_MB=64
+  set PYTRACEFLOW_ROTATE_SECONDS=600
+  set PYTRACEFLOW_ROTATE_ROOTS=10000
+  set PYTRACEFLOW_RETAIN_SEGMENTS=24
+  set PYTRACEFLOW_PROPAGATE_TASKS=1
+  set PYTRACEFLOW_TRACE_THREADS=1
+  set PYTRACEFLOW_TRACE_SUBPROCESSES=0
+  set PYTRACEFLOW_STREAM=unix:///tmp/pft.sock
+  set PYTRACEFLOW_STREAM_QUEUE=100000
+  set PYTRACEFLOW_MEASURE_OVERHEAD=1
+  set PYTRACEFLOW_OVERHEAD_SAMPLE=64
+  set PYTRACEFLOW_MAX_OVERHEAD_PCT=5
+  set PYTRACEFLOW_OVERHEAD_WINDOW=1
+  set PYTRACEFLOW_PREFIX_CACHE=bench-output/autotrace/.pytraceflow-cache
+  set PYTRACEFLOW_TAIL_SLOW_MS=100
+  set PYTRACEFLOW_TAIL_PERCENTILE=95
+  set PYTRACEFLOW_TAIL_ERRORS=1
+  set PYTRACEFLOW_TAIL_MATCH=app.db:*,*:checkout
+  set PYTRACEFLOW_TAIL_WINDOW=256
+  set PYTRACEFLOW_DUMP_SIGNAL=SIGUSR2
+  set PYTRACEFLOW_DEADLINE_MS=5000
+  set PYTRACEFLOW_DEADLINES=app.db:*=500,*:checkout=2000
+  set PYTRACEFLOW_TRIGGERS=checkout:process_order,app.jobs:*
+  set PYTRACEFLOW_POLICY=C:\path\to\capture-policy.json
+  set PYTRACEFLOW_DEDUP_SHAPES=3
+  set PYTRACEFLOW_FOLD_RUNS=1
+  set PYTRACEFLOW_RUN_DURATIONS=1
+  set PYTRACEFLOW_INTERN_VALUES=64
+  # or stay dormant until a signal (no PYTRACEFLOW_AUTOTRACE needed):
+  set PYTRACEFLOW_DORMANT=1
+  set PYTRACEFLOW_DORMANT_SIGNAL=SIGUSR1
+  set PYTRACEFLOW_DORMANT_SECONDS=30
 
 Notes:
  - Each process writes its own JSON: pft_<pid>.json under OUT_DIR.
+ - With any PYTRACEFLOW_ROTATE_* knob set, output goes to pft_<pid>.segNNNN.json
+   segments listed in pft_<pid>.manifest.json instead.
  - The main process is also traced unless PYTRACEFLOW_SKIP_MAIN=1.
  - To avoid tracing pytraceflow.py itself, it is skipped automatically.
+ - Python children started via subprocess, os.exec* or multiprocessing get the
+   autotrace config (and this repo on PYTHONPATH) plus the parent pid/call id, so
+   merge attaches them under the spawning call (PYTRACEFLOW_TRACE_SUBPROCESSES=0
+   disables). An os.exec*() image writes pft_<pid>_exec<N>.json.
+ - With PYTRACEFLOW_STREAM set, events go to a running `pytraceflow collect`
+   instead of per-process JSON files.
+ - Pool/ProcessPoolExecutor tasks run as their own roots linked to the submitting
+   call in the parent with PYTRACEFLOW_PROPAGATE_TASKS=1 (off by default: it
+   patches the pools and flushes task workers on SIGTERM when they have no handler).
+ - With any PYTRACEFLOW_TAIL_* rule set, finished top-level calls/tasks that match
+   no rule are dropped; the root's tail_sampling counts kept/dropped units.
+ - With PYTRACEFLOW_DORMANT=1 nothing is traced until the process gets the signal
+   (`kill -USR1 <pid>`); each capture window lasts DORMANT_SECONDS (0 = until the
+   next signal) and writes pft_<pid>_<timestamp>.json under OUT_DIR.
+ - With PYTRACEFLOW_DUMP_SIGNAL set, that signal writes pft_<pid>.inflight.json:
+   the calls each thread has open right now and how long they have been running.
+ - With PYTRACEFLOW_DEADLINE_MS / PYTRACEFLOW_DEADLINES a watchdog thread reports
+   calls still running past their deadline to stderr (and the stream) and marks
+   them with a "deadline" field.
+ - With PYTRACEFLOW_TRIGGERS only calls beneath those module:qualname functions
+   are recorded; each invocation is its own top-level call.
+ - PYTRACEFLOW_POLICY points at the same JSON/TOML capture policy as --policy
+   (per-function inputs/outputs/memory switches).
+ - PYTRACEFLOW_DEDUP_SHAPES=N folds repeated subtrees of N+ nodes into shared
+   shapes at the final write (see `pytraceflow dedup`).
+ - PYTRACEFLOW_FOLD_RUNS=1 folds consecutive identical sibling calls into one run
+   node with count/duration stats (PYTRACEFLOW_RUN_DURATIONS=1 keeps each duration).
+ - PYTRACEFLOW_INTERN_VALUES=N stores payloads of N+ JSON bytes once in
+   root["values"]; nodes hold {"$v": key} (see `pytraceflow values`).
 """
 
 from __future__ import annotations
 
 import atexit
 import os
-from pathlib import Path
 import sys
 
 
@@ -36,17 +100,30 @@ def _env_flag(name: str, default: bool) -> bool:
 
 
 def _maybe_start():
-    if os.environ.get("PYTRACEFLOW_AUTOTRACE") != "1":
+    dormant = _env_flag("PYTRACEFLOW_DORMANT", False)
+    if os.environ.get("PYTRACEFLOW_AUTOTRACE") != "1" and not dormant:
         return
+    # imported only when tracing: this file runs in every process that has the repo on PYTHONPATH
+    from pathlib import Path
+
     # Avoid tracing pytraceflow.py itself
     argv0 = Path(sys.argv[0]).name if sys.argv else ""
     if argv0 == "pytraceflow.py":
         return
+    # multiprocessing helpers (resource tracker, forkserver) are not user code
+    orig_argv = " ".join(getattr(sys, "orig_argv", []))
+    if "multiprocessing.resource_tracker" in orig_argv or "multiprocessing.forkserver" in orig_argv:
+        return
 
     repo_root = Path(__file__).resolve().parent
     out_dir = Path(os.environ.get("PYTRACEFLOW_OUT_DIR", repo_root / "bench-output" / "autotrace"))
     out_dir.mkdir(parents=True, exist_ok=True)
-    output_path = out_dir / f"pft_{os.getpid()}.json"
+    exec_depth = os.environ.get("PYTRACEFLOW_EXEC_DEPTH")
+    if exec_depth:
+        # os.exec*() keeps the pid; do not overwrite the previous image's trace
+        output_path = out_dir / f"pft_{os.getpid()}_exec{exec_depth}.json"
+    else:
+        output_path = out_dir / f"pft_{os.getpid()}.json"
 
     flush_interval = float(os.environ.get("PYTRACEFLOW_FLUSH_INTERVAL", "5"))
     flush_call_threshold = int(os.environ.get("PYTRACEFLOW_FLUSH_CALL_THRESHOLD", "500"))
@@ -56,16 +133,50 @@ def _maybe_start():
     with_memory = _env_flag("PYTRACEFLOW_WITH_MEMORY", False)
     no_tracemalloc = _env_flag("PYTRACEFLOW_NO_TRACEMALLOC", False)
     allow_any = _env_flag("PYTRACEFLOW_ALLOW_ANY", False)
+    max_nodes = int(os.environ.get("PYTRACEFLOW_MAX_NODES", "0"))
+    max_bytes = int(os.environ.get("PYTRACEFLOW_MAX_BYTES", "0"))
+    rotate_mb = float(os.environ.get("PYTRACEFLOW_ROTATE_MB", "0"))
+    rotate_seconds = float(os.environ.get("PYTRACEFLOW_ROTATE_SECONDS", "0"))
+    rotate_roots = int(os.environ.get("PYTRACEFLOW_ROTATE_ROOTS", "0"))
+    retain_segments = int(os.environ.get("PYTRACEFLOW_RETAIN_SEGMENTS", "0"))
+    propagate_tasks = _env_flag("PYTRACEFLOW_PROPAGATE_TASKS", False)
+    trace_threads = _env_flag("PYTRACEFLOW_TRACE_THREADS", False)
+    trace_subprocesses = _env_flag("PYTRACEFLOW_TRACE_SUBPROCESSES", True)
+    stream = os.environ.get("PYTRACEFLOW_STREAM") or None
+    stream_queue = int(os.environ.get("PYTRACEFLOW_STREAM_QUEUE", "100000"))
+    measure_overhead = _env_flag("PYTRACEFLOW_MEASURE_OVERHEAD", False)
+    overhead_sample = int(os.environ.get("PYTRACEFLOW_OVERHEAD_SAMPLE", "64"))
+    max_overhead_pct = float(os.environ.get("PYTRACEFLOW_MAX_OVERHEAD_PCT", "0"))
+    overhead_window = float(os.environ.get("PYTRACEFLOW_OVERHEAD_WINDOW", "1"))
+    tail_slow_ms = float(os.environ.get("PYTRACEFLOW_TAIL_SLOW_MS", "0"))
+    tail_percentile = float(os.environ.get("PYTRACEFLOW_TAIL_PERCENTILE", "0"))
+    tail_errors = _env_flag("PYTRACEFLOW_TAIL_ERRORS", False)
+    tail_match = os.environ.get("PYTRACEFLOW_TAIL_MATCH", "")
+    tail_window = int(os.environ.get("PYTRACEFLOW_TAIL_WINDOW", "256"))
+    dump_signal = os.environ.get("PYTRACEFLOW_DUMP_SIGNAL") or None
+    deadline_ms = float(os.environ.get("PYTRACEFLOW_DEADLINE_MS", "0"))
+    deadlines = os.environ.get("PYTRACEFLOW_DEADLINES", "")
+    triggers = os.environ.get("PYTRACEFLOW_TRIGGERS", "")
+    policy = os.environ.get("PYTRACEFLOW_POLICY") or None
+    dedup_shapes = int(os.environ.get("PYTRACEFLOW_DEDUP_SHAPES", "0"))
+    fold_runs = _env_flag("PYTRACEFLOW_FOLD_RUNS", False)
+    run_durations = _env_flag("PYTRACEFLOW_RUN_DURATIONS", False)
+    intern_values = int(os.environ.get("PYTRACEFLOW_INTERN_VALUES", "0"))
+    # resolved stdlib/site-packages prefixes shared by every process of this interpreter
+    prefix_cache = os.environ.get("PYTRACEFLOW_PREFIX_CACHE") or str(out_dir / ".pytraceflow-cache")
 
     try:
-        from pytraceflow import PyFlowTraceProfiler  # type: ignore
+        from pytraceflow import CapturePolicy, PyFlowTraceProfiler, TailSampler, install_dormant  # type: ignore
     except Exception:
         return
+    if policy:
+        try:
+            policy = CapturePolicy.load(policy)
+        except (OSError, ValueError) as exc:
+            sys.stderr.write(f"[FlowTrace] PYTRACEFLOW_POLICY ignored: {exc}\n")
+            policy = None
 
-    profiler = PyFlowTraceProfiler(
-        script_path=sys.argv[0] or "__process__",
-        output_path=str(output_path),
-        script_args=[],
+    options = dict(
         flush_interval=flush_interval,
         flush_call_threshold=flush_call_threshold,
         flush_every_call=False,
@@ -73,10 +184,48 @@ def _maybe_start():
         capture_memory=with_memory and not _env_flag("PYTRACEFLOW_NO_MEMORY", False),
         capture_inputs=not skip_inputs,
         capture_outputs=not skip_outputs,
-        enable_tracemalloc=with_memory and not no_tracemalloc,
+        enable_tracemalloc=not no_tracemalloc,
         verbose=verbose,
         allow_any=allow_any,
+        max_nodes=max_nodes,
+        max_bytes=max_bytes,
+        rotate_bytes=int(rotate_mb * 1024 * 1024),
+        rotate_seconds=rotate_seconds,
+        rotate_roots=rotate_roots,
+        retain_segments=retain_segments,
+        propagate_tasks=propagate_tasks,
+        trace_threads=trace_threads,
+        trace_subprocesses=trace_subprocesses,
+        stream=stream,
+        stream_queue=stream_queue,
+        measure_overhead=measure_overhead,
+        overhead_sample=overhead_sample,
+        max_overhead_pct=max_overhead_pct,
+        overhead_window=overhead_window,
+        prefix_cache=prefix_cache,
+        tail=TailSampler(tail_slow_ms, tail_percentile, tail_errors, tail_match, tail_window),
+        dump_signal=dump_signal,
+        deadline_ms=deadline_ms,
+        deadlines=deadlines,
+        triggers=triggers,
+        policy=policy,
+        dedup_shapes=dedup_shapes,
+        fold_runs=fold_runs,
+        run_durations=run_durations,
+        intern_values=intern_values,
     )
+    if dormant:
+        try:
+            install_dormant(
+                out_dir,
+                os.environ.get("PYTRACEFLOW_DORMANT_SIGNAL") or None,
+                float(os.environ.get("PYTRACEFLOW_DORMANT_SECONDS", "30")),
+                **options,
+            )
+        except (ValueError, RuntimeError) as exc:
+            sys.stderr.write(f"[FlowTrace] dormant tracing disabled: {exc}\n")
+        return
+    profiler = PyFlowTraceProfiler(sys.argv[0] or "__process__", str(output_path), [], **options)
     profiler.start_live()
     atexit.register(profiler.stop_live)
 
@@ -0,0 +1,77 @@
+"""Rotated segments written with --intern-values must each resolve on their own."""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from pytraceflow_merge import load_process_trace  # noqa: E402
+from pytraceflow_values import REF  # noqa: E402
+
+APP = """
+import time
+
+CONFIG = {"name": "worker", "limits": list(range(64)), "tags": ["a" * 40, "b" * 40]}
+
+
+class Worker:
+    def __init__(self, config):
+        self.config = config
+
+    def step(self, i):
+        return i
+
+    def run(self):
+        # only the __instance__ node (from __init__) refers to CONFIG
+        for i in range(30):
+            self.step(i)
+            time.sleep(0.01)
+
+
+Worker(CONFIG).run()
+"""
+
+
+def _refs(value):
+    if isinstance(value, dict):
+        if len(value) == 1 and REF in value:
+            yield value[REF]
+            return
+        for val in value.values():
+            yield from _refs(val)
+    elif isinstance(value, list):
+        for val in value:
+            yield from _refs(val)
+
+
+def test_every_segment_resolves_its_own_refs(tmp_path):
+    script = tmp_path / "app.py"
+    script.write_text(APP, encoding="utf-8")
+    output = tmp_path / "pft.json"
+    subprocess.run(
+        [
+            sys.executable, str(ROOT / "pytraceflow.py"), "-s", str(script), "-o", str(output),
+            "--rotate-seconds", "0.05", "--flush-interval", "0.02", "--intern-values", "32",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    segments = sorted(tmp_path.glob("pft.seg*.json"))
+    assert len(segments) > 1
+    for segment in segments:
+        roots = json.loads(segment.read_text(encoding="utf-8"))
+        values = roots[0].get("values", {})
+        nodes = [node for root in roots for node in root.get("calls", [])]
+        refs = set()
+        while nodes:
+            node = nodes.pop()
+            nodes.extend(node.get("calls", []))
+            for field in ("inputs", "inputs_after", "output"):
+                refs.update(_refs(node.get(field)))
+        assert refs <= values.keys(), f"{segment.name}: dangling {sorted(refs - values.keys())}"
+
+    merged = load_process_trace(str(tmp_path / "pft.manifest.json"))[0]
+    assert not list(_refs(merged))